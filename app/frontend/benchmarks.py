@@ -0,0 +1,76 @@
+import json
+import time
+from collections.abc import Callable
+from typing import Any
+
+from js import JSON, console, indexedDB
+
+from frontend.models import PokemonRecord, PokemonType
+from frontend.services import Database
+
+# Name of the database that the benchmark fills, so that the user's own collection is left alone
+BENCHMARK_DB_NAME = "calm_calatheas_benchmark"
+
+
+async def benchmark_records(count: int = 500, repeat: int = 5) -> dict[str, Any]:
+    """
+    Measure the cost per record of loading a collection of the given size, and of converting records.
+
+    The collection is loaded from a database of its own, which is deleted afterwards. Converting records between
+    JavaScript objects and Python is measured both directly and with the JSON round-trip it replaced. All times are
+    the best of the given number of runs, in microseconds per record.
+    """
+    records = [
+        PokemonRecord(
+            ability="Static",
+            category="Mouse",
+            flavor_text="When several of these Pokemon gather, their electricity can cause lightning storms.",
+            habitat="Forest",
+            height=0.4,
+            name=f"Pikachu {index}",
+            types={PokemonType.ELECTRIC},
+            weight=6.0,
+        )
+        for index in range(count)
+    ]
+
+    database = Database(BENCHMARK_DB_NAME)
+
+    try:
+        for record in records:
+            await database.put(record)
+
+        load = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await database.find_all()
+            load.append(time.perf_counter() - start)
+    finally:
+        database.destroy()
+        indexedDB.deleteDatabase(BENCHMARK_DB_NAME)
+
+    items = [record.to_js() for record in records]
+
+    def best(convert: Callable[[], object]) -> float:
+        times = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            convert()
+            times.append(time.perf_counter() - start)
+
+        return min(times) / count * 1e6
+
+    result = {
+        "count": count,
+        "find_all_us": min(load) / count * 1e6,
+        "from_js_us": best(lambda: [PokemonRecord.from_js(item) for item in items]),
+        "from_json_us": best(lambda: [PokemonRecord.model_validate_json(JSON.stringify(item)) for item in items]),
+        "to_js_us": best(lambda: [record.to_js() for record in records]),
+        "to_json_us": best(lambda: [JSON.parse(record.model_dump_json()) for record in records]),
+    }
+
+    console.log(json.dumps(result))
+
+    return result
@@ -1,8 +1,8 @@
 from typing import TYPE_CHECKING, Optional, cast, override
 
 import reactivex.operators as op
-from js import Blob, Event, MediaStream, document
-from pyodide.ffi import JsDomElement, create_once_callable
+from js import Event, MediaStream, document
+from pyodide.ffi import JsDomElement
 from pyodide.ffi.wrappers import add_event_listener
 
 from frontend.base import Component
@@ -92,11 +92,8 @@ class Camera(Component):
             self._camera_stream.videoHeight,
         )
 
-        canvas.toBlob(create_once_callable(self._handle_capture_success), "image/png")
-
-    def _handle_capture_success(self, blob: Blob) -> None:
-        """Send the captured image to the reader."""
-        reader.read(blob)
+        # The reader downscales the snapshot itself, so it is passed on without encoding it first
+        reader.read(canvas)
         self.destroy()
 
     def _handle_close(self, _: Event) -> None:
@@ -1,11 +1,20 @@
-from typing import override
+from asyncio import create_task
+from typing import TYPE_CHECKING, Optional, cast, override
 
-from js import document
-from pyodide.ffi import JsDomElement
+import reactivex.operators as op
+from js import URL, Blob, document
+from reactivex import from_future
 
 from frontend.base import Component
 from frontend.components.description_dropdown import DescriptionDropdown
 from frontend.models import PokemonRecord
+from frontend.services import database
+from frontend.services import description as description_service
+
+if TYPE_CHECKING:
+    from js import JsDomElement, JsImgElement
+
+PROGRESS_LENGTH = 120
 
 LOADING_TEMPLATE = """
 <div class="pokemon-description box is-flex is-flex-direction-column" style="height: 100%">
@@ -31,6 +40,7 @@ LOADING_TEMPLATE = """
         </div>
     </article>
     <div class="is-flex-grow-1 skeleton-block"></div>
+    <p id="progress-{guid}" class="help has-text-grey mb-3" style="overflow-wrap: anywhere"></p>
     <div class="field is-grouped is-grouped-multiline has-text-7">
         <div class="control">
             <div class="tags has-addons">
@@ -65,7 +75,7 @@ TEMPLATE = """
     <article class="media">
         <figure class="media-left">
             <p class="image is-128x128" style="overflow: hidden">
-                <img src="{image_url}" alt="{name}" />
+                <img id="image-{guid}" alt="{name}" />
             </p>
         </figure>
         <div class="media-content">
@@ -129,14 +139,15 @@ TEMPLATE = """
 class Description(Component):
     """Test component to demonstrate the descriptions service."""
 
-    def __init__(self, root: JsDomElement, description: PokemonRecord | None) -> None:
+    def __init__(self, root: "JsDomElement", description: PokemonRecord | None) -> None:
         super().__init__(root)
         self._description = description
+        self._image_url: str | None = None
 
     @override
     def build(self) -> str:
         if not self._description:
-            return LOADING_TEMPLATE
+            return LOADING_TEMPLATE.format(guid=self.guid)
 
         types = "\n".join(
             TYPE_TEMPLATE.format(type_class=type_, type_name=type_.capitalize()) for type_ in self._description.types
@@ -145,7 +156,6 @@ class Description(Component):
         return TEMPLATE.format(
             guid=self.guid,
             favourite_icon_class="" if self._description.favourite else "is-hidden",
-            image_url=self._description.img_url,
             name=self._description.name,
             category=self._description.category.capitalize(),
             types=types,
@@ -156,9 +166,22 @@ class Description(Component):
             weight=self._description.weight,
         )
 
+    @override
+    def on_destroy(self) -> None:
+        if self._image_url:
+            URL.revokeObjectURL(self._image_url)
+
     @override
     def on_render(self) -> None:
         if not self._description:
+            # The placeholder may be rendered before its cell is added to the document, so look in the cell instead
+            self._progress = cast("JsDomElement", self.root).querySelector(f'[id="progress-{self.guid}"]')
+
+            # Show the tail end of the generated text while the description is being generated
+            description_service.progress.pipe(
+                op.take_until(self.destroyed),
+            ).subscribe(self._update_progress)
+
             return
 
         self._description_dropdown = DescriptionDropdown(
@@ -168,6 +191,25 @@ class Description(Component):
 
         self._description_dropdown.render()
 
+        self._image = cast("JsImgElement", document.getElementById(f"image-{self.guid}"))
+
+        # Show the image once it is loaded from the database, unless the component is destroyed before then
+        from_future(create_task(database.find_image(self._description.name))).pipe(
+            op.take_until(self.destroyed),
+        ).subscribe(self._show_image)
+
     @override
     def pre_destroy(self) -> None:
         self._description_dropdown.destroy()
+
+    def _show_image(self, image: Optional[Blob]) -> None:
+        """Show the given image, through an object URL that is revoked when the component is destroyed."""
+        if not image:
+            return
+
+        self._image_url = URL.createObjectURL(image)
+        self._image.src = self._image_url
+
+    def _update_progress(self, text: str) -> None:
+        """Show the most recently generated text."""
+        self._progress.innerText = " ".join(text[-2 * PROGRESS_LENGTH :].split())[-PROGRESS_LENGTH:]
@@ -54,7 +54,7 @@ class DescriptionDropdown(Component):
         add_event_listener(self._favourite_button, "click", self._on_favourite_button_click)
 
     def _on_delete_button_click(self, _: Event) -> None:
-        pokemon.delete(self._description.name)
+        pokemon.delete(self._description)
 
     def _on_favourite_button_click(self, _: Event) -> None:
         self._description.favourite = not self._description.favourite
@@ -1,8 +1,9 @@
-from typing import override
+from typing import TYPE_CHECKING, cast, override
 
 import reactivex.operators as op
-from js import document
-from pyodide.ffi import JsDomElement
+from js import Event, document, window
+from pyodide.ffi import JsProxy, create_proxy
+from pyodide.ffi.wrappers import add_event_listener
 from reactivex import combine_latest
 
 from frontend.base import Component
@@ -10,76 +11,172 @@ from frontend.components import Description
 from frontend.models import PokemonRecord
 from frontend.services import pokemon
 
+if TYPE_CHECKING:
+    from js import IntersectionObserverEntry, JsDomElement
+    from pyodide.ffi import JsArray
+
 EMPTY_PLACEHOLDER_TEMPLATE = """
 <p id="pokemon-empty-placeholder">Nothing to show here yet!</p>
 """
 
 TEMPLATE = """
-<div id="pokemon-grid" class="grid is-col-min-20">
-    <p>Nothing to show here yet!</p>
+<div>
+    <div id="pokemon-grid" class="grid is-col-min-20">
+        <p id="pokemon-empty-placeholder">Nothing to show here yet!</p>
+    </div>
+    <button id="pokemon-more" class="button is-fullwidth is-hidden">Load more</button>
 </div>
 """
 
+# Distance from the bottom of the screen at which the next page of Pokemon starts loading
+LOAD_MORE_MARGIN = "400px"
+
 
 class Pokemon(Component):
     """The list of Pokemon."""
 
-    def __init__(self, root: JsDomElement) -> None:
+    def __init__(self, root: "JsDomElement") -> None:
         super().__init__(root)
-        self._current_pokemon = []
+        self._cards: dict[str, tuple[PokemonRecord, Description]] = {}
+        self._generating_placeholder: Description | None = None
+        self._has_more = False
 
     @override
     def build(self) -> str:
         return TEMPLATE
 
+    @override
+    def on_destroy(self) -> None:
+        self._load_more_observer.disconnect()
+        self._load_more_callback.destroy()
+
     @override
     def on_render(self) -> None:
         self._pokemon_grid = document.getElementById("pokemon-grid")
+        self._pokemon_more = document.getElementById("pokemon-more")
+
+        add_event_listener(self._pokemon_more, "click", self._on_pokemon_more_click)
+
+        # Load the next page of Pokemon when the bottom of the list scrolls into view
+        self._load_more_callback = create_proxy(self._handle_load_more_intersection)
+        self._load_more_observer = window.IntersectionObserver.new(
+            self._load_more_callback,
+            {"rootMargin": LOAD_MORE_MARGIN},
+        )
 
         # Update the UI whenever the list of pokemon or the loading state changes
         combine_latest(pokemon.pokemon, pokemon.is_generating).pipe(
             op.take_until(self.destroyed),
         ).subscribe(lambda params: self._render_pokemon(params[0], is_generating=params[1]))
 
-    def _render_pokemon(self, pokemon: list[PokemonRecord], *, is_generating: bool) -> None:
-        """Render the given list of Pokemon."""
-        for component in self._current_pokemon:
-            component.destroy()
+        # Only offer to load more Pokemon if there are any
+        pokemon.has_more.pipe(
+            op.take_until(self.destroyed),
+        ).subscribe(lambda has_more: self._handle_has_more(has_more=has_more))
+
+    def _handle_has_more(self, *, has_more: bool) -> None:
+        """Show or hide the button that loads more Pokemon, and watch for it to scroll into view."""
+        self._has_more = has_more
+
+        if has_more:
+            self._pokemon_more.classList.remove("is-hidden")
+            self._load_more_observer.observe(self._pokemon_more)
+        else:
+            self._pokemon_more.classList.add("is-hidden")
+            self._load_more_observer.unobserve(self._pokemon_more)
+
+    def _handle_load_more_intersection(self, entries: "JsArray[IntersectionObserverEntry]", _: JsProxy) -> None:
+        """Load more Pokemon when the button that loads them is close to being on screen."""
+        if any(entry.isIntersecting for entry in entries):
+            pokemon.load_more()
+
+    def _on_pokemon_more_click(self, _: Event) -> None:
+        """Load more Pokemon."""
+        pokemon.load_more()
+
+    def _create_cell(self, description: PokemonRecord | None) -> Description:
+        """Create a cell in the Pokemon grid with a card for the given Pokemon, or a placeholder if none is given."""
+        cell = document.createElement("div")
+        cell.classList.add("cell")
 
-        while cell := self._pokemon_grid.firstChild:
-            self._pokemon_grid.removeChild(cell)
+        # The card looks up its elements in the document while rendering, so the cell has to be attached first. The
+        # cell is moved to its place in the grid afterwards.
+        self._pokemon_grid.appendChild(cell)
 
-        self._current_pokemon = []
+        card = Description(cell, description)
+        card.render()
 
-        if not (pokemon or is_generating):
-            self._pokemon_grid.innerHTML = EMPTY_PLACEHOLDER_TEMPLATE  # type: ignore[innerHTML is available]
-            return
+        return card
+
+    def _destroy_cell(self, card: Description) -> None:
+        """Destroy the given card, and remove its cell from the Pokemon grid."""
+        card.destroy()
+        card.root.remove()  # type: ignore[remove is available]
+
+    def _render_pokemon(self, pokemon: list[PokemonRecord], *, is_generating: bool) -> None:
+        """
+        Render the given list of Pokemon.
+
+        The cards of Pokemon that have not changed since they were rendered are kept as they are, so that a change to a
+        single Pokemon only renders the card of that Pokemon.
+        """
+        if placeholder := document.getElementById("pokemon-empty-placeholder"):
+            placeholder.remove()  # type: ignore[remove is available]
+
+        cards: dict[str, tuple[PokemonRecord, Description]] = {}
 
         for item in pokemon:
-            cell = document.createElement("div")
-            cell.classList.add("cell")
+            rendered, card = self._cards.pop(item.name, (None, None))
 
-            description = Description(cell, item)
+            if card and rendered != item:
+                self._destroy_cell(card)
+                card = None
 
-            self._pokemon_grid.appendChild(cell)
-            self._current_pokemon.append(description)
+            # Keep a copy of the Pokemon as it was rendered, since the Pokemon itself may be changed in place
+            cards[item.name] = (item.model_copy(deep=True), card or self._create_cell(item))
 
-            description.render()
+        for _, card in self._cards.values():
+            self._destroy_cell(card)
 
-        if is_generating:
-            self._render_generating_placeholder()
+        self._cards = cards
 
-    def _render_generating_placeholder(self) -> None:
-        """Render a placeholder in the Pokemon grid while generating."""
-        if placeholder := document.getElementById("pokemon-empty-placeholder"):
-            placeholder.remove()  # type: ignore[remove is available]
+        self._render_generating_placeholder(is_generating=is_generating)
 
-        cell = document.createElement("div")
-        cell.classList.add("cell")
+        # Put the cells in order, only moving the cells that are out of place
+        previous = _cell(self._generating_placeholder) if self._generating_placeholder else None
+
+        for _, card in cards.values():
+            cell = _cell(card)
+            expected = previous.nextSibling if previous else self._pokemon_grid.firstChild
+
+            if expected is None:
+                self._pokemon_grid.appendChild(cell)
+            elif cell != expected:
+                self._pokemon_grid.insertBefore(cell, expected)
+
+            previous = cell
+
+        if not (pokemon or is_generating):
+            self._pokemon_grid.innerHTML = EMPTY_PLACEHOLDER_TEMPLATE  # type: ignore[innerHTML is available]
+
+        # The button may still be on screen after a page has loaded, which the observer only reports when observing it
+        # again. In that case the next page is loaded right away, until the screen is filled.
+        if self._has_more:
+            self._load_more_observer.unobserve(self._pokemon_more)
+            self._load_more_observer.observe(self._pokemon_more)
+
+    def _render_generating_placeholder(self, *, is_generating: bool) -> None:
+        """Render a placeholder at the start of the Pokemon grid while generating, and remove it when done."""
+        if is_generating and not self._generating_placeholder:
+            # Create a description component with no data to show loading state
+            self._generating_placeholder = self._create_cell(None)
+            self._pokemon_grid.prepend(self._generating_placeholder.root)  # type: ignore[prepend is available]
+
+        if not is_generating and self._generating_placeholder:
+            self._destroy_cell(self._generating_placeholder)
+            self._generating_placeholder = None
 
-        # Create a description component with no data to show loading state
-        description = Description(cell, None)
-        description.render()
 
-        self._pokemon_grid.prepend(cell)  # type: ignore[prepend is available]
-        self._current_pokemon.append(description)
+def _cell(card: Description) -> "JsDomElement":
+    """Return the cell of the given card in the Pokemon grid."""
+    return cast("JsDomElement", card.root)
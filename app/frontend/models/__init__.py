@@ -1,3 +1,4 @@
+from .pokemon_change import ChangeType, PokemonChange
 from .pokemon_description import PokemonDescription, PokemonRecord, PokemonType
 
-__all__ = ["PokemonDescription", "PokemonRecord", "PokemonType"]
+__all__ = ["ChangeType", "PokemonChange", "PokemonDescription", "PokemonRecord", "PokemonType"]
@@ -0,0 +1,20 @@
+from enum import StrEnum, auto
+
+from pydantic import BaseModel, Field
+
+from .pokemon_description import PokemonRecord
+
+
+class ChangeType(StrEnum):
+    """An enumeration of the ways a Pokemon in the collection can change."""
+
+    INSERTED = auto()
+    REMOVED = auto()
+    UPDATED = auto()
+
+
+class PokemonChange(BaseModel):
+    """A change to a single Pokemon in the collection."""
+
+    pokemon: PokemonRecord = Field()
+    type: ChangeType = Field()
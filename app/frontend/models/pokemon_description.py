@@ -1,7 +1,10 @@
 from datetime import UTC, datetime
 from enum import StrEnum, auto
+from typing import Self
 
+from js import Object
 from pydantic import BaseModel, Field
+from pyodide.ffi import JsProxy, to_js
 
 
 class PokemonType(StrEnum):
@@ -41,8 +44,29 @@ class PokemonDescription(BaseModel):
 
 
 class PokemonRecord(PokemonDescription):
-    """A description of a Pokemon with an image and timestamp, as stored in the database."""
+    """
+    A description of a Pokemon with a timestamp, as stored in the database.
+
+    The image of the Pokemon is stored separately, under the name of the record.
+    """
 
-    img_url: str = Field()
     favourite: bool = Field(default=False)
     timestamp: datetime = Field(default_factory=lambda: datetime.now(UTC))
+
+    @classmethod
+    def from_js(cls, item: JsProxy) -> Self:
+        """
+        Create a record from a JavaScript object, as read from the database.
+
+        The object is converted in a single step, and the record is not validated again. Records are only ever written
+        by `to_js`, from a record that was validated when it was created.
+        """
+        data = item.to_py()
+        data["types"] = {PokemonType(type_) for type_ in data["types"]}
+        data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+
+        return cls.model_construct(**data)
+
+    def to_js(self) -> JsProxy:
+        """Convert the record to a JavaScript object, as written to the database."""
+        return to_js(self.model_dump(mode="json"), dict_converter=Object.fromEntries)
@@ -12,9 +12,10 @@ from frontend.base import Service
 from .reader import reader
 
 if TYPE_CHECKING:
+    from js import JsCanvasElement
     from transformers_js import ModelOutput
 
-type Model = Callable[[str], Future[ModelOutput]]
+type Model = Callable[[JsCanvasElement], Future[ModelOutput]]
 
 MODEL_NAME = "Xenova/vit-gpt2-image-captioning"
 
@@ -46,7 +47,7 @@ class Caption(Service):
         ).subscribe(self.model)
 
         # Generate captions whenever an image is available and the model is loaded
-        combine_latest(reader.object_urls, self.model).pipe(
+        combine_latest(reader.caption_inputs, self.model).pipe(
             op.do_action(lambda _: self.is_generating_caption.on_next(value=True)),
             op.flat_map_latest(
                 lambda params: from_future(create_task(self._caption(*params))).pipe(
@@ -66,9 +67,9 @@ class Caption(Service):
         self.is_generating_caption.dispose()
         self.is_loading_model.dispose()
 
-    async def _caption(self, url: str, model: Model) -> str:
-        """Generate a caption for the image at the given URL."""
-        output = await model(url)
+    async def _caption(self, image: "JsCanvasElement", model: Model) -> str:
+        """Generate a caption for the image on the given canvas."""
+        output = await model(image)
         return output.at(0).generated_text
 
     def _handle_caption_error(self, err: Exception) -> Observable:
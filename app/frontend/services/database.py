@@ -1,7 +1,10 @@
 import asyncio
-from typing import TYPE_CHECKING, override
+import base64
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any, Optional, override
 
-from js import JSON, Event, console, indexedDB
+from js import Blob, Event, IDBKeyRange, console, indexedDB
+from pyodide.ffi import to_js
 from pyodide.ffi.wrappers import add_event_listener
 
 from frontend.base import Service
@@ -12,8 +15,9 @@ if TYPE_CHECKING:
 
 _COLLECTION_NAME = "pokemon"
 _DB_NAME = "calm_calatheas"
-_DB_VERSION = 1
-_READY = asyncio.Event()
+_DB_VERSION = 3
+_IMAGES_COLLECTION_NAME = "images"
+_TIMESTAMP_INDEX_NAME = "timestamp"
 
 
 class DatabaseNotInitializedError(Exception):
@@ -26,12 +30,13 @@ class DatabaseNotInitializedError(Exception):
 class Database(Service):
     """Service for interacting with IndexedDB."""
 
-    def __init__(self) -> None:
+    def __init__(self, name: str = _DB_NAME) -> None:
         super().__init__()
 
         self._db: IDBDatabase | None = None
+        self._ready = asyncio.Event()
 
-        open_ = indexedDB.open(_DB_NAME, _DB_VERSION)
+        open_ = indexedDB.open(name, _DB_VERSION)
 
         add_event_listener(open_, "success", self._handle_open_success)
         add_event_listener(open_, "upgradeneeded", self._handle_open_upgrade_needed)
@@ -42,37 +47,34 @@ class Database(Service):
             self._db.close()
 
     async def delete(self, name: str) -> None:
-        """Delete a Pokemon."""
-        await _READY.wait()
+        """Delete a Pokemon and its image."""
+        await self._ready.wait()
 
         if not self._db:
             raise DatabaseNotInitializedError
 
         future = asyncio.Future[None]()
 
-        transaction = self._db.transaction(_COLLECTION_NAME, "readwrite")
-        store = transaction.objectStore(_COLLECTION_NAME)
+        transaction = self._db.transaction([_COLLECTION_NAME, _IMAGES_COLLECTION_NAME], "readwrite")
 
-        query = store.delete(name)
+        transaction.objectStore(_COLLECTION_NAME).delete(name)
+        transaction.objectStore(_IMAGES_COLLECTION_NAME).delete(name)
 
         def on_complete(_: Event) -> None:
-            transaction.close()
+            future.set_result(None)
 
         def on_error(_: Event) -> None:
             future.set_exception(Exception(f"Failed to delete pokemon {name}"))
 
-        def on_success(_: Event) -> None:
-            future.set_result(None)
-
-        add_event_listener(query, "complete", on_complete)
-        add_event_listener(query, "error", on_error)
-        add_event_listener(query, "success", on_success)
+        # The record and the image are deleted together, or not at all
+        add_event_listener(transaction, "abort", on_error)
+        add_event_listener(transaction, "complete", on_complete)
 
         return await future
 
     async def find_all(self) -> list[PokemonRecord]:
         """Find all Pokemon."""
-        await _READY.wait()
+        await self._ready.wait()
 
         if not self._db:
             raise DatabaseNotInitializedError
@@ -91,11 +93,7 @@ class Database(Service):
             future.set_result([])
 
         def on_success(event: Event) -> None:
-            # Some serialization and deserialization magic to ensure the data is accepted by Pydantic
-            result = [
-                PokemonRecord.model_validate_json(JSON.stringify(item))
-                for item in event.target.result  # type: ignore[result is available]
-            ]
+            result = [PokemonRecord.from_js(item) for item in event.target.result]  # type: ignore[result is available]
             future.set_result(result)
 
         add_event_listener(query, "complete", on_complete)
@@ -104,9 +102,35 @@ class Database(Service):
 
         return await future
 
+    async def find_image(self, name: str) -> Optional[Blob]:
+        """Find the image of a Pokemon."""
+        await self._ready.wait()
+
+        if not self._db:
+            raise DatabaseNotInitializedError
+
+        future = asyncio.Future[Optional[Blob]]()
+
+        transaction = self._db.transaction(_IMAGES_COLLECTION_NAME, "readonly")
+        store = transaction.objectStore(_IMAGES_COLLECTION_NAME)
+
+        query = store.get(name)
+
+        def on_error(_: Event) -> None:
+            future.set_result(None)
+
+        def on_success(event: Event) -> None:
+            # Blobs are stored as they are, so there is nothing to convert
+            future.set_result(event.target.result)  # type: ignore[result is available]
+
+        add_event_listener(query, "error", on_error)
+        add_event_listener(query, "success", on_success)
+
+        return await future
+
     async def find_one(self, name: str) -> PokemonRecord | None:
         """Find a single Pokemon."""
-        await _READY.wait()
+        await self._ready.wait()
 
         if not self._db:
             raise DatabaseNotInitializedError
@@ -125,9 +149,8 @@ class Database(Service):
             future.set_result(None)
 
         def on_success(event: Event) -> None:
-            # Some serialization and deserialization magic to ensure the data is accepted by Pydantic
-            result = PokemonRecord.model_validate_json(JSON.stringify(event.target.result))  # type: ignore[result is available]
-            future.set_result(result)
+            item = event.target.result  # type: ignore[result is available]
+            future.set_result(PokemonRecord.from_js(item) if item else None)
 
         add_event_listener(query, "complete", on_complete)
         add_event_listener(query, "error", on_error)
@@ -135,33 +158,77 @@ class Database(Service):
 
         return await future
 
-    async def put(self, description: PokemonRecord) -> None:
-        """Store a Pokemon."""
-        await _READY.wait()
+    async def find_page(self, before: PokemonRecord | None, limit: int) -> list[PokemonRecord]:
+        """
+        Find a page of Pokemon, newest first.
+
+        The page starts after the given Pokemon, which is the last one of the previous page, or at the newest Pokemon
+        if none is given. Only the Pokemon on the page are read.
+        """
+        await self._ready.wait()
+
+        if not self._db:
+            raise DatabaseNotInitializedError
+
+        future = asyncio.Future[list[PokemonRecord]]()
+        result: list[PokemonRecord] = []
+
+        transaction = self._db.transaction(_COLLECTION_NAME, "readonly")
+        index = transaction.objectStore(_COLLECTION_NAME).index(_TIMESTAMP_INDEX_NAME)
+
+        # Pokemon are ordered by their timestamp, and by their name if the timestamps are the same
+        key_range = IDBKeyRange.upperBound(_timestamp_key(before), True) if before else None  # noqa: FBT003
+        query = index.openCursor(key_range, "prev")
+
+        def on_error(_: Event) -> None:
+            future.set_result([])
+
+        def on_success(event: Event) -> None:
+            if not (cursor := event.target.result):  # type: ignore[result is available]
+                future.set_result(result)
+                return
+
+            result.append(PokemonRecord.from_js(cursor.value))
+
+            if len(result) < limit:
+                cursor.continue_()
+            else:
+                future.set_result(result)
+
+        add_event_listener(query, "error", on_error)
+        add_event_listener(query, "success", on_success)
+
+        return await future
+
+    async def put(self, description: PokemonRecord, image: Optional[Blob] = None) -> None:
+        """
+        Store a Pokemon, and its image if one is given.
+
+        The image is stored as a blob, under the name of the Pokemon. If no image is given, the stored image is kept.
+        """
+        await self._ready.wait()
 
         if not self._db:
             raise DatabaseNotInitializedError
 
         future = asyncio.Future[None]()
 
-        transaction = self._db.transaction(_COLLECTION_NAME, "readwrite")
-        store = transaction.objectStore(_COLLECTION_NAME)
+        transaction = self._db.transaction([_COLLECTION_NAME, _IMAGES_COLLECTION_NAME], "readwrite")
 
-        # Some serialization and deserialization magic to ensure the data is accepted by IndexedDB
-        query = store.put(JSON.parse(description.model_dump_json()))
+        transaction.objectStore(_COLLECTION_NAME).put(description.to_js())
+
+        if image is not None:
+            transaction.objectStore(_IMAGES_COLLECTION_NAME).put(image, description.name)
 
         def on_complete(_: Event) -> None:
-            transaction.close()
+            future.set_result(None)
 
         def on_error(_: Event) -> None:
             future.set_exception(Exception(f"Failed to store pokemon {description.name}"))
 
-        def on_success(_: Event) -> None:
-            future.set_result(None)
-
-        add_event_listener(query, "complete", on_complete)
-        add_event_listener(query, "error", on_error)
-        add_event_listener(query, "success", on_success)
+        # The record and the image are stored together, or not at all
+        add_event_listener(transaction, "abort", on_error)
+        add_event_listener(transaction, "complete", on_complete)
 
         return await future
 
@@ -170,7 +237,7 @@ class Database(Service):
         self._db = event.target.result  # type: ignore[result is available]
         console.log("Opened IndexedDB.")
 
-        _READY.set()
+        self._ready.set()
 
     def _handle_open_upgrade_needed(self, event: Event) -> None:
         """Handle the upgrade needed event."""
@@ -179,14 +246,75 @@ class Database(Service):
         if not self._db:
             raise DatabaseNotInitializedError
 
-        self._db.createObjectStore(_COLLECTION_NAME, {"keyPath": "name"})
+        transaction = event.target.transaction  # type: ignore[transaction is available]
+
+        # Upgrade the schema one version at a time, starting from the version of the existing database, if any
+        for upgrade in self._upgrades[event.oldVersion :]:  # type: ignore[oldVersion is available]
+            upgrade(transaction)
 
-        add_event_listener(event.target.transaction, "complete", self._handle_upgrade_transaction_complete)  # type: ignore[transaction is available]
+        add_event_listener(transaction, "complete", self._handle_upgrade_transaction_complete)
 
     def _handle_upgrade_transaction_complete(self, _: Event) -> None:
         """Handle the completion of the upgrade transaction."""
         console.log("Initialized IndexedDB.")
-        _READY.set()
+        self._ready.set()
+
+    @property
+    def _upgrades(self) -> list[Callable[[Any], None]]:
+        """The upgrades to the schema of the database, where upgrade N takes the database to version N + 1."""
+        return [
+            self._upgrade_add_collection,
+            self._upgrade_add_images_collection,
+            self._upgrade_add_timestamp_index,
+        ]
+
+    def _upgrade_add_collection(self, _: Any) -> None:  # noqa: ANN401
+        """Create the collection of Pokemon."""
+        self._db.createObjectStore(_COLLECTION_NAME, {"keyPath": "name"})  # type: ignore[database is initialized]
+
+    def _upgrade_add_images_collection(self, transaction: Any) -> None:  # noqa: ANN401
+        """Create the collection of images, and move the images of existing Pokemon out of their records into it."""
+        self._db.createObjectStore(_IMAGES_COLLECTION_NAME)  # type: ignore[database is initialized]
+
+        images = transaction.objectStore(_IMAGES_COLLECTION_NAME)
+        cursor_request = transaction.objectStore(_COLLECTION_NAME).openCursor()
+
+        def on_success(event: Event) -> None:
+            if not (cursor := event.target.result):  # type: ignore[result is available]
+                return
+
+            record = cursor.value
+
+            # Images used to be stored in the records, as data URLs
+            if hasattr(record, "img_url"):
+                images.put(_decode_data_url(record.img_url), record.name)
+                del record.img_url
+                cursor.update(record)
+
+            cursor.continue_()
+
+        # The upgrade transaction stays open for as long as requests are made from its callbacks
+        add_event_listener(cursor_request, "success", on_success)
+
+    def _upgrade_add_timestamp_index(self, transaction: Any) -> None:  # noqa: ANN401
+        """Index the Pokemon by their timestamp, so that they can be read a page at a time, newest first."""
+        store = transaction.objectStore(_COLLECTION_NAME)
+        store.createIndex(_TIMESTAMP_INDEX_NAME, to_js(["timestamp", "name"]))
+
+
+def _decode_data_url(url: str) -> Blob:
+    """Decode a base64 data URL into a blob."""
+    header, data = url.split(",", 1)
+    mime_type = header.removeprefix("data:").split(";")[0]
+
+    return Blob.new(to_js([base64.b64decode(data)]), {"type": mime_type})
+
+
+def _timestamp_key(description: PokemonRecord) -> Any:  # noqa: ANN401
+    """Return the key of the given Pokemon in the timestamp index."""
+    # The timestamp is serialized the same way as in the stored record, so that the keys compare equal
+    timestamp = description.model_dump(mode="json", include={"timestamp"})["timestamp"]
+    return to_js([timestamp, description.name])
 
 
 database = Database()
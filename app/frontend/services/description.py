@@ -1,7 +1,10 @@
-from asyncio import create_task
+import json
+from asyncio import CancelledError, create_task, sleep
+from http import HTTPStatus
+from typing import Any
 
-from js import console
-from pyodide.http import pyfetch
+from js import console, sessionStorage
+from pyodide.http import FetchResponse, pyfetch
 from reactivex import Observable, empty, from_future
 from reactivex import operators as op
 from reactivex.subject import BehaviorSubject, ReplaySubject
@@ -11,6 +14,29 @@ from frontend.models import PokemonDescription
 
 from .caption import caption
 
+# Number of seconds to wait before trying again if the server does not say how long to wait
+DEFAULT_RETRY_AFTER = 5
+
+# Number of seconds to wait between checks on the status of a description job
+POLL_INTERVAL = 1
+
+# Prefix of the session storage keys under which the job for each caption, and the token to cancel it, are remembered
+SESSION_STORAGE_KEY_PREFIX = "description-job:"
+
+
+class DescriptionGenerationError(Exception):
+    """Error raised when the server fails to generate a description."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Failed to generate description: {reason}")
+
+
+class JobCancelledError(Exception):
+    """Error raised when the description job is cancelled before it has finished."""
+
+    def __init__(self) -> None:
+        super().__init__("The description job was cancelled before it finished.")
+
 
 class Description(Service):
     """Service to generate descriptions from captions."""
@@ -20,6 +46,7 @@ class Description(Service):
 
         self.is_generating_description = BehaviorSubject[bool](value=False)
         self.descriptions = ReplaySubject[PokemonDescription]()
+        self.progress = BehaviorSubject[str](value="")
 
         # Generate descriptions whenever a new caption is available
         caption.captions.pipe(
@@ -36,18 +63,39 @@ class Description(Service):
         ).subscribe(self.descriptions)
 
     async def _describe(self, caption: str) -> PokemonDescription:
-        """Generate a description from the given caption."""
+        """
+        Generate a description from the given caption.
+
+        The description is generated by a job on the server, and the generated text is published as progress while
+        the job is running. The job is remembered for the rest of the session, so describing the same caption again
+        picks up the existing job instead of starting over. If a newer caption comes in before the job has finished,
+        the job is cancelled, so that the server stops generating a description nobody is waiting for.
+        """
         console.log("Generating description for caption:", caption)
 
-        response = await pyfetch(f"/describe?prompt={caption}")
-        response.raise_for_status()
-
-        data = await response.json()
-        description = PokemonDescription.model_validate(data)
-
-        console.log("Generated description:", description.model_dump_json())
-
-        return description
+        self.progress.on_next("")
+
+        job = await _find_job(caption) or await _create_job(caption)
+        client = job["client"]
+
+        try:
+            while job["status"] in {"queued", "running"}:
+                self.progress.on_next(job["progress"])
+                await sleep(POLL_INTERVAL)
+                job = await (await _fetch_when_available(f"/describe/jobs/{job['id']}")).json()
+        except CancelledError:
+            await _cancel_job(job["id"], client)
+            raise
+
+        match job["status"]:
+            case "succeeded":
+                description = PokemonDescription.model_validate(job["description"])
+                console.log("Generated description:", description.model_dump_json())
+                return description
+            case "cancelled":
+                raise JobCancelledError
+            case _:
+                raise DescriptionGenerationError(job["error"])
 
     def _handle_description_error(self, err: Exception) -> Observable:
         """Handle errors that occur while generating descriptions."""
@@ -55,4 +103,77 @@ class Description(Service):
         return empty()
 
 
+async def _cancel_job(job_id: str, client: str) -> None:
+    """Cancel the job with the given id on the server, using the token the job was submitted with."""
+    console.log("Cancelling description job:", job_id)
+
+    response = await pyfetch(f"/describe/jobs/{job_id}?client={client}", method="DELETE")
+
+    if not response.ok:
+        console.error("Failed to cancel description job:", job_id)
+
+
+async def _create_job(caption: str) -> dict[str, Any]:
+    """
+    Create a job on the server that generates a description from the given caption, and remember it.
+
+    The returned job includes the token that the job can be cancelled with.
+    """
+    response = await _fetch_when_available(
+        "/describe/jobs",
+        method="POST",
+        headers={"Content-Type": "application/json"},
+        body=json.dumps({"prompt": caption}),
+    )
+
+    job = await response.json()
+
+    sessionStorage.setItem(
+        f"{SESSION_STORAGE_KEY_PREFIX}{caption}",
+        json.dumps({"client": job["client"], "id": job["id"]}),
+    )
+
+    return job
+
+
+async def _fetch_when_available(url: str, **kwargs: object) -> FetchResponse:
+    """
+    Fetch the given URL, waiting and trying again for as long as the server is unavailable.
+
+    The server is unavailable while the model is loading, or when it is too busy to accept more requests.
+    """
+    while (response := await pyfetch(url, **kwargs)).status == HTTPStatus.SERVICE_UNAVAILABLE:
+        retry_after = int(response.headers.get("retry-after", DEFAULT_RETRY_AFTER))
+        console.log("Server unavailable, trying again in seconds:", retry_after)
+        await sleep(retry_after)
+
+    response.raise_for_status()
+
+    return response
+
+
+async def _find_job(caption: str) -> dict[str, Any] | None:
+    """
+    Return the job that was created earlier in the session for the given caption, if it can still be used.
+
+    Jobs that failed or were cancelled are not reused, and the server forgets about jobs some time after they finish.
+    The returned job includes the token that the job can be cancelled with.
+    """
+    if (remembered := sessionStorage.getItem(f"{SESSION_STORAGE_KEY_PREFIX}{caption}")) is None:
+        return None
+
+    remembered_job = json.loads(remembered)
+
+    response = await pyfetch(f"/describe/jobs/{remembered_job['id']}")
+
+    if response.status == HTTPStatus.NOT_FOUND:
+        return None
+
+    response.raise_for_status()
+
+    job = await response.json()
+
+    return {**job, "client": remembered_job["client"]} if job["status"] in {"queued", "running", "succeeded"} else None
+
+
 description = Description()
@@ -1,32 +1,44 @@
 from asyncio import create_task
-from typing import override
+from datetime import datetime
+from typing import Optional, override
 
-from js import console
-from reactivex import Observable, combine_latest, empty, from_future
+from js import Blob, console
+from reactivex import Observable, combine_latest, empty, from_future, merge
 from reactivex import operators as op
 from reactivex.subject import BehaviorSubject, Subject
 
 from frontend.base import Service
-from frontend.models import PokemonRecord
+from frontend.models import ChangeType, PokemonChange, PokemonRecord
 
 from .caption import caption
 from .database import database
 from .description import description
 from .reader import reader
 
+# Number of Pokemon to load at a time
+PAGE_SIZE = 24
+
 
 class Pokemon(Service):
-    """Service that maintains a list of the user's current Pokemon."""
+    """
+    Service that maintains a list of the user's current Pokemon.
+
+    Changes to single Pokemon are applied to the list as they are made, without reading the list from the database
+    again. The list is only read again on refresh, which brings it back in line with the database.
+    """
 
     def __init__(self) -> None:
         super().__init__()
 
+        self.changes = Subject[PokemonChange]()
+        self.has_more = BehaviorSubject[bool](value=False)
         self.is_generating = BehaviorSubject[bool](value=False)
         self.is_refreshing = BehaviorSubject[bool](value=False)
         self.pokemon = BehaviorSubject[list[PokemonRecord]](value=[])
 
-        self._delete = Subject[str]()
-        self._put = Subject[PokemonRecord]()
+        self._delete = Subject[PokemonRecord]()
+        self._load_more = Subject[None]()
+        self._put = Subject[tuple[PokemonRecord, Optional[Blob]]]()
         self._refresh = Subject[None]()
 
         # Combine the loading states from all relevant sources
@@ -40,37 +52,56 @@ class Pokemon(Service):
             op.take_until(self.destroyed),
         ).subscribe(self.is_generating)
 
-        # Whenever a new description is available, get the corresponding image url and create an new database record
+        # Whenever a new description is available, store it as a new database record along with the corresponding image
         description.descriptions.pipe(
-            op.with_latest_from(reader.object_urls),
-            op.map(lambda params: PokemonRecord(**params[0].model_dump(), img_url=params[1])),
+            op.with_latest_from(reader.images),
             op.take_until(self.destroyed),
-        ).subscribe(lambda pokemon: self.put(pokemon))
+        ).subscribe(lambda params: self.put(PokemonRecord(**params[0].model_dump()), params[1]))
 
-        # On put, update the database with the given record
+        # On put, update the database with the given record and image. Every put that succeeds is a change
         self._put.pipe(
-            op.flat_map_latest(lambda pokemon: from_future(create_task(database.put(pokemon)))),
-            op.catch(lambda err, _: self._handle_update_error(err)),
+            op.flat_map(
+                lambda params: from_future(create_task(database.put(*params))).pipe(
+                    op.map(lambda _: self._change_for_put(params[0])),
+                    op.catch(lambda err, _: self._handle_update_error(err)),
+                ),
+            ),
             op.take_until(self.destroyed),
-        ).subscribe(lambda _: self.refresh())
+        ).subscribe(self.changes.on_next)
 
-        # On delete, remove the Pokemon from the list and trigger a refresh
+        # On delete, remove the Pokemon from the database. Every delete that succeeds is a change
         self._delete.pipe(
-            op.flat_map_latest(lambda name: from_future(create_task(database.delete(name)))),
-            op.catch(lambda err, _: self._handle_delete_error(err)),
+            op.flat_map(
+                lambda pokemon: from_future(create_task(database.delete(pokemon.name))).pipe(
+                    op.map(lambda _: PokemonChange(pokemon=pokemon, type=ChangeType.REMOVED)),
+                    op.catch(lambda err, _: self._handle_delete_error(err)),
+                ),
+            ),
             op.take_until(self.destroyed),
-        ).subscribe(lambda _: self.refresh())
+        ).subscribe(self.changes.on_next)
 
-        # On refresh, retrieve the current list of Pokemon from the database. Sort the list by timestamp
-        self._refresh.pipe(
+        # Apply each change to the list as it is made
+        self.changes.pipe(
+            op.map(self._apply_change),
+            op.take_until(self.destroyed),
+        ).subscribe(self.pokemon)
+
+        # On refresh, retrieve the first page of Pokemon from the database. On load more, retrieve the page after the
+        # Pokemon that are already in the list, unless the list is already being loaded
+        merge(
+            self._refresh.pipe(op.map(lambda _: True)),
+            self._load_more.pipe(
+                op.filter(lambda _: self.has_more.value and not self.is_refreshing.value),
+                op.map(lambda _: False),
+            ),
+        ).pipe(
             op.do_action(lambda _: self.is_refreshing.on_next(value=True)),
             op.flat_map_latest(
-                lambda _: from_future(create_task(database.find_all())).pipe(
+                lambda refresh: from_future(create_task(self._load_page(refresh=refresh))).pipe(
+                    op.catch(lambda err, _: self._handle_refresh_error(err)),
                     op.finally_action(lambda: self.is_refreshing.on_next(value=False)),
                 ),
             ),
-            op.catch(lambda err, _: self._handle_refresh_error(err)),
-            op.map(lambda pokemon: sorted(pokemon, key=lambda p: p.timestamp, reverse=True)),
             op.take_until(self.destroyed),
         ).subscribe(self.pokemon)
 
@@ -79,28 +110,64 @@ class Pokemon(Service):
 
     @override
     def on_destroy(self) -> None:
+        self.changes.dispose()
+        self.has_more.dispose()
         self.is_generating.dispose()
         self.is_refreshing.dispose()
         self.pokemon.dispose()
         self._delete.dispose()
+        self._load_more.dispose()
         self._put.dispose()
         self._refresh.dispose()
 
-    def delete(self, name: str) -> None:
-        """Delete the pokemon with the given name."""
-        self._delete.on_next(name)
+    def delete(self, pokemon: PokemonRecord) -> None:
+        """Delete the given pokemon."""
+        self._delete.on_next(pokemon)
+
+    def load_more(self) -> None:
+        """Add the next page of Pokemon to the list, if there is one."""
+        self._load_more.on_next(None)
 
-    def put(self, pokemon: PokemonRecord) -> None:
-        """Update the database with the given pokemon."""
-        self._put.on_next(pokemon)
+    def put(self, pokemon: PokemonRecord, image: Optional[Blob] = None) -> None:
+        """Update the database with the given pokemon, and its image if one is given."""
+        self._put.on_next((pokemon, image))
 
     def refresh(self) -> None:
-        """Trigger a refresh of the list."""
+        """Trigger a refresh of the list, which starts over at the first page."""
         self._refresh.on_next(None)
 
+    def _apply_change(self, change: PokemonChange) -> list[PokemonRecord]:
+        """
+        Return the list of Pokemon with the given change applied to it.
+
+        Pokemon are kept in the order of the timestamp index, newest first, so new Pokemon go to the front of the list.
+        The database is not read.
+        """
+        pokemon = [item for item in self.pokemon.value if item.name != change.pokemon.name]
+
+        if change.type == ChangeType.REMOVED:
+            return pokemon
+
+        key = _sort_key(change.pokemon)
+        index = next((index for index, item in enumerate(pokemon) if _sort_key(item) < key), len(pokemon))
+
+        # A Pokemon that belongs after the end of the list is left for the page it is on, if that is yet to be loaded
+        if index < len(pokemon) or not self.has_more.value:
+            pokemon.insert(index, change.pokemon)
+
+        return pokemon
+
+    def _change_for_put(self, pokemon: PokemonRecord) -> PokemonChange:
+        """Return the change made by storing the given Pokemon."""
+        if any(item.name == pokemon.name for item in self.pokemon.value):
+            return PokemonChange(pokemon=pokemon, type=ChangeType.UPDATED)
+
+        return PokemonChange(pokemon=pokemon, type=ChangeType.INSERTED)
+
     def _handle_delete_error(self, err: Exception) -> Observable:
-        """Handle errors that occur while deleting a Pokemon."""
+        """Handle errors that occur while deleting a Pokemon, by bringing the list back in line with the database."""
         console.error("Failed to delete pokemon:", err)
+        self.refresh()
         return empty()
 
     def _handle_favourite_error(self, err: Exception) -> Observable:
@@ -113,9 +180,31 @@ class Pokemon(Service):
         return empty()
 
     def _handle_update_error(self, err: Exception) -> Observable:
-        """Handle errors that occur while updating a Pokemon."""
+        """Handle errors that occur while updating a Pokemon, by bringing the list back in line with the database."""
         console.error("Failed to update pokemon:", err)
+        self.refresh()
         return empty()
 
+    async def _load_page(self, *, refresh: bool) -> list[PokemonRecord]:
+        """Load the first page, or the page after the Pokemon in the list, and return the list with the page added."""
+        loaded = [] if refresh else self.pokemon.value
+        page = await database.find_page(loaded[-1] if loaded else None, PAGE_SIZE)
+
+        # A page that is not full is the last one
+        self.has_more.on_next(len(page) == PAGE_SIZE)
+
+        if refresh:
+            return page
+
+        # Changes may have been applied to the list while the page was loading
+        names = {item.name for item in self.pokemon.value}
+
+        return self.pokemon.value + [item for item in page if item.name not in names]
+
+
+def _sort_key(pokemon: PokemonRecord) -> tuple[datetime, str]:
+    """Return the key that orders Pokemon like the timestamp index does."""
+    return pokemon.timestamp, pokemon.name
+
 
 pokemon = Pokemon()
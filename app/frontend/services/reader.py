@@ -1,67 +1,141 @@
-from asyncio import Future
-from typing import Union, override
+from asyncio import Future, create_task
+from typing import TYPE_CHECKING, Optional, Union, override
 
-from js import Blob, File, FileReader, console
-from pyodide.ffi.wrappers import add_event_listener
+from js import Blob, File, console, createImageBitmap, document
+from pyodide.ffi import create_once_callable
 from reactivex import Observable, empty, from_future
 from reactivex import operators as op
 from reactivex.subject import BehaviorSubject, ReplaySubject, Subject
 
 from frontend.base import Service
 
-type Readable = Union[Blob, File]
+if TYPE_CHECKING:
+    from js import ImageBitmap, JsCanvasElement
+
+type Readable = Union[Blob, File, "JsCanvasElement"]
+
+# Size in pixels of the images the caption model looks at, which it would otherwise resize them to itself
+CAPTION_INPUT_SIZE = 224
+
+# Longest side in pixels of the image that is stored and shown on the card. The card shows the image at 128x128 pixels,
+# so this leaves room for high density screens. Raise it to keep a copy of the original at a capped resolution instead
+IMAGE_MAX_SIZE = 256
+
+# Quality of the stored image, between 0 and 1
+IMAGE_QUALITY = 0.8
+
+# Formats to store the image in, in order of preference. Browsers that cannot encode a format fall back to PNG
+IMAGE_TYPES = ("image/webp", "image/jpeg")
+
+
+class ImageEncodingError(Exception):
+    """Error raised when the browser fails to encode an image."""
+
+    def __init__(self) -> None:
+        super().__init__("Failed to encode the image.")
 
 
 class Reader(Service):
-    """Service for reading files and generating object URLs."""
+    """Service for reading images and preparing them for captioning and storage."""
 
     def __init__(self) -> None:
         super().__init__()
 
+        # Only the latest image is still of use, so older ones are not kept around
+        self.caption_inputs = ReplaySubject["JsCanvasElement"](buffer_size=1)
+        self.images = ReplaySubject[Blob](buffer_size=1)
         self.is_reading = BehaviorSubject[bool](value=False)
-        self.object_urls = ReplaySubject[str]()
 
         self._read = Subject[Readable]()
 
-        # On read, generate an object URL for the object
+        # On read, decode the object once and prepare a downscaled copy for each of its uses
         self._read.pipe(
             op.do_action(lambda _: self.is_reading.on_next(value=True)),
             op.flat_map_latest(
-                lambda file_: from_future(self._generate_object_url(file_)).pipe(
+                lambda object_: from_future(create_task(self._prepare(object_))).pipe(
+                    op.catch(lambda err, _: self._handle_reader_error(err)),
                     op.finally_action(lambda: self.is_reading.on_next(value=False)),
                 ),
             ),
-            op.catch(lambda err, _: self._handle_reader_error(err)),
             op.take_until(self.destroyed),
-        ).subscribe(self.object_urls)
+        ).subscribe(lambda prepared: self._handle_prepared(*prepared))
 
     @override
     def on_destroy(self) -> None:
         self._read.dispose()
+        self.caption_inputs.dispose()
+        self.images.dispose()
         self.is_reading.dispose()
-        self.object_urls.dispose()
 
     def read(self, object_: Readable) -> None:
         """Upload an object and trigger further processing."""
         self._read.on_next(object_)
 
+    def _handle_prepared(self, caption_input: "JsCanvasElement", image: Blob) -> None:
+        """Pass on the prepared copies of an image."""
+        self.images.on_next(image)
+        self.caption_inputs.on_next(caption_input)
+
     def _handle_reader_error(self, err: Exception) -> Observable:
         """Handle errors that occur while reading objects."""
         console.error("Error reading object:", err)
         return empty()
 
-    def _generate_object_url(self, object_: Readable) -> Future[str]:
-        """Read an object and return its object URL."""
-        result = Future()
+    async def _encode(self, canvas: "JsCanvasElement") -> Blob:
+        """Encode the image on the given canvas in the first of the preferred formats that the browser supports."""
+        encoded: Optional[Blob] = None
+
+        for type_ in IMAGE_TYPES:
+            result = Future[Optional[Blob]]()
+            canvas.toBlob(create_once_callable(result.set_result), type_, IMAGE_QUALITY)
+
+            # The browser gives no blob at all if the image cannot be encoded, for example if the canvas is empty
+            if (blob := await result) is None:
+                continue
+
+            encoded = blob
+
+            if blob.type == type_:
+                break
+
+        if encoded is None:
+            raise ImageEncodingError
+
+        return encoded
+
+    async def _prepare(self, object_: Readable) -> tuple["JsCanvasElement", Blob]:
+        """
+        Decode the given object, and return the input for the caption model and the image to store.
+
+        The caption model stretches images to a square, so its input is drawn that way. The image to store keeps its
+        aspect ratio.
+        """
+        bitmap = await createImageBitmap(object_)
+
+        try:
+            caption_input = _draw(bitmap, CAPTION_INPUT_SIZE, CAPTION_INPUT_SIZE)
+
+            # Keep at least a pixel on each side, since a very narrow image would otherwise be scaled to nothing
+            scale = min(IMAGE_MAX_SIZE / max(bitmap.width, bitmap.height), 1)
+            width, height = max(round(bitmap.width * scale), 1), max(round(bitmap.height * scale), 1)
+            image = await self._encode(_draw(bitmap, width, height))
+        finally:
+            bitmap.close()
+
+        return caption_input, image
 
-        reader = FileReader.new()
 
-        add_event_listener(reader, "load", lambda _: result.set_result(reader.result))  # type: ignore[FileReader also supported]
-        add_event_listener(reader, "error", lambda e: result.set_exception(e))  # type: ignore[FileReader also supported]
+def _draw(bitmap: "ImageBitmap", width: int, height: int) -> "JsCanvasElement":
+    """Draw the given bitmap on a new canvas of the given size."""
+    canvas = document.createElement("canvas")
+    canvas.width = width
+    canvas.height = height
 
-        reader.readAsDataURL(object_)
+    context = canvas.getContext("2d")
+    context.imageSmoothingQuality = "high"
+    context.drawImage(bitmap, 0, 0, width, height)
 
-        return result
+    return canvas
 
 
 reader = Reader()
@@ -1,5 +1,8 @@
+from asyncio import create_task
+
 from frontend import App
-from js import document
+from frontend.benchmarks import benchmark_records
+from js import document, window
 
 
 def bootstrap() -> None:
@@ -9,4 +12,8 @@ def bootstrap() -> None:
 
 
 if __name__ == "__main__":
-    bootstrap()
+    # Open the app with ?benchmark to log the cost of loading records to the console, instead of showing the app
+    if window.URLSearchParams.new(window.location.search).has("benchmark"):
+        create_task(benchmark_records())  # noqa: RUF006
+    else:
+        bootstrap()
@@ -2,4 +2,10 @@ from uvicorn import run
 
 from calm_calatheas import app, settings
 
-run(app=app, host=settings.host, port=settings.port)
+if settings.server_workers > 1:
+    # Only import torch up front when the model has to be loaded before the workers start
+    from calm_calatheas.workers import serve
+
+    serve(settings.server_workers)
+else:
+    run(app=app, host=settings.host, port=settings.port)
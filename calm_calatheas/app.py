@@ -1,34 +1,290 @@
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any
+
+from pydantic import ValidationError
 from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.routing import Mount, Route
 from starlette.staticfiles import StaticFiles
 
-from .model import generate_description
-from .settings import settings
+from .bulk import BulkRequest, describe_all
+from .cancellation import CancellationToken, GenerationCancelledError
+from .executor import QueueFullError, executor
+from .jobs import JobRequest, jobs
+from .loader import loader
+from .logger import LOGGER
+from .metrics import REQUEST_DURATION, render_metrics
+from .pool import pool
+from .settings import GenerationProfile, settings
+
+if TYPE_CHECKING:
+    from .model import DescriptionStream
+
+
+async def cancel_job(request: Request) -> Response:
+    """
+    Handle DELETE requests to the /describe/jobs/{job_id} endpoint, which cancels the job if it is still running.
+
+    The client passes the token it got when it submitted the job as the `client` query parameter. A job that several
+    clients submitted is only cancelled once all of them have cancelled it.
+    """
+    job_id = request.path_params["job_id"]
+
+    if (state := await jobs.cancel(job_id, request.query_params.get("client", ""))) is None:
+        return Response("Unknown job", status_code=404)
+
+    return JSONResponse(state)
+
+
+async def create_job(request: Request) -> Response:
+    """
+    Handle POST requests to the /describe/jobs endpoint.
 
+    Submits a job that generates a description in the background, and responds with the job right away. Clients poll
+    the job until it has finished. The response includes a `client` token, which the client needs to cancel the job.
+    """
+    try:
+        job_request = JobRequest.model_validate_json(await request.body())
+    except ValidationError:
+        return Response("Invalid job request", status_code=400)
 
-async def describe(request: Request) -> Response:
-    """Handle GET requests to the /describe endpoint."""
+    if (profile := _profile(job_request.profile)) is None:
+        return Response("Unknown generation profile", status_code=400)
+
+    if not loader.ready:
+        return _unavailable("Model is not ready")
+
+    try:
+        job, client = jobs.submit(job_request.prompt, profile, job_request.priority)
+    except QueueFullError:
+        return _unavailable("Server is busy")
+
+    return JSONResponse(
+        {**job.to_dict(), "client": client},
+        status_code=202,
+        headers={"Location": f"/describe/jobs/{job.id}"},
+    )
+
+
+async def describe(request: Request) -> Response:  # noqa: PLR0911
+    """
+    Handle GET requests to the /describe endpoint.
+
+    Captions in the pool of pre-generated descriptions are answered right away. If the client disconnects before the
+    description is ready, the model stops generating it.
+    """
     user_prompt = request.query_params.get("prompt", "")
 
     if not user_prompt:
         return Response("Missing prompt", status_code=400)
 
-    description = generate_description(user_prompt)
+    if (profile := _profile(request.query_params.get("profile"))) is None:
+        return Response("Unknown generation profile", status_code=400)
+
+    # Pre-generated descriptions do not need the model, so they are served even while it is loading or busy
+    if (pooled := pool.get(user_prompt, profile)) is not None:
+        return Response(pooled, media_type="application/json")
+
+    if not loader.ready:
+        return _unavailable("Model is not ready")
+
+    cancellation = CancellationToken()
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, cancellation))
+
+    try:
+        with REQUEST_DURATION.time(endpoint="/describe"):
+            description = await executor.run(loader.model.generate_description, user_prompt, profile, cancellation)
+    except QueueFullError:
+        return _unavailable("Server is busy")
+    except GenerationCancelledError:
+        return Response("Client disconnected", status_code=499)
+    finally:
+        watcher.cancel()
 
     return Response(description.model_dump_json(), media_type="application/json")
 
 
+async def describe_batch(request: Request) -> Response:
+    """
+    Handle POST requests to the /describe/batch endpoint.
+
+    Responds with a stream of newline-delimited JSON, with one line for each prompt, in the order the descriptions are
+    finished. Each line holds the index of the prompt, the prompt, and either the description or an error. If the
+    client disconnects, the model stops generating the remaining descriptions.
+    """
+    try:
+        bulk_request = BulkRequest.model_validate_json(await request.body())
+    except ValidationError:
+        return Response("Invalid batch request", status_code=400)
+
+    if (profile := _profile(bulk_request.profile)) is None:
+        return Response("Unknown generation profile", status_code=400)
+
+    if not loader.ready:
+        return _unavailable("Model is not ready")
+
+    results = describe_all(bulk_request.prompts, profile, CancellationToken())
+
+    return StreamingResponse(_stream_lines(results), media_type="application/x-ndjson")
+
+
+async def describe_stream(request: Request) -> Response:
+    """
+    Handle GET requests to the /describe/stream endpoint.
+
+    Responds with a stream of server-sent events. The generated text is sent as `thinking` and `content` events while
+    it is being produced. The stream ends with either a `description` event containing the validated description, or
+    an `error` event if no valid description could be generated.
+    """
+    user_prompt = request.query_params.get("prompt", "")
+
+    if not user_prompt:
+        return Response("Missing prompt", status_code=400)
+
+    if (profile := _profile(request.query_params.get("profile"))) is None:
+        return Response("Unknown generation profile", status_code=400)
+
+    if not loader.ready:
+        return _unavailable("Model is not ready")
+
+    if cached := await run_in_threadpool(loader.model.find_cached_description, user_prompt, profile):
+        return StreamingResponse(
+            iter([_event("description", cached.model_dump_json())]),
+            media_type="text/event-stream",
+        )
+
+    stream = loader.model.DescriptionStream(user_prompt, profile)
+
+    try:
+        generation = executor.submit(stream.generate)
+    except QueueFullError:
+        return _unavailable("Server is busy")
+
+    return StreamingResponse(_stream_events(stream, generation), media_type="text/event-stream")
+
+
 async def healthcheck(_: Request) -> Response:
-    """Handle GET requests to the /healthcheck endpoint."""
+    """
+    Handle GET requests to the /healthcheck endpoint.
+
+    Reports whether the server is alive. The server is alive while the model is loading, but not if loading failed.
+    """
+    if loader.error:
+        return Response("Failed to load the model", status_code=500, media_type="text/plain")
+
     return Response("OK", media_type="text/plain")
 
 
+async def get_job(request: Request) -> Response:
+    """Handle GET requests to the /describe/jobs/{job_id} endpoint, which reports the status and result of the job."""
+    if (state := await jobs.state(request.path_params["job_id"])) is None:
+        return Response("Unknown job", status_code=404)
+
+    return JSONResponse(state)
+
+
+@asynccontextmanager
+async def lifespan(_: Starlette) -> AsyncGenerator[None]:
+    """Manage resources that live as long as the application."""
+    loader.start()
+    jobs.start()
+    yield
+    jobs.shutdown()
+    executor.shutdown()
+
+
+async def metrics(_: Request) -> Response:
+    """Handle GET requests to the /metrics endpoint, which reports the metrics of the application."""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+async def ready(_: Request) -> Response:
+    """Handle GET requests to the /ready endpoint, which reports whether the model is ready to handle requests."""
+    if not loader.ready:
+        return _unavailable("Model is not ready")
+
+    return Response("OK", media_type="text/plain")
+
+
+async def _cancel_on_disconnect(request: Request, cancellation: CancellationToken) -> None:
+    """Cancel the given token once the client disconnects."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+    LOGGER.debug("Client disconnected, cancelling the generation")
+    cancellation.cancel()
+
+
+def _unavailable(reason: str) -> Response:
+    """Respond that the server cannot handle the request right now, and when the client should try again."""
+    return Response(reason, status_code=503, headers={"Retry-After": str(settings.retry_after)})
+
+
+def _event(event: str, data: str) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _profile(name: str | None) -> GenerationProfile | None:
+    """Return the generation profile with the given name, the default profile if no name is given, or None."""
+    try:
+        return settings.get_generation_profile(name)
+    except KeyError:
+        return None
+
+
+async def _stream_events(stream: "DescriptionStream", generation: asyncio.Future[None]) -> AsyncGenerator[str]:
+    """
+    Stream the generated text as server-sent events, followed by the resulting description.
+
+    If the client disconnects while the text is being generated, the model stops generating it.
+    """
+    with REQUEST_DURATION.time(endpoint="/describe/stream"):
+        try:
+            async for part, text in iterate_in_threadpool(iter(stream)):
+                yield _event(part, json.dumps(text))
+        finally:
+            # Does nothing if the model has already finished
+            stream.cancel()
+
+        try:
+            await generation
+            description = await executor.run(loader.model.parse_description, stream.content, stream.profile)
+            await run_in_threadpool(loader.model.cache_description, stream.user_prompt, stream.profile, description)
+        except Exception as e:  # noqa: BLE001
+            LOGGER.exception("Failed to stream a description")
+            yield _event("error", json.dumps(str(e)))
+        else:
+            yield _event("description", description.model_dump_json())
+
+
+async def _stream_lines(results: AsyncGenerator[dict[str, Any]]) -> AsyncGenerator[str]:
+    """Stream the given results as newline-delimited JSON."""
+    with REQUEST_DURATION.time(endpoint="/describe/batch"):
+        try:
+            async for result in results:
+                yield json.dumps(result) + "\n"
+        finally:
+            # Stops the generations that are still in progress if the client has disconnected
+            await results.aclose()
+
+
 routes = [
     Route("/describe", endpoint=describe, methods=["GET"]),
+    Route("/describe/batch", endpoint=describe_batch, methods=["POST"]),
+    Route("/describe/jobs", endpoint=create_job, methods=["POST"]),
+    Route("/describe/jobs/{job_id}", endpoint=get_job, methods=["GET"]),
+    Route("/describe/jobs/{job_id}", endpoint=cancel_job, methods=["DELETE"]),
+    Route("/describe/stream", endpoint=describe_stream, methods=["GET"]),
     Route("/healthcheck", endpoint=healthcheck, methods=["GET"]),
+    Route("/metrics", endpoint=metrics, methods=["GET"]),
+    Route("/ready", endpoint=ready, methods=["GET"]),
     Mount("/", app=StaticFiles(directory=settings.static_files_path, html=True), name="static"),
 ]
 
-app = Starlette(routes=routes)
+app = Starlette(routes=routes, lifespan=lifespan)
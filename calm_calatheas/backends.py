@@ -0,0 +1,60 @@
+from typing import TYPE_CHECKING, cast
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, PreTrainedModel
+
+from .logger import LOGGER
+from .settings import settings
+
+if TYPE_CHECKING:
+    from transformers import GenerationMixin
+
+    class CausalLanguageModel(PreTrainedModel, GenerationMixin):
+        """The type of the models that the auto class for causal language models loads, which can generate text."""
+
+
+# A configuration for a model that is small enough to run anywhere, used when the real weights are not needed
+RANDOM_MODEL_CONFIG = {
+    "head_dim": 16,
+    "hidden_size": 64,
+    "intermediate_size": 128,
+    "num_attention_heads": 4,
+    "num_hidden_layers": 2,
+    "num_key_value_heads": 2,
+}
+
+
+def load_model(name: str) -> "CausalLanguageModel":
+    """Load the model with the given name, prepared for the inference backend in the application settings."""
+    LOGGER.debug("Loading %s with the %s inference backend", name, settings.inference_backend)
+
+    match settings.inference_backend:
+        case "compile":
+            model = _from_pretrained(name, torch_dtype="auto", device_map="auto")
+
+            # Shapes change with every token and every batch, so compile for dynamic shapes to avoid recompiling
+            model.forward = torch.compile(model.forward, dynamic=True)
+        case "eager":
+            model = _from_pretrained(name, torch_dtype="auto", device_map="auto")
+        case "int8":
+            # Dynamic quantization runs on the CPU, and quantizes from full precision weights
+            model = _from_pretrained(name, torch_dtype=torch.float32)
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return cast("CausalLanguageModel", model)
+
+
+def _from_pretrained(name: str, torch_dtype: str | torch.dtype, device_map: str | None = None) -> PreTrainedModel:
+    """
+    Load the model with the given name.
+
+    If random weights are enabled, a small model with the same architecture and vocabulary is created instead, which
+    only needs the configuration of the model.
+    """
+    if not settings.model_random_weights:
+        return AutoModelForCausalLM.from_pretrained(name, torch_dtype=torch_dtype, device_map=device_map)
+
+    config = AutoConfig.from_pretrained(name)
+    config.update(RANDOM_MODEL_CONFIG)
+
+    return AutoModelForCausalLM.from_config(config)
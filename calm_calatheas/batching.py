@@ -0,0 +1,104 @@
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from queue import Empty, SimpleQueue
+from threading import Thread
+from typing import Any
+
+from .cancellation import CancellationToken, GenerationCancelledError
+from .logger import LOGGER
+from .metrics import QUEUE_DEPTH
+
+
+@dataclass
+class _Request[T, R]:
+    """A single item waiting to be processed as part of a batch."""
+
+    item: T
+    future: Future[R] = field(default_factory=Future)
+
+
+class BatchScheduler[T, R]:
+    """
+    Collect concurrent requests and process them together as a single batch.
+
+    Requests are submitted from any number of threads. A dedicated scheduler thread waits for the first request, then
+    keeps collecting requests until either the batch is full or the batching window has passed. The whole batch is then
+    processed with a single call, and the results are handed back to each caller.
+    """
+
+    def __init__(self, process_batch: Callable[[list[T]], list[R]], max_batch_size: int, window: float) -> None:
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._window = window
+
+        self._start()
+
+        # Threads do not survive a fork, so every server worker starts its own scheduler thread
+        os.register_at_fork(after_in_child=self._start)
+
+    def submit(self, item: T, cancellation: CancellationToken | None = None) -> R:
+        """
+        Submit an item for processing and block until its result is available.
+
+        If the given token is cancelled first, stop waiting for the result. The item is still processed, so whatever
+        processes the batch should check the token as well.
+
+        Raises:
+            GenerationCancelledError: If the token is cancelled before the result is available.
+        """
+        request = _Request[T, R](item)
+        self._queue.put(request)
+        QUEUE_DEPTH.set(self._queue.qsize(), queue="batch")
+
+        if cancellation:
+            cancelled = Future[None]()
+            cancellation.on_cancel(lambda: cancelled.set_result(None))
+
+            futures: list[Future[Any]] = [request.future, cancelled]
+            wait(futures, return_when=FIRST_COMPLETED)
+
+            if not request.future.done():
+                raise GenerationCancelledError
+
+        return request.future.result()
+
+    def _collect(self) -> list[_Request[T, R]]:
+        """Wait for the first request, then collect more requests until the batch is full or the window has passed."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._window
+
+        while len(batch) < self._max_batch_size and (timeout := deadline - time.monotonic()) > 0:
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Empty:
+                break
+
+        return batch
+
+    def _start(self) -> None:
+        """Start the scheduler thread, with an empty queue."""
+        self._queue = SimpleQueue[_Request[T, R]]()
+
+        self._thread = Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        """Process batches of requests until the process exits."""
+        while True:
+            batch = self._collect()
+
+            QUEUE_DEPTH.set(self._queue.qsize(), queue="batch")
+
+            LOGGER.debug("Processing a batch of %d request(s)", len(batch))
+
+            try:
+                results = self._process_batch([request.item for request in batch])
+            except Exception as e:  # noqa: BLE001
+                for request in batch:
+                    request.future.set_exception(e)
+            else:
+                for request, result in zip(batch, results, strict=True):
+                    request.future.set_result(result)
@@ -0,0 +1,292 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, get_args
+
+import torch
+from pydantic import ValidationError
+
+from .settings import GenerationProfile, Settings, settings
+
+BACKENDS = get_args(Settings.model_fields["inference_backend"].annotation)
+
+# Captions like the ones the captioning model produces in the browser. Some of them are repeated, or differ only in
+# wording, as they do when several users upload pictures of the same thing.
+CAPTIONS = [
+    "a cat sitting on a couch",
+    "a dog running in a park",
+    "a bird sitting on a tree branch",
+    "a red car parked on the side of a street",
+    "a plate of food on a wooden table",
+    "a person riding a bike down a hill",
+    "a cat sitting on a couch",
+    "a cat sitting on the couch",
+    "a dog running through a park",
+    "a plate of food on a wooden table",
+]
+
+
+def compare_backends(backends: list[str], max_new_tokens: int) -> list[dict[str, Any]]:
+    """Benchmark each of the given inference backends in a separate process, so that memory use is measured apart."""
+    results = []
+
+    for backend in backends:
+        process = subprocess.run(  # noqa: S603
+            [sys.executable, "-m", __spec__.name, "backends", "--run", "--max-new-tokens", str(max_new_tokens)],
+            capture_output=True,
+            check=True,
+            env={**os.environ, "INFERENCE_BACKEND": backend},
+            text=True,
+        )
+
+        results.append(json.loads(process.stdout))
+
+    return results
+
+
+def compare_tokenization(repeat: int) -> dict[str, Any]:
+    """
+    Measure how long it takes to turn a caption into the token ids of its prompt.
+
+    Each prompt is either rendered with the chat template and tokenized in full, as it was before the template cache,
+    or put together from the token ids cached for the template and the tokenized caption. Both ways must give the same
+    token ids.
+    """
+    model = importlib.import_module(".model", __package__)
+    conversations = [
+        [{"role": "system", "content": model.DESCRIPTION_PROMPT}, {"role": "user", "content": caption}]
+        for caption in CAPTIONS
+    ]
+
+    def render_and_tokenize() -> list[list[int]]:
+        texts = [
+            model.TOKENIZER.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True,
+                enable_thinking=True,
+            )
+            for messages in conversations
+        ]
+        return model.TOKENIZER(texts).input_ids
+
+    def encode() -> list[list[int]]:
+        return model.TEMPLATES.encode(conversations, [True] * len(conversations))
+
+    results: dict[str, Any] = {"identical": render_and_tokenize() == encode()}
+
+    for name, tokenize in (("full", render_and_tokenize), ("cached", encode)):
+        started_at = time.perf_counter()
+
+        for _ in range(repeat):
+            tokenize()
+
+        results[f"{name}_microseconds_per_prompt"] = (time.perf_counter() - started_at) / repeat / len(CAPTIONS) * 1e6
+
+    return results
+
+
+def replay(captions: list[str], concurrency: int, profile: GenerationProfile) -> dict[str, Any]:
+    """
+    Generate a description for each of the given captions and measure the performance of the description pipeline.
+
+    The captions are sent by the given number of concurrent clients, so that they are batched as they would be by the
+    server. Descriptions go through the cache and the repair step, exactly as they do when the server handles them.
+    """
+    model = importlib.import_module(".model", __package__)
+
+    def describe(caption: str) -> tuple[float, bool]:
+        started_at = time.perf_counter()
+
+        try:
+            model.generate_description(caption, profile)
+        except ValidationError:
+            succeeded = False
+        else:
+            succeeded = True
+
+        return time.perf_counter() - started_at, succeeded
+
+    stats_before = model.STATS.snapshot()
+    started_at = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(describe, captions))
+
+    elapsed = time.perf_counter() - started_at
+    stats = {name: value - stats_before[name] for name, value in model.STATS.snapshot().items()}
+    latencies = sorted(latency for latency, _ in results)
+
+    return {
+        "backend": settings.inference_backend,
+        "cache_hit_rate": model.CACHE.hit_rate,
+        "captions": len(captions),
+        "concurrency": concurrency,
+        "decode_tokens_per_second": _rate(stats["decode_tokens"], stats["decode_seconds"]),
+        "descriptions_per_second": _rate(len(captions), elapsed),
+        "draft_acceptance_rate": (
+            stats["draft_accepted_tokens"] / stats["draft_proposed_tokens"] if stats["draft_proposed_tokens"] else None
+        ),
+        "draft_model": settings.draft_model_name,
+        "failures": sum(not succeeded for _, succeeded in results),
+        "generations": stats["generations"],
+        "latency_seconds": {f"p{q}": _percentile(latencies, q) for q in (50, 95, 99)},
+        "model": model.MODEL_NAME,
+        "peak_cuda_bytes": torch.cuda.max_memory_allocated() if torch.cuda.is_available() else None,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "prefill_tokens_per_second": _rate(stats["prefill_tokens"], stats["prefill_seconds"]),
+        "random_weights": settings.model_random_weights,
+        "repair_rate": stats["repairs"] / len(captions),
+    }
+
+
+def run_backend(max_new_tokens: int) -> dict[str, Any]:
+    """
+    Benchmark the inference backend in the application settings.
+
+    Every caption is run through the model on its own, and the model has to generate exactly the given number of
+    tokens for each of them, so that the results of different backends can be compared.
+    """
+    model = importlib.import_module(".model", __package__)
+    profile = GenerationProfile(thinking=False)
+
+    def generate(caption: str) -> int:
+        model_inputs = model.prepare_inputs([caption], profile)
+        output_ids = model.MODEL.generate(
+            **model_inputs,
+            do_sample=False,
+            max_new_tokens=max_new_tokens,
+            min_new_tokens=max_new_tokens,
+        )
+        return output_ids.shape[1] - model_inputs["input_ids"].shape[1]
+
+    # Leave one-time costs, such as compiling the model, out of the measurement
+    generate(CAPTIONS[0])
+
+    started_at = time.perf_counter()
+    generated_tokens = sum(generate(caption) for caption in CAPTIONS)
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "backend": settings.inference_backend,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "tokens_per_second": generated_tokens / elapsed,
+    }
+
+
+def _peak_rss_bytes() -> int:
+    """Return the peak resident memory of this process in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    """Return the given percentile of the sorted values, using the nearest rank."""
+    if not values:
+        return None
+
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+def _rate(count: float, seconds: float) -> float | None:
+    """Return the number of things per second, if any time was spent on them."""
+    return count / seconds if seconds else None
+
+
+def _backends(args: argparse.Namespace) -> None:
+    """Compare the throughput and memory use of the inference backends."""
+    # Each backend is benchmarked in a child process, which reports its results as JSON
+    if args.run:
+        print(json.dumps(run_backend(args.max_new_tokens)))  # noqa: T201
+        return
+
+    print(f"{'Backend':<10}{'Tokens/s':>12}{'Peak RSS (MiB)':>18}")  # noqa: T201
+
+    for result in compare_backends(args.backend or list(BACKENDS), args.max_new_tokens):
+        print(  # noqa: T201
+            f"{result['backend']:<10}{result['tokens_per_second']:>12.1f}{result['peak_rss_bytes'] / 2**20:>18.0f}",
+        )
+
+
+def _tokenization(args: argparse.Namespace) -> None:
+    """Compare the time it takes to tokenize a prompt in full, and with the chat template cache."""
+    result = compare_tokenization(args.repeat)
+
+    print(f"{'Tokenization':<14}{'Microseconds per prompt':>26}")  # noqa: T201
+    print(f"{'full':<14}{result['full_microseconds_per_prompt']:>26.1f}")  # noqa: T201
+    print(f"{'cached':<14}{result['cached_microseconds_per_prompt']:>26.1f}")  # noqa: T201
+
+    if not result["identical"]:
+        print("The cached token ids differ from the token ids of the full prompts")  # noqa: T201
+        sys.exit(1)
+
+
+def _pipeline(args: argparse.Namespace) -> None:
+    """Replay a corpus of captions through the description pipeline and report the results as JSON."""
+    if args.model:
+        settings.model_name = args.model
+
+    if args.draft_model:
+        settings.draft_model_name = args.draft_model
+
+    if args.random_weights:
+        settings.model_random_weights = True
+
+    # Results should not depend on what earlier runs left in the cache
+    settings.cache_backend = "memory"
+
+    captions = Path(args.corpus).read_text().splitlines() if args.corpus else CAPTIONS
+    captions = [caption.strip() for caption in captions if caption.strip()] * args.repeat
+
+    result = replay(captions, args.concurrency, settings.get_generation_profile(args.profile))
+    output = json.dumps({**result, "profile": args.profile or settings.generation_profile}, indent=2, sort_keys=True)
+
+    if args.output:
+        Path(args.output).write_text(f"{output}\n")
+    else:
+        print(output)  # noqa: T201
+
+
+def main() -> None:
+    """Benchmark the description pipeline, compare the inference backends, or measure the cost of tokenization."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    subparsers = parser.add_subparsers(required=True)
+
+    pipeline = subparsers.add_parser("pipeline", description=_pipeline.__doc__, help="Benchmark the pipeline")
+    pipeline.add_argument("--concurrency", default=1, type=int, help="Number of captions to describe at once")
+    pipeline.add_argument("--corpus", help="File with one caption per line, defaults to a built-in corpus")
+    pipeline.add_argument("--draft-model", help="Name or path of a draft model to use for speculative decoding")
+    pipeline.add_argument("--model", help="Name or path of the model, defaults to the model in the settings")
+    pipeline.add_argument("--output", help="File to write the results to, defaults to standard output")
+    pipeline.add_argument("--profile", choices=list(settings.generation_profiles), help="Generation profile to use")
+    pipeline.add_argument("--random-weights", action="store_true", help="Use a small model with random weights")
+    pipeline.add_argument("--repeat", default=1, type=int, help="Number of times to replay the corpus")
+    pipeline.set_defaults(command=_pipeline)
+
+    backends = subparsers.add_parser("backends", description=_backends.__doc__, help="Compare the inference backends")
+    backends.add_argument("--backend", action="append", choices=BACKENDS, help="Backend to benchmark, defaults to all")
+    backends.add_argument("--max-new-tokens", default=64, type=int, help="Number of tokens to generate per caption")
+    backends.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    backends.set_defaults(command=_backends)
+
+    tokenization = subparsers.add_parser(
+        "tokenization",
+        description=_tokenization.__doc__,
+        help="Compare tokenizing prompts in full and with the chat template cache",
+    )
+    tokenization.add_argument("--repeat", default=100, type=int, help="Number of times to tokenize the corpus")
+    tokenization.set_defaults(command=_tokenization)
+
+    args = parser.parse_args()
+    args.command(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import time
+from typing import override
+
+import torch
+from transformers import LogitsProcessor
+
+from .settings import GenerationProfile
+
+
+def max_new_tokens(profile: GenerationProfile) -> int:
+    """Return the largest number of tokens a generation with the given profile can produce."""
+    thinking_tokens = profile.thinking_budget + 1 if profile.thinking else 0
+    return thinking_tokens + profile.max_content_tokens
+
+
+class GenerationBudgetLogitsProcessor(LogitsProcessor):
+    """
+    Keep each sequence in a batch within the budget of its generation profile.
+
+    A sequence that runs out of thinking tokens, or is still thinking when the deadline passes, is made to stop
+    thinking so that it writes its answer. A sequence that runs out of content tokens is ended. This must be the last
+    logits processor, so that no other processor can overrule it.
+    """
+
+    def __init__(self, profiles: list[GenerationProfile], think_end_token_id: int, eos_token_ids: list[int]) -> None:
+        self._eos_token_id = eos_token_ids[0]
+        self._profiles = profiles
+        self._prompt_length: int | None = None
+        self._started_at = time.monotonic()
+        self._think_end_token_id = think_end_token_id
+
+    @override
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prompt_length is None:
+            self._prompt_length = input_ids.shape[1]
+
+        generated = input_ids[:, self._prompt_length :]
+        length = generated.shape[1]
+
+        # The content starts after the end of the thinking content, or at the start if the model does not think
+        content_start = [-1] * len(self._profiles)
+
+        if length:
+            is_think_end = generated == self._think_end_token_id
+            content_start = torch.where(is_think_end.any(dim=1), is_think_end.int().argmax(dim=1) + 1, -1).tolist()
+
+        elapsed = time.monotonic() - self._started_at
+
+        for row, profile in enumerate(self._profiles):
+            if not profile.thinking:
+                content_start[row] = 0
+
+            if content_start[row] >= 0:
+                if length - content_start[row] >= profile.max_content_tokens:
+                    self._force(scores, row, self._eos_token_id)
+            elif length >= profile.thinking_budget or (profile.deadline is not None and elapsed >= profile.deadline):
+                self._force(scores, row, self._think_end_token_id)
+
+        return scores
+
+    @staticmethod
+    def _force(scores: torch.FloatTensor, row: int, token: int) -> None:
+        """Make the given token the only possible next token for the given row."""
+        scores[row] = float("-inf")
+        scores[row, token] = 0
@@ -0,0 +1,89 @@
+import asyncio
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from .cancellation import CancellationToken
+from .executor import executor
+from .loader import loader
+from .logger import LOGGER
+from .settings import GenerationProfile, settings
+
+# Shared by every bulk request, so that bulk requests together never take every inference worker
+_SEMAPHORE = asyncio.Semaphore(min(settings.bulk_concurrency, max(settings.inference_workers - 1, 1)))
+
+if settings.inference_workers == 1:
+    LOGGER.warning("Bulk requests can take the only inference worker, use more inference workers to keep one free")
+
+
+class BulkRequest(BaseModel):
+    """The body of a request to describe many captions at once."""
+
+    profile: str | None = Field(
+        default=None,
+        description="Name of the generation profile to use, defaults to the default generation profile",
+    )
+
+    prompts: list[str] = Field(
+        description="The captions to generate descriptions for",
+        max_length=settings.bulk_max_prompts,
+        min_length=1,
+    )
+
+
+async def describe_all(
+    prompts: list[str],
+    profile: GenerationProfile,
+    cancellation: CancellationToken,
+) -> AsyncGenerator[dict[str, Any]]:
+    """
+    Generate a description for each of the prompts, and yield the results in the order they finish.
+
+    Each result holds the index and the prompt it belongs to, and either the description or the reason it could not
+    be generated, so that a single bad prompt does not fail the others. Only a few prompts of all bulk requests
+    together are handed to the inference workers at a time, and at least one worker is always left free, so that other
+    requests still get a turn, unless there is only a single worker. Cached descriptions are returned right away,
+    without waiting for a turn.
+
+    If the caller stops consuming the results, the given token is cancelled, and the model stops generating the
+    descriptions that are still in progress.
+    """
+
+    async def describe(index: int, prompt: str) -> dict[str, Any]:
+        result: dict[str, Any] = {"index": index, "prompt": prompt}
+
+        if not prompt.strip():
+            return result | {"error": "Missing prompt"}
+
+        if cached := await run_in_threadpool(loader.model.find_cached_description, prompt, profile):
+            return result | {"description": cached.model_dump(mode="json")}
+
+        async with _SEMAPHORE:
+            generation = await executor.submit_when_available(
+                loader.model.generate_description,
+                prompt,
+                profile,
+                cancellation,
+            )
+
+            try:
+                description = await generation
+            except Exception as e:  # noqa: BLE001
+                LOGGER.warning('Failed to describe prompt %d: "%s"', index, prompt, exc_info=e)
+                return result | {"error": str(e)}
+
+        return result | {"description": description.model_dump(mode="json")}
+
+    tasks = [asyncio.create_task(describe(index, prompt)) for index, prompt in enumerate(prompts)]
+
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        if not all(task.done() for task in tasks):
+            cancellation.cancel()
+
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,316 @@
+import hashlib
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+from threading import Lock
+from typing import override
+
+from .logger import LOGGER
+from .metrics import CACHE_LOOKUPS
+from .settings import GenerationProfile, settings
+from .similarity import SimilarityIndex, canonicalize
+
+
+class DescriptionCache(ABC):
+    """
+    Base class for caches of generated descriptions.
+
+    Entries are keyed on the canonical form of the caption, the generation profile and a namespace. The namespace
+    should identify everything else that affects the generated description, such as the model and the prompts, so that
+    a change to either invalidates the existing entries.
+
+    If a similarity index is given, a caption that misses the cache can still reuse the entry of a near-identical
+    caption. Only captions of entries in the same namespace are added to the index, and they are removed from it again
+    once their entries expire or are evicted.
+    """
+
+    def __init__(self, namespace: str, index: SimilarityIndex | None = None) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.namespace = namespace
+        self.similar_hits = 0
+
+        self._counter_lock = Lock()
+        self._index = index
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were served from the cache, including lookups served by a similar caption."""
+        lookups = self.hits + self.similar_hits + self.misses
+        return (self.hits + self.similar_hits) / lookups if lookups else 0.0
+
+    def get(self, caption: str, profile: GenerationProfile) -> str | None:
+        """Return the cached value for the given caption and profile, or for a near-identical caption, if any."""
+        canonical = canonicalize(caption)
+
+        if (value := self._get(self._key(canonical, profile))) is not None:
+            self._count("hits")
+            return value
+
+        if (
+            self._index
+            and (similar := self._index.find(canonical))
+            and (value := self._get(self._key(similar, profile)))
+        ):
+            LOGGER.debug('Reusing the cached description for similar caption "%s"', similar)
+            self._count("similar_hits")
+            return value
+
+        self._count("misses")
+        return None
+
+    def load_index(self) -> None:
+        """Add the captions of all entries currently in the cache to the similarity index."""
+        if not self._index:
+            return
+
+        for caption in self._captions():
+            self._index.add(caption)
+
+    def set(self, caption: str, profile: GenerationProfile, value: str) -> None:
+        """Store the given value for the given caption and profile."""
+        canonical = canonicalize(caption)
+
+        self._set(self._key(canonical, profile), canonical, value)
+
+        if self._index:
+            self._index.add(canonical)
+
+    def _captions(self) -> list[str]:
+        """Return the canonical captions of all entries in the namespace that are currently in the cache."""
+        return []
+
+    def _count(self, counter: str) -> None:
+        """Increment the given counter, and the matching cache lookup metric."""
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+        CACHE_LOOKUPS.inc(result=counter)
+
+    def _forget(self, captions: Iterable[str]) -> None:
+        """Remove the canonical captions of entries that have expired or were evicted from the similarity index."""
+        if not self._index:
+            return
+
+        for caption in captions:
+            self._index.discard(caption)
+
+    @abstractmethod
+    def _get(self, key: str) -> str | None:
+        """Return the value stored under the given key, if any."""
+
+    @abstractmethod
+    def _set(self, key: str, caption: str, value: str) -> None:
+        """Store the given value under the given key."""
+
+    def _key(self, canonical: str, profile: GenerationProfile) -> str:
+        """Build the cache key for the given canonical caption and profile."""
+        return hashlib.sha256(f"{self.namespace}\0{profile.model_dump_json()}\0{canonical}".encode()).hexdigest()
+
+
+class MemoryCache(DescriptionCache):
+    """A cache that keeps entries in memory, evicting the least recently used entries once it exceeds its budget."""
+
+    def __init__(self, namespace: str, max_bytes: int, ttl: float, index: SimilarityIndex | None = None) -> None:
+        super().__init__(namespace, index)
+
+        self._entries = OrderedDict[str, tuple[str, str, float]]()
+        self._lock = Lock()
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._ttl = ttl
+
+    @override
+    def _captions(self) -> list[str]:
+        with self._lock:
+            return [caption for caption, _, _ in self._entries.values()]
+
+    @override
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            if not (entry := self._entries.get(key)):
+                return None
+
+            caption, value, created_at = entry
+
+            if time.time() - created_at > self._ttl:
+                self._remove(key)
+                self._forget([caption])
+                return None
+
+            self._entries.move_to_end(key)
+
+            return value
+
+    @override
+    def _set(self, key: str, caption: str, value: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (caption, value, time.time())
+            self._size += len(value)
+
+            while self._size > self._max_bytes:
+                self._forget([self._remove(next(iter(self._entries)))])
+
+    def _remove(self, key: str) -> str:
+        """Remove the entry with the given key and return its caption. The caller must hold the lock."""
+        caption, value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+        return caption
+
+
+class NullCache(DescriptionCache):
+    """A cache that never stores anything."""
+
+    @override
+    def _get(self, key: str) -> str | None:
+        return None
+
+    @override
+    def _set(self, key: str, caption: str, value: str) -> None:
+        return
+
+
+class SqliteCache(DescriptionCache):
+    """
+    A cache that keeps entries in an SQLite database on disk.
+
+    The database survives restarts and can be shared by multiple processes. Entries expire after the given time to
+    live, and the least recently used entries are evicted once the total size of the stored values exceeds the budget.
+
+    Each process only removes the entries that it expires or evicts itself from its similarity index. A caption that
+    another process removed stays in the index, but a match on it simply misses the cache.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        path: str,
+        max_bytes: int,
+        ttl: float,
+        index: SimilarityIndex | None = None,
+    ) -> None:
+        super().__init__(namespace, index)
+
+        self._lock = Lock()
+        self._max_bytes = max_bytes
+        self._path = path
+        self._ttl = ttl
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._connect()
+
+        # A connection must not be used across a fork, so every server worker opens its own
+        os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self) -> None:
+        """Open the connection to the database, and create the table if it does not exist yet."""
+        self._connection = sqlite3.connect(self._path, check_same_thread=False, timeout=30)
+
+        # Write-ahead logging lets readers in other processes proceed while an entry is being written
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                key TEXT PRIMARY KEY,
+                caption TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                namespace TEXT NOT NULL DEFAULT ''
+            )
+            """,
+        )
+
+        # Databases created before entries were tagged with their namespace lack the column
+        columns = {name for _, name, *_ in self._connection.execute("PRAGMA table_info(descriptions)")}
+
+        if "namespace" not in columns:
+            self._connection.execute("ALTER TABLE descriptions ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+
+        self._connection.execute("CREATE INDEX IF NOT EXISTS descriptions_accessed_at ON descriptions (accessed_at)")
+
+    @override
+    def _captions(self) -> list[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT caption FROM descriptions WHERE namespace = ? AND created_at > ?",
+                (self.namespace, time.time() - self._ttl),
+            )
+
+            return [caption for (caption,) in rows]
+
+    @override
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM descriptions WHERE key = ? AND created_at > ?",
+                (key, now - self._ttl),
+            ).fetchone()
+
+            if row:
+                self._connection.execute("UPDATE descriptions SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return row[0] if row else None
+
+    @override
+    def _set(self, key: str, caption: str, value: str) -> None:
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, caption, value, len(value), now, now, self.namespace),
+            )
+
+            expired = self._connection.execute(
+                "DELETE FROM descriptions WHERE created_at <= ? RETURNING caption, namespace",
+                (now - self._ttl,),
+            ).fetchall()
+
+            # Keep the most recently used entries that fit within the budget, and evict the rest
+            evicted = self._connection.execute(
+                """
+                DELETE FROM descriptions WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS total FROM descriptions
+                    )
+                    WHERE total > ?
+                )
+                RETURNING caption, namespace
+                """,
+                (self._max_bytes,),
+            ).fetchall()
+
+        self._forget(caption for caption, namespace in expired + evicted if namespace == self.namespace)
+
+        if evicted:
+            LOGGER.debug("Evicted %d description(s) from the cache", len(evicted))
+
+
+def create_cache(namespace: str) -> DescriptionCache:
+    """Create a description cache based on the application settings."""
+    index = SimilarityIndex(settings.similarity_threshold) if settings.similarity_index else None
+
+    match settings.cache_backend:
+        case "memory":
+            cache = MemoryCache(namespace, settings.cache_max_bytes, settings.cache_ttl, index)
+        case "sqlite":
+            cache = SqliteCache(namespace, settings.cache_path, settings.cache_max_bytes, settings.cache_ttl, index)
+        case "none":
+            cache = NullCache(namespace)
+
+    cache.load_index()
+
+    return cache
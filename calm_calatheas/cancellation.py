@@ -0,0 +1,59 @@
+from collections.abc import Callable
+from threading import Lock
+
+
+class GenerationCancelledError(Exception):
+    """Error raised when a generation is cancelled before it has finished."""
+
+    def __init__(self) -> None:
+        super().__init__("The generation was cancelled.")
+
+
+class CancellationToken:
+    """
+    A flag that tells a generation to stop, because nobody is waiting for the result anymore.
+
+    A token can be cancelled from any thread. Callbacks registered with `on_cancel` run once, on the thread that
+    cancels the token, or right away if the token has already been cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._callbacks: list[Callable[[], None]] = []
+        self._cancelled = False
+        self._lock = Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the token has been cancelled."""
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Cancel the token, unless it has already been cancelled."""
+        with self._lock:
+            if self._cancelled:
+                return
+
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Call the given function once the token is cancelled."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+
+        callback()
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raise an error if the token has been cancelled.
+
+        Raises:
+            GenerationCancelledError: If the token has been cancelled.
+        """
+        if self._cancelled:
+            raise GenerationCancelledError
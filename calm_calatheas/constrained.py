@@ -0,0 +1,377 @@
+import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import permutations, product
+from typing import Any, Literal, override
+
+import torch
+from transformers import LogitsProcessor, PreTrainedTokenizer, PreTrainedTokenizerFast
+
+type FreeKind = Literal["number", "string"]
+
+# Limits that keep the compiled grammar small, and keep a runaway generation from going on forever
+MAX_CHOICES = 10_000
+MAX_NUMBER_LENGTH = 12
+MAX_STRING_LENGTH = 255
+
+_NUMBER = re.compile(r"(0|[1-9][0-9]*)(\.[0-9]+)?")
+_NUMBER_CHARACTERS = frozenset("0123456789.")
+_NUMBER_PREFIX = re.compile(r"((0|[1-9][0-9]*)(\.[0-9]*)?)?")
+
+
+class UnsupportedSchemaError(Exception):
+    """Error raised when a JSON schema uses features that constrained decoding does not support."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"Unsupported JSON schema: {reason}")
+
+
+@dataclass(frozen=True)
+class _Choice:
+    """A segment of the output that must be exactly one of a finite set of strings."""
+
+    options: frozenset[str]
+
+
+@dataclass(frozen=True)
+class _Free:
+    """A segment of the output that can be any JSON string content or number, up to a maximum length."""
+
+    kind: FreeKind
+    max_length: int
+
+
+@dataclass(frozen=True)
+class _State:
+    """The position of a single sequence in the grammar."""
+
+    active: bool = True
+    done: bool = False
+    segment: int = 0
+    text: str = ""
+
+
+def _is_string_character(character: str) -> bool:
+    """Whether the given character can appear unescaped in a JSON string."""
+    return character not in '"\\' and ord(character) >= 0x20  # noqa: PLR2004
+
+
+def _is_number_prefix(text: str, max_length: int) -> bool:
+    """Whether the given text can still be completed to a number without going over the maximum length."""
+    if len(text) > max_length or not _NUMBER_PREFIX.fullmatch(text):
+        return False
+
+    return bool(_NUMBER.fullmatch(text)) or len(text) < max_length
+
+
+def _split(text: str, kind: FreeKind) -> tuple[str, str]:
+    """Split the given text into the part that is valid content for a free segment of the given kind, and the rest."""
+    for index, character in enumerate(text):
+        if not (_is_string_character(character) if kind == "string" else character in _NUMBER_CHARACTERS):
+            return text[:index], text[index:]
+
+    return text, ""
+
+
+class JsonSchemaGrammar:
+    """
+    A JSON schema compiled into a grammar over the vocabulary of a tokenizer.
+
+    The output is split into segments. Choice segments cover everything that is fixed or picked from a small set, such
+    as punctuation, property names, enum values and arrays of enum values. Free segments cover string contents and
+    numbers. Objects are generated with their properties in schema order, so every valid output matches the schema.
+    """
+
+    def __init__(self, schema: dict[str, Any], tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast) -> None:
+        self.segments = _compile(schema)
+
+        # Work out what text each token contributes to the output. Added tokens never appear in the JSON output
+        excluded = set(tokenizer.get_added_vocab().values())
+        texts = tokenizer.batch_decode(
+            [[index] for index in range(len(tokenizer))],
+            clean_up_tokenization_spaces=False,
+        )
+
+        self.texts: list[str | None] = [
+            None if index in excluded or not text or "�" in text else text for index, text in enumerate(texts)
+        ]
+
+        self._choice_masks: dict[tuple[int, str], torch.Tensor] = {}
+        self._ids_by_text = defaultdict[str, list[int]](list)
+        self._number_tokens: list[tuple[int, str]] = []
+        self._string_lengths = torch.full((len(self.texts),), -1)
+
+        splits: dict[FreeKind, list[tuple[int, str, str]]] = {"number": [], "string": []}
+
+        for index, text in enumerate(self.texts):
+            if text is None:
+                continue
+
+            self._ids_by_text[text].append(index)
+
+            for kind, kind_splits in splits.items():
+                content, rest = _split(text, kind)
+                kind_splits.append((index, content, rest))
+
+                if rest:
+                    continue
+
+                if kind == "string":
+                    self._string_lengths[index] = len(text)
+                else:
+                    self._number_tokens.append((index, text))
+
+        # For each free segment, find the tokens that end it and continue into the choice segment that follows
+        self._exits: dict[int, list[tuple[int, str]]] = {}
+
+        for index, segment in enumerate(self.segments):
+            if not isinstance(segment, _Free):
+                continue
+
+            following = self.segments[index + 1]
+
+            if not isinstance(following, _Choice):
+                reason = "free segments must be followed by a fixed segment"
+                raise UnsupportedSchemaError(reason)
+
+            prefixes = {option[:end] for option in following.options for end in range(1, len(option) + 1)}
+
+            self._exits[index] = [
+                (token, content) for token, content, rest in splits[segment.kind] if rest in prefixes
+            ]
+
+    def allowed(self, state: _State, eos_token_ids: list[int]) -> torch.Tensor:
+        """Return a mask of the tokens that are allowed in the given state."""
+        if state.done:
+            mask = torch.zeros(len(self.texts), dtype=torch.bool)
+            mask[eos_token_ids] = True
+            return mask
+
+        segment = self.segments[state.segment]
+
+        if isinstance(segment, _Choice):
+            return self._choice_mask(state.segment, state.text)
+
+        remaining = segment.max_length - len(state.text)
+
+        if segment.kind == "string":
+            mask = (self._string_lengths >= 1) & (self._string_lengths <= remaining)
+            exits = [token for token, content in self._exits[state.segment] if len(content) <= remaining]
+        else:
+            mask = torch.zeros(len(self.texts), dtype=torch.bool)
+            mask[
+                [
+                    token
+                    for token, text in self._number_tokens
+                    if _is_number_prefix(state.text + text, segment.max_length)
+                ]
+            ] = True
+            exits = [
+                token
+                for token, content in self._exits[state.segment]
+                if len(content) <= remaining and _NUMBER.fullmatch(state.text + content)
+            ]
+
+        mask[exits] = True
+
+        return mask
+
+    def step(self, state: _State, token: int, start_token_id: int | None) -> _State:
+        """Return the state after the given token has been generated."""
+        if state.done:
+            return state
+
+        if not state.active:
+            return _State() if token == start_token_id else state
+
+        if (text := self.texts[token]) is None:
+            # Only the end of sequence token can get here, generation stops after it
+            return _State(done=True)
+
+        segment = self.segments[state.segment]
+
+        if isinstance(segment, _Free):
+            content, rest = _split(text, segment.kind)
+
+            if not rest:
+                return _State(segment=state.segment, text=state.text + content)
+
+            return self._step_choice(state.segment + 1, rest)
+
+        return self._step_choice(state.segment, state.text + text)
+
+    def _choice_mask(self, segment: int, text: str) -> torch.Tensor:
+        """Return a mask of the tokens that extend the given text towards one of the options of a choice segment."""
+        if (mask := self._choice_masks.get((segment, text))) is not None:
+            return mask
+
+        options = self.segments[segment].options  # type: ignore[segment is a choice]
+
+        prefixes = {
+            option[len(text) : end]
+            for option in options
+            if option.startswith(text)
+            for end in range(len(text) + 1, len(option) + 1)
+        }
+
+        mask = torch.zeros(len(self.texts), dtype=torch.bool)
+        mask[[token for prefix in prefixes for token in self._ids_by_text.get(prefix, ())]] = True
+
+        self._choice_masks[(segment, text)] = mask
+
+        return mask
+
+    def _step_choice(self, segment: int, text: str) -> _State:
+        """Return the state after the given text has been generated in a choice segment."""
+        if text not in self.segments[segment].options:  # type: ignore[segment is a choice]
+            return _State(segment=segment, text=text)
+
+        if segment + 1 == len(self.segments):
+            return _State(done=True)
+
+        return _State(segment=segment + 1)
+
+
+class JsonSchemaLogitsProcessor(LogitsProcessor):
+    """
+    Only allow tokens that keep the generated output valid according to a JSON schema.
+
+    If a start token is given for a sequence, its output is left unconstrained until that token has been generated.
+    This lets the model think freely before it writes its answer. Once the output is complete, only the end of sequence
+    tokens are allowed.
+    """
+
+    def __init__(
+        self,
+        grammar: JsonSchemaGrammar,
+        eos_token_ids: list[int],
+        start_token_ids: list[int | None],
+    ) -> None:
+        self._eos_token_ids = eos_token_ids
+        self._generated: torch.Tensor | None = None
+        self._grammar = grammar
+        self._prompt_length: int | None = None
+        self._start_token_ids = start_token_ids
+
+        # For each sequence, the state before and after each generated token
+        self._states: list[list[_State]] = []
+
+    @override
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prompt_length is None:
+            self._prompt_length = input_ids.shape[1]
+            self._states = [[_State(active=start_token_id is None)] for start_token_id in self._start_token_ids]
+
+        vocabulary_size = len(self._grammar.texts)
+
+        for row, state in enumerate(self._advance(input_ids[:, self._prompt_length :])):
+            if not state.active:
+                continue
+
+            # The model may have more outputs than the tokenizer has tokens, those are never allowed
+            allowed = torch.zeros(scores.shape[1], dtype=torch.bool)
+            allowed[:vocabulary_size] = self._grammar.allowed(state, self._eos_token_ids)
+
+            scores[row] = scores[row].masked_fill(~allowed.to(scores.device), float("-inf"))
+
+        return scores
+
+    def _advance(self, generated: torch.Tensor) -> list[_State]:
+        """
+        Bring the state of each sequence up to date with the generated tokens, and return the current states.
+
+        Only tokens that are new since the previous call are processed. If a sequence no longer matches what was seen
+        before, for example because a speculative token was rejected, its states are rolled back first.
+        """
+        common = [0] * generated.shape[0]
+
+        if self._generated is not None and (overlap := min(self._generated.shape[1], generated.shape[1])):
+            mismatch = generated[:, :overlap] != self._generated[:, :overlap]
+            common = torch.where(mismatch.any(dim=1), mismatch.int().argmax(dim=1), overlap).tolist()
+
+        self._generated = generated
+
+        for row, (states, start_token_id) in enumerate(zip(self._states, self._start_token_ids, strict=True)):
+            del states[common[row] + 1 :]
+
+            for token in generated[row, common[row] :].tolist():
+                states.append(self._grammar.step(states[-1], token, start_token_id))
+
+        return [states[-1] for states in self._states]
+
+
+def _array_options(schema: dict[str, Any], prop: dict[str, Any]) -> set[str]:
+    """Return every valid JSON array for an array of enum values."""
+    items = _resolve(schema, prop.get("items", {}))
+
+    if "enum" not in items or "maxItems" not in prop:
+        reason = "arrays must contain enum values and have a maximum length"
+        raise UnsupportedSchemaError(reason)
+
+    values = [json.dumps(value) for value in items["enum"]]
+    combine = permutations if prop.get("uniqueItems") else lambda values, n: product(values, repeat=n)
+
+    return {
+        f"[{', '.join(sequence)}]"
+        for length in range(prop.get("minItems", 0), prop["maxItems"] + 1)
+        for sequence in combine(values, length)
+    }
+
+
+def _compile(schema: dict[str, Any]) -> list[_Choice | _Free]:
+    """Compile a JSON schema for an object into a list of segments."""
+    if schema.get("type") != "object":
+        reason = "the root must be an object"
+        raise UnsupportedSchemaError(reason)
+
+    pieces: list[set[str] | _Free] = [{"{"}]
+
+    for index, (name, value) in enumerate(schema.get("properties", {}).items()):
+        prop = _resolve(schema, value)
+
+        pieces.append({f"{', ' if index else ''}{json.dumps(name)}: "})
+
+        match prop.get("type"):
+            case "string" if "enum" in prop:
+                pieces.append({json.dumps(option) for option in prop["enum"]})
+            case "string":
+                max_length = min(prop.get("maxLength", MAX_STRING_LENGTH), MAX_STRING_LENGTH)
+                pieces.extend([{'"'}, _Free("string", max_length), {'"'}])
+            case "number":
+                pieces.append(_Free("number", MAX_NUMBER_LENGTH))
+            case "array":
+                pieces.append(_array_options(schema, prop))
+            case other:
+                reason = f"properties of type {other} are not supported"
+                raise UnsupportedSchemaError(reason)
+
+    pieces.append({"}"})
+
+    # Merge consecutive fixed pieces into a single choice segment
+    segments: list[set[str] | _Free] = []
+
+    for piece in pieces:
+        if isinstance(piece, set) and segments and isinstance(previous := segments[-1], set):
+            segments[-1] = {first + second for first in previous for second in piece}
+
+            if len(segments[-1]) > MAX_CHOICES:
+                reason = "too many possible values"
+                raise UnsupportedSchemaError(reason)
+        else:
+            segments.append(piece)
+
+    return [_Choice(frozenset(segment)) if isinstance(segment, set) else segment for segment in segments]
+
+
+def _resolve(schema: dict[str, Any], prop: dict[str, Any]) -> dict[str, Any]:
+    """Resolve a local reference in a JSON schema."""
+    if "$ref" not in prop:
+        return prop
+
+    target = schema
+
+    for key in prop["$ref"].removeprefix("#/").split("/"):
+        target = target[key]
+
+    return target
@@ -0,0 +1,117 @@
+import hashlib
+import json
+from enum import StrEnum, auto
+from typing import override
+
+from pydantic import BaseModel, Field
+
+from .settings import settings
+
+
+class PokemonType(StrEnum):
+    """An enumeration of Pokemon types."""
+
+    BUG = auto()
+    DARK = auto()
+    DRAGON = auto()
+    ELECTRIC = auto()
+    FAIRY = auto()
+    FIGHTING = auto()
+    FIRE = auto()
+    FLYING = auto()
+    GHOST = auto()
+    GRASS = auto()
+    GROUND = auto()
+    ICE = auto()
+    NORMAL = auto()
+    POISON = auto()
+    PSYCHIC = auto()
+    ROCK = auto()
+    STEEL = auto()
+    WATER = auto()
+
+    @classmethod
+    @override
+    def _missing_(cls, value: object) -> "PokemonType | None":
+        """
+        The model will sometimes generate types that don't match the enum exactly.
+
+        Try normalizing the input by converting it to lowercase.
+        """
+        if isinstance(value, str):
+            value = value.lower()
+
+        for member in cls:
+            if member.lower() == value:
+                return member
+
+        return None
+
+
+class PokemonDescription(BaseModel):
+    """A description of a Pokemon."""
+
+    ability: str = Field(
+        description="The primary ability of the Pokemon, which can affect its performance in battles.",
+    )
+
+    category: str = Field(
+        description="The category of the Pokemon, phrased as a noun.",
+    )
+
+    flavor_text: str = Field(
+        description="Flavor text to add characterization or lore to the Pokemon in question.",
+        max_length=255,
+    )
+
+    habitat: str = Field(
+        description="The natural habitat where the Pokemon can typically be found, phrased as a noun.",
+        max_length=15,
+    )
+
+    height: float = Field(
+        description="The height of the Pokemon in meters.",
+    )
+
+    name: str = Field(
+        description="The creative name for the Pokemon. Avoid using real names or actual Pokemon names.",
+    )
+
+    types: set[PokemonType] = Field(
+        description="The type(s) of the Pokemon.",
+        max_length=2,
+        min_length=1,
+    )
+
+    weight: float = Field(
+        description="The weight of the Pokemon in kilograms.",
+    )
+
+
+DESCRIPTION_PROMPT = f"""
+You are a helpful Pokemon professor.
+The user is a Pokemon trainer seeking information.
+The user will prompt you with a caption for a picture of a Pokemon.
+Answer using the following schema: {json.dumps(PokemonDescription.model_json_schema())}
+"""
+
+REPAIR_PROMPT = f"""
+You are a helpful Pokemon professor.
+The input is a Pokemon description and a validation error.
+The description needs to be repaired based on the error.
+Leave fields not mentioned in the error unchanged.
+Answer using the following schema: {json.dumps(PokemonDescription.model_json_schema())}
+"""
+
+# Changing the prompts changes the generated descriptions, so cached descriptions are tied to a version of the prompts
+PROMPT_VERSION = hashlib.sha256(f"{DESCRIPTION_PROMPT}{REPAIR_PROMPT}".encode()).hexdigest()[:12]
+
+
+def generation_namespace() -> str:
+    """
+    Return the namespace of the descriptions generated with the current settings.
+
+    Descriptions from different namespaces are never mixed up, since either the model or the prompts that produced them
+    differ. Descriptions generated with random weights should never be served by a model with the real weights.
+    """
+    return f"{settings.model_name}@{PROMPT_VERSION}{'@random' if settings.model_random_weights else ''}"
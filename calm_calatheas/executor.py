@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from functools import partial
+
+from .metrics import QUEUE_DEPTH
+from .settings import settings
+
+
+class QueueFullError(Exception):
+    """Error raised when the inference queue is full."""
+
+    def __init__(self) -> None:
+        super().__init__("Inference queue is full.")
+
+
+class InferenceExecutor:
+    """
+    A bounded worker pool for running blocking model inference off the event loop.
+
+    At most `max_workers` jobs run at the same time, and at most `max_queue_size` jobs wait for a free worker. Any job
+    submitted beyond that is rejected with a `QueueFullError`, so the server can shed load instead of piling up work.
+    """
+
+    def __init__(self, max_workers: int, max_queue_size: int) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._capacity = max_workers + max_queue_size
+        self._max_workers = max_workers
+        self._pending = 0
+        self._waiters = deque[asyncio.Future[None]]()
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs that are either running or waiting for a worker."""
+        return self._pending
+
+    async def run[**P, T](self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        """
+        Run the given function on the worker pool and wait for the result.
+
+        Raises:
+            QueueFullError: If the worker pool and queue are both at capacity.
+        """
+        return await self.submit(fn, *args, **kwargs)
+
+    def submit[**P, T](self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> asyncio.Future[T]:
+        """
+        Submit the given function to the worker pool and return a future for the result.
+
+        A slot in the worker pool is reserved immediately, so callers can find out whether the job was accepted before
+        they start waiting for it. The slot is only freed once the job has stopped running, even if the returned future
+        is cancelled before that.
+
+        Raises:
+            QueueFullError: If the worker pool and queue are both at capacity.
+        """
+        if self._pending >= self._capacity:
+            raise QueueFullError
+
+        # The counter is only touched from the event loop, so it does not need a lock
+        self._pending += 1
+        self._update_queue_depth()
+
+        loop = asyncio.get_running_loop()
+
+        job = self._executor.submit(partial(fn, *args, **kwargs))
+        job.add_done_callback(partial(self._release_from_thread, loop))
+
+        return asyncio.wrap_future(job, loop=loop)
+
+    async def submit_when_available[**P, T](
+        self,
+        fn: Callable[P, T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> asyncio.Future[T]:
+        """Submit the given function to the worker pool, waiting for as long as the worker pool and queue are full."""
+        while True:
+            try:
+                return self.submit(fn, *args, **kwargs)
+            except QueueFullError:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    # Pass on a slot that was freed for this caller, so that it is not lost
+                    if waiter.done() and not waiter.cancelled():
+                        self._wake_up()
+                    raise
+                finally:
+                    with suppress(ValueError):
+                        self._waiters.remove(waiter)
+
+    def shutdown(self) -> None:
+        """Stop accepting new jobs and cancel any jobs that have not started yet."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self) -> None:
+        """Free up the slot taken by a job once it is done, and hand it to the caller that has waited the longest."""
+        self._pending -= 1
+        self._update_queue_depth()
+        self._wake_up()
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop, _: Future) -> None:
+        """Free up the slot taken by a job from the thread that ran it, or that cancelled it before it started."""
+        # The loop is already closed if the job was cancelled while the server shuts down
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(self._release)
+
+    def _wake_up(self) -> None:
+        """Let the caller that has waited the longest for a free slot try again."""
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _update_queue_depth(self) -> None:
+        """Report the number of jobs that are waiting for a worker."""
+        QUEUE_DEPTH.set(max(self._pending - self._max_workers, 0), queue="inference")
+
+
+executor = InferenceExecutor(settings.inference_workers, settings.inference_queue_size)
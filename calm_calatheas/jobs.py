@@ -0,0 +1,447 @@
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from .cancellation import CancellationToken
+from .executor import QueueFullError, executor
+from .loader import loader
+from .logger import LOGGER
+from .metrics import COALESCED_CALLS, QUEUE_DEPTH
+from .settings import GenerationProfile, settings
+from .similarity import canonicalize
+
+# Number of seconds between updates of the progress of a running job, and checks for requests to cancel it
+PUBLISH_INTERVAL = 1.0
+
+type JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+
+class JobRequest(BaseModel):
+    """The body of a request to create a description job."""
+
+    priority: int = Field(
+        default=0,
+        description="Jobs with a higher priority run before jobs with a lower priority",
+    )
+
+    profile: str | None = Field(
+        default=None,
+        description="Name of the generation profile to use, defaults to the default generation profile",
+    )
+
+    prompt: str = Field(
+        description="The caption to generate a description for",
+        min_length=1,
+    )
+
+
+@dataclass
+class Job:
+    """
+    A description that is generated in the background, while clients poll for the result.
+
+    Every client that submitted the job holds a token of its own, which it needs to cancel the job.
+    """
+
+    priority: int
+    profile: GenerationProfile
+    user_prompt: str
+
+    clients: set[str] = field(default_factory=set)
+    description: dict[str, Any] | None = None
+    error: str | None = None
+    finished_at: float | None = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    progress: str = ""
+    status: JobStatus = "queued"
+
+    task: asyncio.Task[None] | None = field(default=None, repr=False)
+
+    @property
+    def key(self) -> tuple[str, str]:
+        """The normalized prompt and the generation profile, which identify jobs that generate the same description."""
+        return canonicalize(self.user_prompt), self.profile.model_dump_json()
+
+    def add_client(self) -> str:
+        """Add a client to the job, and return the token the client can cancel the job with."""
+        client = uuid.uuid4().hex
+        self.clients.add(client)
+
+        return client
+
+    def finish(self, status: JobStatus, error: str | None = None) -> None:
+        """Mark the job as finished with the given status."""
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.status = status
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the state of the job as it is reported to clients."""
+        return {
+            "description": self.description,
+            "error": self.error,
+            "id": self.id,
+            "progress": self.progress,
+            "status": self.status,
+        }
+
+
+class JobStore:
+    """
+    The state of description jobs in an SQLite database, shared by every server worker.
+
+    Each job runs on the worker that accepted it, which writes the state of the job to the store as it changes. When a
+    client asks another worker about the job, that worker reads the state from the store instead. Cancelling a job on
+    another worker leaves a request in the store, which the worker running the job picks up.
+
+    Writes are handed to a thread of their own, in the order they are made, so that callers on the event loop never
+    wait for the database. Reads block, so call them from a worker thread.
+    """
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self._lock = Lock()
+        self._path = path
+        self._ttl = ttl
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._connect()
+
+        # Neither a connection nor a thread survives a fork, so every worker opens its own
+        os.register_at_fork(after_in_child=self._connect)
+
+    def load(self, job_id: str) -> dict[str, Any] | None:
+        """Return the state of the job with the given id, if it exists and has not expired."""
+        with self._lock:
+            row = self._connection.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id: str, client: str) -> dict[str, Any] | None:
+        """
+        Ask the worker that runs the job with the given id to cancel it for the given client, and return its state.
+
+        Each client is only counted once, no matter how often it asks.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO cancel_requests SELECT id, ? FROM jobs WHERE id = ?",
+                (client, job_id),
+            )
+
+        return self.load(job_id)
+
+    def save(self, job: Job) -> None:
+        """
+        Write the current state of the given job, and remove jobs that finished longer ago than the time to live.
+
+        The state is taken right away, and written in the background.
+        """
+        self._writer.submit(self._write, job.id, json.dumps(job.to_dict()), finished=job.finished_at is not None)
+
+    def take_cancel_requests(self, job_id: str) -> list[str]:
+        """Return the clients that asked to cancel the job with the given id since the last call, if any."""
+        with self._lock, self._connection:
+            rows = self._connection.execute(
+                "DELETE FROM cancel_requests WHERE job_id = ? RETURNING client",
+                (job_id,),
+            ).fetchall()
+
+        return [client for (client,) in rows]
+
+    def _connect(self) -> None:
+        """Open the connection to the database and start the writer thread, and create the tables if needed."""
+        self._connection = sqlite3.connect(self._path, check_same_thread=False, timeout=30)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+
+        # Write-ahead logging lets workers read the state of a job while another worker is updating it
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                finished_at REAL
+            )
+            """,
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cancel_requests (
+                job_id TEXT NOT NULL,
+                client TEXT NOT NULL,
+                PRIMARY KEY (job_id, client)
+            )
+            """,
+        )
+
+    def _write(self, job_id: str, state: str, *, finished: bool) -> None:
+        """Write the given state of a job. This runs on the writer thread."""
+        now = time.time()
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                """
+                INSERT INTO jobs (id, state, finished_at) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET state = excluded.state, finished_at = excluded.finished_at
+                """,
+                (job_id, state, now if finished else None),
+            )
+
+            self._connection.execute(
+                "DELETE FROM cancel_requests WHERE job_id IN (SELECT id FROM jobs WHERE finished_at <= ?)",
+                (now - self._ttl,),
+            )
+            self._connection.execute("DELETE FROM jobs WHERE finished_at <= ?", (now - self._ttl,))
+
+
+class JobScheduler:
+    """
+    Run description jobs in the background, in order of priority.
+
+    At most `max_running` jobs run at the same time, and at most `max_queue_size` jobs wait to run. Any job submitted
+    beyond that is rejected with a `QueueFullError`. Jobs that are cancelled while they wait no longer count towards
+    that limit. Jobs with a higher priority run first, and jobs with the same
+    priority run in the order they were submitted. Finished jobs are kept for `ttl` seconds, so that clients can
+    collect the result.
+
+    A job submitted while an identical job is queued or running shares that job instead, so that popular prompts only
+    cost a single generation. Jobs are identical if their prompts are the same once normalized, and they use the same
+    generation profile. Each client that submits a job gets a token of its own to cancel it with, and a shared job is
+    only cancelled once every client that submitted it has cancelled it.
+
+    Jobs generate their descriptions like any other request, so they share model batches, cached descriptions and
+    identical generations that are already running.
+
+    If a store is given, the state of each job is shared with the schedulers of the other server workers through the
+    store, so that clients can ask any worker about any job.
+    """
+
+    def __init__(self, max_running: int, max_queue_size: int, ttl: float, store: JobStore | None = None) -> None:
+        self._in_flight: dict[tuple[str, str], Job] = {}
+        self._jobs: dict[str, Job] = {}
+        self._max_queue_size = max_queue_size
+        self._max_running = max_running
+        self._queue = asyncio.PriorityQueue[tuple[int, int, Job]]()
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._store = store
+        self._ttl = ttl
+        self._workers: list[asyncio.Task[None]] = []
+
+    async def cancel(self, job_id: str, client: str) -> dict[str, Any] | None:
+        """
+        Cancel the job with the given id for the client with the given token, and return the state of the job.
+
+        The job itself is cancelled once every client that submitted it has cancelled it, if it has not finished yet.
+        Tokens that do not belong to the job are ignored.
+        """
+        self._remove_expired()
+
+        if (job := self._jobs.get(job_id)) is None:
+            return await run_in_threadpool(self._store.request_cancel, job_id, client) if self._store else None
+
+        self._cancel(job, client)
+
+        return job.to_dict()
+
+    async def state(self, job_id: str) -> dict[str, Any] | None:
+        """Return the state of the job with the given id, if it exists and has not expired."""
+        self._remove_expired()
+
+        if (job := self._jobs.get(job_id)) is None:
+            return await run_in_threadpool(self._store.load, job_id) if self._store else None
+
+        return job.to_dict()
+
+    def start(self) -> None:
+        """Start running jobs. This must be called from the event loop."""
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"job-worker-{index}") for index in range(self._max_running)
+        ]
+
+    def shutdown(self) -> None:
+        """Stop running jobs."""
+        for worker in self._workers:
+            worker.cancel()
+
+    def submit(self, user_prompt: str, profile: GenerationProfile, priority: int = 0) -> tuple[Job, str]:
+        """
+        Submit a job to generate a description based on the user's prompt.
+
+        Returns the job, and the token that the client can cancel the job with.
+
+        Raises:
+            QueueFullError: If too many jobs are already waiting to run.
+        """
+        self._remove_expired()
+
+        job = Job(priority, profile, user_prompt)
+
+        if shared := self._in_flight.get(job.key):
+            LOGGER.debug("Sharing job %s with another client", shared.id)
+            COALESCED_CALLS.inc()
+            return shared, shared.add_client()
+
+        if self._queued >= self._max_queue_size:
+            raise QueueFullError
+
+        self._queue.put_nowait((-priority, next(self._sequence), job))
+        self._queued += 1
+
+        client = job.add_client()
+
+        self._in_flight[job.key] = job
+        self._jobs[job.id] = job
+        self._publish(job)
+
+        QUEUE_DEPTH.set(self._queued, queue="jobs")
+
+        return job, client
+
+    def _cancel(self, job: Job, client: str) -> None:
+        """Drop the given client from the job, and cancel the job if it was the last client and it has not finished."""
+        if job.status not in {"queued", "running"} or client not in job.clients:
+            return
+
+        job.clients.remove(client)
+
+        if job.clients:
+            return
+
+        if job.status == "queued":
+            # The job stays in the queue until it reaches the front and is skipped, but it no longer takes up a place
+            self._dequeue()
+            self._finish(job, "cancelled")
+        elif job.task:
+            job.task.cancel()
+
+    def _dequeue(self) -> None:
+        """Free up the place of a job that stopped waiting, because it started running or was cancelled."""
+        self._queued -= 1
+
+        QUEUE_DEPTH.set(self._queued, queue="jobs")
+
+    def _finish(self, job: Job, status: JobStatus, error: str | None = None) -> None:
+        """Mark the job as finished, so that identical jobs submitted from now on run on their own."""
+        job.finish(status, error)
+
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+
+        self._publish(job)
+
+    def _publish(self, job: Job) -> None:
+        """Write the state of the given job to the store, if any."""
+        if self._store:
+            self._store.save(job)
+
+    def _remove_expired(self) -> None:
+        """Forget jobs that finished longer ago than the time to live."""
+        expired_at = time.monotonic() - self._ttl
+
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < expired_at:
+                del self._jobs[job_id]
+
+    async def _take_cancel_requests(self, job: Job) -> None:
+        """Cancel the given job for the clients that asked another worker to cancel it, if any."""
+        if not self._store:
+            return
+
+        for client in await run_in_threadpool(self._store.take_cancel_requests, job.id):
+            self._cancel(job, client)
+
+    async def _work(self) -> None:
+        """Take jobs off the queue and run them, one at a time."""
+        while True:
+            _, _, job = await self._queue.get()
+
+            # Pick up any requests to cancel the job that were made on other workers while it was waiting
+            await self._take_cancel_requests(job)
+
+            if job.status != "queued":
+                continue
+
+            self._dequeue()
+
+            job.status = "running"
+            job.task = task = asyncio.create_task(self._run(job))
+
+            self._publish(job)
+
+            # Wait for the job without raising, so that a job that fails or is cancelled does not stop the worker
+            await asyncio.wait([task])
+
+            if task.cancelled():
+                LOGGER.debug("Cancelled job %s", job.id)
+                self._finish(job, "cancelled")
+            elif error := task.exception():
+                LOGGER.error("Job %s failed", job.id, exc_info=error)
+                self._finish(job, "failed", str(error))
+            else:
+                self._finish(job, "succeeded")
+
+    async def _run(self, job: Job) -> None:
+        """
+        Generate the description for the job.
+
+        While the description is generated, the generated text is published as progress, and requests to cancel the
+        job that were made on other workers are picked up, once every publish interval.
+        """
+        # The progress module imports torch, which is only imported once the model is loaded
+        from .progress import GenerationProgress  # noqa: PLC0415
+
+        model = loader.model
+
+        if cached := await run_in_threadpool(model.find_cached_description, job.user_prompt, job.profile):
+            job.description = cached.model_dump(mode="json")
+            return
+
+        cancellation = CancellationToken()
+        progress = GenerationProgress()
+
+        try:
+            generation = await executor.submit_when_available(
+                model.generate_description,
+                job.user_prompt,
+                job.profile,
+                cancellation,
+                progress,
+            )
+
+            while not (await asyncio.wait([generation], timeout=PUBLISH_INTERVAL))[0]:
+                job.progress = await run_in_threadpool(model.progress_text, progress)
+                self._publish(job)
+
+                await self._take_cancel_requests(job)
+        except asyncio.CancelledError:
+            # Stop the model as well, since nobody is waiting for the job anymore
+            cancellation.cancel()
+            raise
+
+        description = await generation
+
+        job.description = description.model_dump(mode="json")
+        job.progress = await run_in_threadpool(model.progress_text, progress)
+
+
+jobs = JobScheduler(
+    settings.job_workers,
+    settings.job_queue_size,
+    settings.job_ttl,
+    # Jobs only need to be shared if there is more than one server worker
+    JobStore(settings.job_store_path, settings.job_ttl) if settings.server_workers > 1 else None,
+)
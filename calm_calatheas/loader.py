@@ -0,0 +1,70 @@
+import importlib
+import time
+from threading import Thread
+from types import ModuleType
+
+from .logger import LOGGER
+
+
+class ModelNotReadyError(Exception):
+    """Error raised when the model is used before it has been loaded."""
+
+    def __init__(self) -> None:
+        super().__init__("The model has not been loaded yet.")
+
+
+class ModelLoader:
+    """
+    Load the model on a background thread, so that the server can handle requests while the weights are loading.
+
+    The weights are loaded when the model module is imported, which takes a long time. Only the loader imports the
+    module, and the rest of the application accesses it through `model` once the loader is ready.
+    """
+
+    def __init__(self) -> None:
+        self.error: Exception | None = None
+
+        self._model: ModuleType | None = None
+        self._thread: Thread | None = None
+
+    @property
+    def model(self) -> ModuleType:
+        """The loaded model module."""
+        if self._model is None:
+            raise ModelNotReadyError
+
+        return self._model
+
+    @property
+    def ready(self) -> bool:
+        """Whether the model has been loaded and warmed up."""
+        return self._model is not None
+
+    def load(self) -> None:
+        """Load the model and warm it up. This blocks until the model is ready, or loading has failed."""
+        LOGGER.info("Loading the model")
+
+        started_at = time.monotonic()
+
+        try:
+            model = importlib.import_module(".model", __package__)
+            model.warm_up()
+        except Exception as e:  # noqa: BLE001
+            LOGGER.exception("Failed to load the model")
+            self.error = e
+            return
+
+        self._model = model
+
+        LOGGER.info("Loaded the model in %.1f seconds", time.monotonic() - started_at)
+
+    def start(self) -> None:
+        """Start loading the model in the background, unless it is already loaded or being loaded."""
+        if self._thread or self.ready:
+            return
+
+        self._thread = Thread(target=self.load, name="model-loader", daemon=True)
+        self._thread.start()
+
+
+loader = ModelLoader()
@@ -0,0 +1,257 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+from typing import override
+
+# Bucket upper bounds, in seconds for durations and in tokens for token counts
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+type _Labels = tuple[tuple[str, str], ...]
+
+
+class Metric(ABC):
+    """
+    Base class for metrics that are exposed in the Prometheus text format.
+
+    A metric keeps a separate value for each combination of labels it has been recorded with. Metrics are updated from
+    many threads at once, so every update takes a lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.documentation = documentation
+        self.name = name
+
+        self._lock = Lock()
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+        with self._lock:
+            lines.extend(self._samples())
+
+        return "\n".join(lines)
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """Render a line for each sample of the metric."""
+
+
+class Counter(Metric):
+    """A value that only ever goes up, such as the number of times something happened."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+
+        self._values: dict[_Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the value with the given labels by the given amount."""
+        key = _key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @override
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format(key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """A value that can go up and down, such as the number of requests being handled."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation)
+
+        self._values: dict[_Labels, float] = {}
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """Decrease the value with the given labels by the given amount."""
+        self.inc(-amount, **labels)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the value with the given labels by the given amount."""
+        key = _key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the value with the given labels."""
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    @override
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format(key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    """
+    The distribution of a value that is observed many times, such as the duration of a request.
+
+    Observations are counted in cumulative buckets, each of which counts the observations up to its upper bound.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple[float, ...]) -> None:
+        super().__init__(name, documentation)
+
+        self._buckets = (*sorted(buckets), math.inf)
+        self._counts: dict[_Labels, list[int]] = {}
+        self._sums: dict[_Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation of the given value with the given labels."""
+        key = _key(labels)
+
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self._buckets))
+
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[index] += 1
+
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the number of seconds spent in the block, whether or not it raises."""
+        started_at = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    @override
+    def _samples(self) -> list[str]:
+        samples = []
+
+        for key, counts in sorted(self._counts.items()):
+            for bound, count in zip(self._buckets, counts, strict=True):
+                samples.append(f"{self.name}_bucket{_format((*key, ('le', _number(bound))))} {count}")
+
+            samples.append(f"{self.name}_sum{_format(key)} {_number(self._sums[key])}")
+            samples.append(f"{self.name}_count{_format(key)} {counts[-1]}")
+
+        return samples
+
+
+def render_metrics() -> str:
+    """Render every metric of the application in the Prometheus text format."""
+    return "".join(f"{metric.render()}\n" for metric in METRICS)
+
+
+def _format(labels: _Labels) -> str:
+    """Format the given labels as they appear after the name of a sample."""
+    if not labels:
+        return ""
+
+    escaped = ((name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for name, value in labels)
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _key(labels: dict[str, str]) -> _Labels:
+    """Turn the given labels into a key that does not depend on the order they were given in."""
+    return tuple(sorted(labels.items()))
+
+
+def _number(value: float) -> str:
+    """Format a number as it appears in the Prometheus text format."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+CACHE_LOOKUPS = Counter(
+    "calm_calatheas_cache_lookups_total",
+    "Number of description cache lookups, by result: hits, similar_hits or misses.",
+)
+
+CANCELLED_GENERATIONS = Counter(
+    "calm_calatheas_cancelled_generations_total",
+    "Number of sequences the model stopped generating early, because nobody was waiting for the result anymore.",
+)
+
+COALESCED_CALLS = Counter(
+    "calm_calatheas_coalesced_calls_total",
+    "Number of calls that waited for an identical call that was already in flight, instead of running the model.",
+)
+
+DRAFT_TOKENS = Counter(
+    "calm_calatheas_draft_tokens_total",
+    "Number of tokens proposed by the draft model for speculative decoding, by result: accepted or rejected.",
+)
+
+GENERATED_TOKENS = Histogram(
+    "calm_calatheas_generated_tokens",
+    "Number of tokens generated for a single sequence, by part of the response: thinking or content.",
+    TOKEN_BUCKETS,
+)
+
+GENERATIONS_IN_FLIGHT = Gauge(
+    "calm_calatheas_generations_in_flight",
+    "Number of sequences the model is generating right now.",
+)
+
+POOL_HITS = Counter(
+    "calm_calatheas_pool_hits_total",
+    "Number of descriptions served from the pool of pre-generated descriptions.",
+)
+
+QUEUE_DEPTH = Gauge(
+    "calm_calatheas_queue_depth",
+    "Number of jobs waiting to be run, by queue: inference for the worker pool, batch for the batch scheduler, "
+    "jobs for the job scheduler.",
+)
+
+REPAIRS = Counter(
+    "calm_calatheas_repairs_total",
+    "Number of attempts to repair a description that did not match the schema, by result: success or failure.",
+)
+
+REQUEST_DURATION = Histogram(
+    "calm_calatheas_request_duration_seconds",
+    "Number of seconds it took to respond with a description, by endpoint.",
+    DURATION_BUCKETS,
+)
+
+STAGE_DURATION = Histogram(
+    "calm_calatheas_stage_duration_seconds",
+    "Number of seconds spent in each stage of generating a description.",
+    DURATION_BUCKETS,
+)
+
+VALIDATION_FAILURES = Counter(
+    "calm_calatheas_validation_failures_total",
+    "Number of generated descriptions that did not match the schema.",
+)
+
+METRICS: list[Metric] = [
+    CACHE_LOOKUPS,
+    CANCELLED_GENERATIONS,
+    COALESCED_CALLS,
+    DRAFT_TOKENS,
+    GENERATED_TOKENS,
+    GENERATIONS_IN_FLIGHT,
+    POOL_HITS,
+    QUEUE_DEPTH,
+    REPAIRS,
+    REQUEST_DURATION,
+    STAGE_DURATION,
+    VALIDATION_FAILURES,
+]
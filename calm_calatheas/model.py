@@ -1,125 +1,248 @@
-import json
-from enum import StrEnum, auto
-from functools import lru_cache
-from typing import override
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Literal
+
+from pydantic import ValidationError
+from transformers import AutoTokenizer, LogitsProcessorList, StoppingCriteriaList, TextIteratorStreamer
+from transformers.generation.streamers import BaseStreamer
+
+from .backends import load_model
+from .batching import BatchScheduler
+from .budget import GenerationBudgetLogitsProcessor, max_new_tokens
+from .cache import create_cache
+from .cancellation import CancellationToken
+from .constrained import JsonSchemaGrammar, JsonSchemaLogitsProcessor
+from .description import DESCRIPTION_PROMPT, REPAIR_PROMPT, PokemonDescription, generation_namespace
+from .logger import LOGGER
+from .metrics import (
+    CANCELLED_GENERATIONS,
+    DRAFT_TOKENS,
+    GENERATED_TOKENS,
+    GENERATIONS_IN_FLIGHT,
+    REPAIRS,
+    STAGE_DURATION,
+    VALIDATION_FAILURES,
+)
+from .pool import pool
+from .prefix import PrefixCache
+from .progress import GenerationProgress, ProgressStreamer
+from .settings import GenerationProfile, settings
+from .similarity import canonicalize
+from .singleflight import SingleFlight
+from .speculative import DraftModel
+from .stopping import CancellationStoppingCriteria
+from .templates import ChatTemplateCache
+from .timing import GenerationStats, GenerationTimer
+
+MODEL_NAME = settings.model_name
 
-from pydantic import BaseModel, Field, ValidationError
-from transformers import AutoModelForCausalLM, AutoTokenizer
+TOKENIZER = AutoTokenizer.from_pretrained(MODEL_NAME)
+MODEL = load_model(MODEL_NAME)
+
+# A smaller model with the same tokenizer, which proposes tokens for the model to verify
+DRAFT_MODEL = DraftModel(load_model(settings.draft_model_name)) if settings.draft_model_name else None
+
+# Generation ends at any of these tokens. Models without a generation config end at the end token of the tokenizer
+_EOS_TOKEN_ID = MODEL.generation_config.eos_token_id if MODEL.generation_config else TOKENIZER.eos_token_id
+EOS_TOKEN_IDS: list[int] = _EOS_TOKEN_ID if isinstance(_EOS_TOKEN_ID, list) else [_EOS_TOKEN_ID]
+
+STATS = GenerationStats()
+
+THINK_START_TAG = "<think>"
+THINK_END_TAG = "</think>"
+THINK_END_TOKEN_ID = TOKENIZER.convert_tokens_to_ids(THINK_END_TAG)
+
+# Building the grammar decodes the whole vocabulary, so it is done once and shared by every generation
+GRAMMAR = (
+    JsonSchemaGrammar(PokemonDescription.model_json_schema(), TOKENIZER) if settings.constrained_decoding else None
+)
+
+CACHE = create_cache(namespace=generation_namespace())
+
+
+type StreamPart = Literal["thinking", "content"]
+
+
+@dataclass(frozen=True)
+class _Prompt:
+    """
+    A conversation to prompt the model with, the generation profile to use, and a token to stop generating.
+
+    If a progress is given, the generated tokens are added to it while they are produced.
+    """
+
+    messages: list[dict[str, str]]
+    profile: GenerationProfile
+    cancellation: CancellationToken | None = None
+    progress: GenerationProgress | None = None
 
-from .logger import LOGGER
 
+def cache_description(user_prompt: str, profile: GenerationProfile, description: PokemonDescription) -> None:
+    """Store a description generated for the user's prompt with the given profile in the cache."""
+    CACHE.set(user_prompt, profile, description.model_dump_json())
 
-class PokemonType(StrEnum):
-    """An enumeration of Pokemon types."""
-
-    BUG = auto()
-    DARK = auto()
-    DRAGON = auto()
-    ELECTRIC = auto()
-    FAIRY = auto()
-    FIGHTING = auto()
-    FIRE = auto()
-    FLYING = auto()
-    GHOST = auto()
-    GRASS = auto()
-    GROUND = auto()
-    ICE = auto()
-    NORMAL = auto()
-    POISON = auto()
-    PSYCHIC = auto()
-    ROCK = auto()
-    STEEL = auto()
-    WATER = auto()
-
-    @classmethod
-    @override
-    def _missing_(cls, value: object) -> "PokemonType | None":
-        """
-        The model will sometimes generate types that don't match the enum exactly.
-
-        Try normalizing the input by converting it to lowercase.
-        """
-        if isinstance(value, str):
-            value = value.lower()
-
-        for member in cls:
-            if member.lower() == value:
-                return member
 
+def find_cached_description(user_prompt: str, profile: GenerationProfile | None = None) -> PokemonDescription | None:
+    """
+    Return the pre-generated or cached description for the user's prompt, if any.
+
+    Descriptions are only returned if they were generated with the given profile, which defaults to the default
+    generation profile.
+    """
+    profile = profile or settings.get_generation_profile()
+
+    if (pooled := pool.get(user_prompt, profile)) is not None:
+        return PokemonDescription.model_validate_json(pooled)
+
+    if (cached := CACHE.get(user_prompt, profile)) is None:
         return None
 
+    LOGGER.debug('Found a cached description for user prompt: "%s"', user_prompt)
 
-class PokemonDescription(BaseModel):
-    """A description of a Pokemon."""
+    return PokemonDescription.model_validate_json(cached)
 
-    ability: str = Field(
-        description="The primary ability of the Pokemon, which can affect its performance in battles.",
-    )
 
-    category: str = Field(
-        description="The category of the Pokemon, phrased as a noun.",
-    )
+def generate_description(
+    user_prompt: str,
+    profile: GenerationProfile | None = None,
+    cancellation: CancellationToken | None = None,
+    progress: GenerationProgress | None = None,
+) -> PokemonDescription:
+    """
+    Generate a Pokemon description based on the user's prompt, or return the cached description if available.
 
-    flavor_text: str = Field(
-        description="Flavor text to add characterization or lore to the Pokemon in question.",
-        max_length=255,
-    )
+    Concurrent calls for the same prompt and profile share a single generation. Prompts count as the same if they are
+    identical once normalized, as they are for the cache. The generation stops once every caller waiting for it has
+    cancelled their token.
 
-    habitat: str = Field(
-        description="The natural habitat where the Pokemon can typically be found, phrased as a noun.",
-        max_length=15,
-    )
+    If a progress is given, the generated tokens are added to it while they are produced, which `progress_text` turns
+    into text. Only the caller that starts a shared generation receives its progress.
 
-    height: float = Field(
-        description="The height of the Pokemon in meters.",
-    )
+    Raises:
+        GenerationCancelledError: If the generation was cancelled before it finished.
+    """
+    profile = profile or settings.get_generation_profile()
+    key = (canonicalize(user_prompt), profile.model_dump_json())
 
-    name: str = Field(
-        description="The creative name for the Pokemon. Avoid using real names or actual Pokemon names.",
-    )
+    return _IN_FLIGHT.run(key, partial(_generate_description, user_prompt, profile, progress=progress), cancellation)
 
-    types: set[PokemonType] = Field(
-        description="The type(s) of the Pokemon.",
-        max_length=2,
-        min_length=1,
-    )
 
-    weight: float = Field(
-        description="The weight of the Pokemon in kilograms.",
-    )
+def parse_description(
+    content: str,
+    profile: GenerationProfile | None = None,
+    cancellation: CancellationToken | None = None,
+) -> PokemonDescription:
+    """Parse the generated content as a Pokemon description, repairing it if it does not match the schema."""
+    try:
+        with STAGE_DURATION.time(stage="validate"):
+            result = PokemonDescription.model_validate_json(content)
+    except ValidationError as e:
+        VALIDATION_FAILURES.inc()
 
+        with STAGE_DURATION.time(stage="repair"):
+            result = _repair(content, e, profile or settings.get_generation_profile(), cancellation)
 
-MODEL_NAME = "Qwen/Qwen3-1.7B"
+    return result
 
-TOKENIZER = AutoTokenizer.from_pretrained(MODEL_NAME)
-MODEL = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    torch_dtype="auto",
-    device_map="auto",
-)
 
-DESCRIPTION_PROMPT = f"""
-You are a helpful Pokemon professor.
-The user is a Pokemon trainer seeking information.
-The user will prompt you with a caption for a picture of a Pokemon.
-Answer using the following schema: {json.dumps(PokemonDescription.model_json_schema())}
-"""
-
-REPAIR_PROMPT = f"""
-You are a helpful Pokemon professor.
-The input is a Pokemon description and a validation error.
-The description needs to be repaired based on the error.
-Leave fields not mentioned in the error unchanged.
-Answer using the following schema: {json.dumps(PokemonDescription.model_json_schema())}
-"""
-
-
-@lru_cache
-def generate_description(user_prompt: str) -> PokemonDescription:
-    """Generate a Pokemon description based on the user's prompt."""
-    LOGGER.debug('Generating a description based on user prompt: "%s"', user_prompt)
+class DescriptionStream:
+    """
+    Generate a Pokemon description based on the user's prompt, making the generated text available as it is produced.
 
-    messages = [
+    Call `generate` on a worker thread, and iterate over the stream from another thread to receive the generated text
+    as it becomes available. Once the stream is exhausted, pass `content` to `parse_description` to get the result.
+    Call `cancel` to stop the model if nobody is interested in the result anymore.
+    """
+
+    def __init__(self, user_prompt: str, profile: GenerationProfile | None = None) -> None:
+        self.content = ""
+        self.profile = profile or settings.get_generation_profile()
+        self.user_prompt = user_prompt
+
+        self._cancellation = CancellationToken()
+        self._streamer = TextIteratorStreamer(TOKENIZER, skip_prompt=True, skip_special_tokens=True)
+
+    def __iter__(self) -> Iterator[tuple[StreamPart, str]]:
+        """Yield the generated text in chunks, labelled with the part of the response they belong to."""
+        part: StreamPart = "thinking" if self.profile.thinking else "content"
+        content: list[str] = []
+
+        for chunk in self._streamer:
+            text = chunk.removeprefix(THINK_START_TAG) if part == "thinking" else chunk
+
+            if part == "thinking" and THINK_END_TAG in text:
+                thinking, text = text.split(THINK_END_TAG, maxsplit=1)
+
+                if thinking:
+                    yield part, thinking
+
+                part = "content"
+
+            if part == "content":
+                content.append(text)
+
+            if text:
+                yield part, text
+
+        self.content = "".join(content).strip("\n")
+
+    def cancel(self) -> None:
+        """Stop the model within a few tokens, if it is still generating."""
+        self._cancellation.cancel()
+
+    def generate(self) -> None:
+        """Run the model, passing the generated text to the stream. This blocks until generation is done."""
+        LOGGER.debug('Streaming a description based on user prompt: "%s"', self.user_prompt)
+
+        model_inputs = prepare_inputs([self.user_prompt], self.profile)
+
+        try:
+            _generate(
+                model_inputs,
+                logits_processor=_logits_processors([self.profile]),
+                max_new_tokens=max_new_tokens(self.profile),
+                cancellations=[self._cancellation],
+                streamer=self._streamer,
+            )
+        except BaseException:
+            # Make sure anyone iterating over the stream is released
+            self._streamer.end()
+            raise
+
+
+def prepare_inputs(user_prompts: list[str], profile: GenerationProfile) -> dict[str, Any]:
+    """Prepare the inputs for generating descriptions based on the given user prompts in a single call to generate."""
+    conversations = [_description_messages(user_prompt) for user_prompt in user_prompts]
+
+    return _tokenize(conversations, [profile] * len(conversations))
+
+
+def progress_text(progress: GenerationProgress) -> str:
+    """Return the text generated so far for a description, without the tags around the thinking content."""
+    text = TOKENIZER.decode(progress.output_ids(), skip_special_tokens=True)
+
+    return text.replace(THINK_START_TAG, "").replace(THINK_END_TAG, "")
+
+
+def warm_up() -> None:
+    """Run a short generation, so that the first request does not pay for any one-time setup of the model."""
+    model_inputs = prepare_inputs(["warm up"], settings.get_generation_profile())
+
+    MODEL.generate(**model_inputs, max_new_tokens=1)
+
+    if DRAFT_MODEL:
+        # The cached keys and values of the system prompts belong to the model, so the draft model gets the prompt only
+        DRAFT_MODEL.model.generate(
+            model_inputs["input_ids"],
+            attention_mask=model_inputs["attention_mask"],
+            max_new_tokens=1,
+        )
+
+
+def _description_messages(user_prompt: str) -> list[dict[str, str]]:
+    """Build the conversation for generating a description based on the user's prompt."""
+    return [
         {
             "role": "system",
             "content": DESCRIPTION_PROMPT,
@@ -130,21 +253,17 @@ def generate_description(user_prompt: str) -> PokemonDescription:
         },
     ]
 
-    thinking_content, content = _prompt(messages)
-
-    LOGGER.debug(thinking_content)
-
-    try:
-        result = PokemonDescription.model_validate_json(content)
-    except ValidationError as e:
-        result = _repair(content, e)
-
-    return result
 
-
-def _repair(content: str, validation_error: ValidationError) -> PokemonDescription:
+def _repair(
+    content: str,
+    validation_error: ValidationError,
+    profile: GenerationProfile,
+    cancellation: CancellationToken | None = None,
+) -> PokemonDescription:
     """Attempt to repair the given content based on the given validation error."""
     LOGGER.debug("Repairing content based on validation error: %s", validation_error)
+
+    STATS.add(repairs=1)
     LOGGER.debug("Original content: %s", content)
 
     messages = [
@@ -158,32 +277,199 @@ def _repair(content: str, validation_error: ValidationError) -> PokemonDescripti
         },
     ]
 
-    thinking_content, content = _prompt(messages)
+    thinking_content, content = _prompt(messages, profile, cancellation)
 
     LOGGER.debug(thinking_content)
 
-    return PokemonDescription.model_validate_json(content)
+    try:
+        with STAGE_DURATION.time(stage="validate"):
+            result = PokemonDescription.model_validate_json(content)
+    except ValidationError:
+        REPAIRS.inc(result="failure")
+        raise
 
+    REPAIRS.inc(result="success")
+
+    return result
 
-def _prompt(messages: list[dict[str, str]]) -> tuple[str, str]:
-    """Prompt the model with the given messages and return the generated text."""
-    text = TOKENIZER.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-        enable_thinking=True,
-    )
 
-    model_inputs = TOKENIZER([text], return_tensors="pt").to(MODEL.device)
+def _generate(
+    model_inputs: dict[str, Any],
+    logits_processor: LogitsProcessorList,
+    max_new_tokens: int,
+    cancellations: list[CancellationToken | None],
+    streamer: BaseStreamer | None = None,
+) -> list[list[int]]:
+    """
+    Run the model on the given inputs and return the generated tokens for each sequence, without the padding.
 
-    # The magic numbers below taken from the model documentation, see https://huggingface.co/Qwen/Qwen3-1.7B#quickstart
-    generated_ids = MODEL.generate(**model_inputs, max_new_tokens=32768)
-    output_ids = generated_ids[0][len(model_inputs.input_ids[0]) :].tolist()
+    Each sequence stops as soon as its cancellation token is cancelled, so the tokens of a cancelled sequence are
+    incomplete.
+
+    If there is a draft model, a single sequence is generated with speculative decoding. Transformers does not support
+    speculative decoding for batches, so those are generated as usual.
+
+    The time spent on prefill and decode, and the number of tokens processed in each phase, are added to the stats
+    and the metrics.
+    """
+    cached_tokens = past_key_values.get_seq_length() if (past_key_values := model_inputs.get("past_key_values")) else 0
+    prompt_length = model_inputs["input_ids"].shape[1]
+    sequences = model_inputs["input_ids"].shape[0]
+    timer = GenerationTimer(streamer)
+
+    draft_model = DRAFT_MODEL if sequences == 1 else None
+    proposed_before = draft_model.proposed() if draft_model else 0
+
+    GENERATIONS_IN_FLIGHT.inc(sequences)
 
     try:
-        index = len(output_ids) - output_ids[::-1].index(151668)
-    except ValueError:
-        index = 0
+        generated_ids = MODEL.generate(
+            **model_inputs,
+            assistant_model=draft_model.model if draft_model else None,
+            logits_processor=logits_processor,
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=StoppingCriteriaList([CancellationStoppingCriteria(cancellations)]),
+            streamer=timer,
+        )
+    finally:
+        GENERATIONS_IN_FLIGHT.dec(sequences)
+
+    if cancelled := sum(cancellation is not None and cancellation.cancelled for cancellation in cancellations):
+        LOGGER.debug("Stopped generating %d cancelled sequence(s)", cancelled)
+        CANCELLED_GENERATIONS.inc(cancelled)
+
+    output_ids = [_remove_padding(ids) for ids in generated_ids[:, prompt_length:].tolist()]
+
+    STAGE_DURATION.observe(timer.prefill_seconds, stage="prefill")
+    STAGE_DURATION.observe(timer.decode_seconds, stage="decode")
+
+    for ids in output_ids:
+        # Sequences generated without thinking have no thinking part at all
+        if thinking_length := _thinking_length(ids):
+            GENERATED_TOKENS.observe(thinking_length, part="thinking")
+
+        GENERATED_TOKENS.observe(len(ids) - thinking_length, part="content")
+
+    decode_tokens = sum(len(ids) for ids in output_ids)
+
+    if draft_model:
+        # Every step generates one token of its own, and any tokens beyond that were proposed by the draft model
+        proposed = draft_model.proposed() - proposed_before
+        accepted = decode_tokens - timer.steps
+
+        DRAFT_TOKENS.inc(accepted, result="accepted")
+        DRAFT_TOKENS.inc(proposed - accepted, result="rejected")
+        STATS.add(draft_accepted_tokens=accepted, draft_proposed_tokens=proposed)
+
+    STATS.add(
+        decode_seconds=timer.decode_seconds,
+        decode_tokens=decode_tokens,
+        generations=1,
+        prefill_seconds=timer.prefill_seconds,
+        prefill_tokens=int(model_inputs["attention_mask"].sum()) - cached_tokens * len(output_ids),
+    )
+
+    return output_ids
+
+
+def _generate_description(
+    user_prompt: str,
+    profile: GenerationProfile,
+    cancellation: CancellationToken,
+    progress: GenerationProgress | None = None,
+) -> PokemonDescription:
+    """Generate a Pokemon description based on the user's prompt, or return the cached description if available."""
+    if cached := find_cached_description(user_prompt, profile):
+        return cached
+
+    LOGGER.debug('Generating a description based on user prompt: "%s"', user_prompt)
+
+    thinking_content, content = _prompt(_description_messages(user_prompt), profile, cancellation, progress)
+
+    LOGGER.debug(thinking_content)
+
+    result = parse_description(content, profile, cancellation)
+
+    cache_description(user_prompt, profile, result)
+
+    return result
+
+
+def _logits_processors(profiles: list[GenerationProfile]) -> LogitsProcessorList:
+    """
+    Build the logits processors for a single call to generate, given the generation profile of each sequence.
+
+    Each sequence is kept within the budget of its profile. If constrained decoding is enabled, the model thinks
+    freely, but everything after the thinking content must match the description schema.
+    """
+    processors = LogitsProcessorList()
+
+    if GRAMMAR is not None:
+        start_token_ids = [THINK_END_TOKEN_ID if profile.thinking else None for profile in profiles]
+        processors.append(JsonSchemaLogitsProcessor(GRAMMAR, EOS_TOKEN_IDS, start_token_ids))
+
+    processors.append(GenerationBudgetLogitsProcessor(profiles, THINK_END_TOKEN_ID, EOS_TOKEN_IDS))
+
+    return processors
+
+
+def _prompt(
+    messages: list[dict[str, str]],
+    profile: GenerationProfile,
+    cancellation: CancellationToken | None = None,
+    progress: GenerationProgress | None = None,
+) -> tuple[str, str]:
+    """
+    Prompt the model with the given messages and return the generated text.
+
+    Concurrent prompts are collected by the scheduler and run through the model together. If a progress is given, the
+    generated tokens are added to it while they are produced.
+
+    Raises:
+        GenerationCancelledError: If the given token is cancelled before the generated text is complete.
+    """
+    if cancellation:
+        cancellation.raise_if_cancelled()
+
+    result = _SCHEDULER.submit(_Prompt(messages, profile, cancellation, progress), cancellation)
+
+    # The model stops generating for a cancelled prompt, so the generated text may be incomplete
+    if cancellation:
+        cancellation.raise_if_cancelled()
+
+    return result
+
+
+def _prompt_batch(batch: list[_Prompt]) -> list[tuple[str, str]]:
+    """Prompt the model with a batch of conversations and return the generated text for each of them."""
+    profiles = [prompt.profile for prompt in batch]
+    progresses = [prompt.progress for prompt in batch]
+
+    model_inputs = _tokenize([prompt.messages for prompt in batch], profiles)
+
+    output_ids = _generate(
+        model_inputs,
+        logits_processor=_logits_processors(profiles),
+        max_new_tokens=max(max_new_tokens(profile) for profile in profiles),
+        cancellations=[prompt.cancellation for prompt in batch],
+        streamer=ProgressStreamer(progresses) if any(progresses) else None,
+    )
+
+    return [_split_thinking(ids) for ids in output_ids]
+
+
+def _remove_padding(output_ids: list[int]) -> list[int]:
+    """Remove the padding that follows the end of a generated sequence."""
+    for index, token in enumerate(output_ids):
+        if token in EOS_TOKEN_IDS:
+            return output_ids[: index + 1]
+
+    return output_ids
+
+
+def _split_thinking(output_ids: list[int]) -> tuple[str, str]:
+    """Split the generated tokens into the thinking content and the actual content."""
+    index = _thinking_length(output_ids)
 
     thinking_content = TOKENIZER.decode(
         output_ids[:index],
@@ -192,3 +478,35 @@ def _prompt(messages: list[dict[str, str]]) -> tuple[str, str]:
     content = TOKENIZER.decode(output_ids[index:], skip_special_tokens=True).strip("\n")
 
     return thinking_content, content
+
+
+def _thinking_length(output_ids: list[int]) -> int:
+    """Return the number of generated tokens up to and including the end of the thinking content, if any."""
+    try:
+        return len(output_ids) - output_ids[::-1].index(THINK_END_TOKEN_ID)
+    except ValueError:
+        return 0
+
+
+def _tokenize(conversations: list[list[dict[str, str]]], profiles: list[GenerationProfile]) -> dict[str, Any]:
+    """Tokenize the given conversations and return the inputs for a single call to generate."""
+    with STAGE_DURATION.time(stage="tokenize"):
+        rows = TEMPLATES.encode(conversations, [profile.thinking for profile in profiles])
+
+        return PREFIX_CACHE.prepare(rows)
+
+
+# The system prompts are the same for every generation, so they are only tokenized once
+TEMPLATES = ChatTemplateCache(TOKENIZER)
+
+# For the same reason, their keys and values are only computed once
+PREFIX_CACHE = PrefixCache(MODEL, TOKENIZER)
+
+if settings.prefix_caching:
+    PREFIX_CACHE.add(TEMPLATES.head([{"role": "system", "content": DESCRIPTION_PROMPT}]))
+    PREFIX_CACHE.add(TEMPLATES.head([{"role": "system", "content": REPAIR_PROMPT}]))
+
+# Generations that are running right now, keyed on the normalized prompt and the generation profile
+_IN_FLIGHT = SingleFlight[tuple[str, str], PokemonDescription]()
+
+_SCHEDULER = BatchScheduler(_prompt_batch, settings.batch_max_size, settings.batch_window)
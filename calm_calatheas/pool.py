@@ -0,0 +1,191 @@
+import argparse
+import gzip
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pydantic import ValidationError
+
+from .description import generation_namespace
+from .logger import LOGGER
+from .metrics import POOL_HITS
+from .settings import GenerationProfile, settings
+from .similarity import canonicalize
+
+# Captions of the subjects that users take pictures of most often, used if no other seed captions are given
+SEED_CAPTIONS = [
+    "a bird sitting on a tree branch",
+    "a black and white cat",
+    "a brown dog lying on the floor",
+    "a car parked on the side of a street",
+    "a cat lying on a bed",
+    "a cat sitting on a couch",
+    "a close up of a flower",
+    "a cup of coffee on a table",
+    "a dog running in a park",
+    "a dog sitting on a couch",
+    "a fish swimming in an aquarium",
+    "a horse standing in a field",
+    "a house plant in a pot",
+    "a laptop on a desk",
+    "a person holding a phone",
+    "a plate of food on a table",
+    "a red car parked in a parking lot",
+    "a stuffed animal on a bed",
+    "a tree in a field",
+    "a white cat",
+]
+
+
+class DescriptionPool:
+    """
+    Descriptions generated ahead of time for common captions, so they can be served without running the model.
+
+    Descriptions are looked up by the canonical form of the caption, like they are in the cache. The pool is stored as
+    gzipped JSON, which is built offline with `python -m calm_calatheas.pool` and loaded once at startup. Like cache
+    entries, the pool is tied to the namespace of the model and the prompts that generated it. It is also tied to the
+    generation profile that generated it, and only serves requests for that profile.
+    """
+
+    def __init__(
+        self,
+        descriptions: dict[str, str] | None = None,
+        profile: GenerationProfile | None = None,
+    ) -> None:
+        self.profile = profile
+
+        self._descriptions = descriptions or {}
+
+    def __len__(self) -> int:
+        """The number of descriptions in the pool."""
+        return len(self._descriptions)
+
+    @classmethod
+    def load(cls, path: str, namespace: str) -> "DescriptionPool":
+        """
+        Load the pool from the given file.
+
+        Returns an empty pool if the file cannot be read, or if its descriptions belong to another namespace than the
+        given one.
+        """
+        try:
+            data = json.loads(gzip.decompress(Path(path).read_bytes()))
+            descriptions = {caption: json.dumps(description) for caption, description in data["descriptions"].items()}
+            pool_namespace = data["namespace"]
+            profile = GenerationProfile.model_validate(data["profile"])
+        except (AttributeError, KeyError, OSError, TypeError, ValueError):
+            LOGGER.warning("Failed to load the description pool from %s", path, exc_info=True)
+            return cls()
+
+        if pool_namespace != namespace:
+            LOGGER.warning(
+                "Skipping the description pool in %s, which was generated for %s instead of %s",
+                path,
+                pool_namespace,
+                namespace,
+            )
+            return cls()
+
+        pool = cls(descriptions, profile)
+
+        LOGGER.info("Loaded %d pre-generated descriptions for %s", len(pool), namespace)
+
+        return pool
+
+    def get(self, user_prompt: str, profile: GenerationProfile) -> str | None:
+        """
+        Return the pre-generated description for the user's prompt as JSON, if any.
+
+        Descriptions are only returned for the generation profile that the pool was generated with.
+        """
+        if profile != self.profile:
+            return None
+
+        if (description := self._descriptions.get(canonicalize(user_prompt))) is None:
+            return None
+
+        POOL_HITS.inc()
+
+        return description
+
+    def save(self, path: str, namespace: str) -> None:
+        """Write the pool to the given file, noting the namespace and the generation profile of the descriptions."""
+        descriptions = {caption: json.loads(description) for caption, description in self._descriptions.items()}
+        profile = self.profile.model_dump() if self.profile else None
+        data = json.dumps(
+            {"descriptions": descriptions, "namespace": namespace, "profile": profile},
+            separators=(",", ":"),
+            sort_keys=True,
+        )
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_bytes(gzip.compress(data.encode()))
+
+
+def build(captions: list[str], concurrency: int, profile_name: str | None = None) -> DescriptionPool:
+    """
+    Generate a description for each of the given captions with the model, and return them as a pool.
+
+    Captions are described by the given number of concurrent clients, so that they are batched. Captions that share a
+    canonical form are only described once, and captions for which no valid description could be generated are left
+    out.
+    """
+    model = importlib.import_module(".model", __package__)
+    profile = settings.get_generation_profile(profile_name)
+
+    # Captions with the same canonical form would end up under the same key
+    captions = list({canonicalize(caption): caption for caption in captions}.values())
+
+    def describe(caption: str) -> tuple[str, str | None]:
+        try:
+            description = model.generate_description(caption, profile)
+        except ValidationError:
+            LOGGER.warning('Failed to generate a description for seed caption: "%s"', caption)
+            return caption, None
+
+        LOGGER.info('Generated a description for seed caption: "%s"', caption)
+
+        return caption, description.model_dump_json()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(describe, captions))
+
+    return DescriptionPool(
+        {canonicalize(caption): description for caption, description in results if description is not None},
+        profile,
+    )
+
+
+def main() -> None:
+    """Rebuild the pool of pre-generated descriptions for common captions."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--concurrency",
+        default=settings.batch_max_size,
+        type=int,
+        help="Number of captions to describe at once",
+    )
+    parser.add_argument("--output", default=settings.pool_path, help="File to write the pool to")
+    parser.add_argument("--profile", choices=list(settings.generation_profiles), help="Generation profile to use")
+    parser.add_argument("--seeds", help="File with one seed caption per line, defaults to a built-in list")
+
+    args = parser.parse_args()
+
+    if not args.output:
+        parser.error("no output file given, and POOL_PATH is not set")
+
+    # The descriptions must come from the model, not from the pool that is being rebuilt
+    settings.pool_path = None
+
+    seeds = Path(args.seeds).read_text().splitlines() if args.seeds else SEED_CAPTIONS
+    seeds = [seed.strip() for seed in seeds if seed.strip()]
+
+    build(seeds, args.concurrency, args.profile).save(args.output, generation_namespace())
+
+
+# Descriptions are only served from the pool if a pool file is configured
+pool = DescriptionPool.load(settings.pool_path, generation_namespace()) if settings.pool_path else DescriptionPool()
+
+if __name__ == "__main__":
+    main()
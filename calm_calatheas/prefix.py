@@ -0,0 +1,75 @@
+import copy
+from typing import Any
+
+import torch
+from transformers import BatchEncoding, DynamicCache, PreTrainedModel, PreTrainedTokenizerBase
+
+from .logger import LOGGER
+
+
+class PrefixCache:
+    """
+    Key/value caches for prompt prefixes that are shared by many generations, such as the system prompts.
+
+    The keys and values of each prefix are computed once. When every prompt in a batch starts with a cached prefix, the
+    batch is prepared so that the model only has to process the part of each prompt that follows the prefix.
+    """
+
+    def __init__(self, model: PreTrainedModel, tokenizer: PreTrainedTokenizerBase) -> None:
+        self._model = model
+        self._prefixes: list[tuple[list[int], DynamicCache]] = []
+        self._tokenizer = tokenizer
+
+    def add(self, input_ids: list[int]) -> None:
+        """Compute and store the keys and values for the prefix with the given token ids."""
+        with torch.no_grad():
+            output = self._model(torch.tensor([input_ids], device=self._model.device), use_cache=True)
+
+        self._prefixes.append((input_ids, output.past_key_values))
+
+        LOGGER.debug("Cached the keys and values for a prompt prefix of %d tokens", len(input_ids))
+
+    def prepare(self, rows: list[list[int]]) -> dict[str, Any]:
+        """
+        Return the inputs for a call to generate, given the token ids of each prompt.
+
+        If every prompt starts with the same cached prefix, the padding goes between the prefix and the rest of each
+        prompt, and a copy of the cached keys and values is included in the inputs. Otherwise, the prompts are padded
+        on the left as usual.
+        """
+        for prefix, cache in sorted(self._prefixes, key=lambda entry: len(entry[0]), reverse=True):
+            if all(len(row) > len(prefix) and row[: len(prefix)] == prefix for row in rows):
+                return self._prepare_with_prefix(rows, prefix, cache)
+
+        # Pad on the left so that generation continues directly from the end of each prompt
+        length = max(len(row) for row in rows)
+
+        input_ids = [[self._tokenizer.pad_token_id] * (length - len(row)) + row for row in rows]
+        attention_mask = [[0] * (length - len(row)) + [1] * len(row) for row in rows]
+
+        model_inputs = BatchEncoding({"input_ids": input_ids, "attention_mask": attention_mask}, tensor_type="pt")
+
+        return dict(model_inputs.to(self._model.device))
+
+    def _prepare_with_prefix(self, rows: list[list[int]], prefix: list[int], cache: DynamicCache) -> dict[str, Any]:
+        """Prepare the inputs for a batch of prompts that all start with the given cached prefix."""
+        length = max(len(row) for row in rows)
+
+        input_ids = []
+        attention_mask = []
+
+        for row in rows:
+            padding = length - len(row)
+
+            input_ids.append(prefix + [self._tokenizer.pad_token_id] * padding + row[len(prefix) :])
+            attention_mask.append([1] * len(prefix) + [0] * padding + [1] * (len(row) - len(prefix)))
+
+        # Generation appends to the cache, so each call gets its own copy
+        past_key_values = copy.deepcopy(cache)
+
+        if len(rows) > 1:
+            past_key_values.batch_repeat_interleave(len(rows))
+
+        model_inputs = BatchEncoding({"input_ids": input_ids, "attention_mask": attention_mask}, tensor_type="pt")
+
+        return {**model_inputs.to(self._model.device), "past_key_values": past_key_values}
@@ -0,0 +1,58 @@
+from threading import Lock
+from typing import override
+
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+
+class GenerationProgress:
+    """
+    The tokens generated so far for a single sequence.
+
+    The model adds tokens from the thread that runs it, while any other thread can read the tokens generated so far.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._output_ids: list[int] = []
+
+    def add(self, output_ids: list[int]) -> None:
+        """Add the given newly generated tokens."""
+        with self._lock:
+            self._output_ids.extend(output_ids)
+
+    def output_ids(self) -> list[int]:
+        """Return a copy of the tokens generated so far."""
+        with self._lock:
+            return list(self._output_ids)
+
+
+class ProgressStreamer(BaseStreamer):
+    """
+    Pass the tokens generated for each sequence in a batch on to the progress of that sequence, as they are produced.
+
+    Generate passes the prompt to the streamer before it runs the model, which is skipped. After that, it passes the
+    new tokens of every sequence in the batch after each step. Sequences without a progress are skipped as well.
+    Sequences that have already ended keep receiving padding until the whole batch has ended.
+    """
+
+    def __init__(self, progresses: list[GenerationProgress | None]) -> None:
+        self._progresses = progresses
+        self._prompt_skipped = False
+
+    @override
+    def end(self) -> None:
+        return
+
+    @override
+    def put(self, value: torch.Tensor) -> None:
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+
+        # A step generates one token for each sequence, unless a draft model proposed more
+        rows = value.reshape(len(self._progresses), -1).tolist()
+
+        for progress, output_ids in zip(self._progresses, rows, strict=True):
+            if progress is not None:
+                progress.add(output_ids)
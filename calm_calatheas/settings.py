@@ -1,25 +1,210 @@
-from pydantic import Field
+from typing import Literal, Self
+
+from pydantic import BaseModel, Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class GenerationProfile(BaseModel):
+    """Settings that bound how long the model can spend on a single generation."""
+
+    deadline: float | None = Field(
+        default=None,
+        description="Number of seconds after which the model has to stop thinking and write its answer",
+        gt=0,
+    )
+
+    max_content_tokens: int = Field(
+        default=1024,
+        description="Maximum number of tokens in the answer that follows the thinking content",
+        ge=1,
+    )
+
+    thinking: bool = Field(
+        default=True,
+        description="Whether the model thinks before it answers",
+    )
+
+    thinking_budget: int = Field(
+        default=4096,
+        description="Maximum number of tokens the model can spend thinking",
+        ge=0,
+    )
+
+
 class Settings(BaseSettings):
     """Settings for the application."""
 
+    batch_max_size: int = Field(
+        default=8,
+        description="Maximum number of prompts that are run through the model as a single batch",
+        ge=1,
+    )
+
+    batch_window: float = Field(
+        default=0.05,
+        description="Number of seconds to wait for more prompts before running a batch",
+        gt=0,
+    )
+
+    bulk_concurrency: int = Field(
+        default=4,
+        description="Maximum number of captions from all requests to the /describe/batch endpoint together that run "
+        "at the same time, which is kept below the number of inference workers if there is more than one",
+        ge=1,
+    )
+
+    bulk_max_prompts: int = Field(
+        default=1000,
+        description="Maximum number of prompts in a single request to the /describe/batch endpoint",
+        ge=1,
+    )
+
+    cache_backend: Literal["memory", "sqlite", "none"] = Field(
+        default="sqlite",
+        description="Where to cache generated descriptions",
+    )
+
+    cache_max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Maximum total size of the cached descriptions in bytes",
+        ge=1,
+    )
+
+    cache_path: str = Field(
+        default="cache/descriptions.sqlite3",
+        description="Path to the database file used by the sqlite cache backend",
+    )
+
+    cache_ttl: float = Field(
+        default=30 * 24 * 60 * 60,
+        description="Number of seconds a cached description remains valid",
+        gt=0,
+    )
+
+    constrained_decoding: bool = Field(
+        default=True,
+        description="Whether the model can only generate output that matches the description schema",
+    )
+
+    draft_model_name: str | None = Field(
+        default=None,
+        description="Name or path of a small model that proposes tokens for the model to verify, which must use the "
+        "same tokenizer as the model. Speculative decoding is disabled if no draft model is given",
+    )
+
+    generation_profile: str = Field(
+        default="default",
+        description="Name of the generation profile used for requests that do not ask for a profile",
+    )
+
+    generation_profiles: dict[str, GenerationProfile] = Field(
+        default={
+            "default": GenerationProfile(deadline=60),
+            "fast": GenerationProfile(deadline=20, thinking=False),
+        },
+        description="Generation profiles that requests can choose from by name",
+    )
+
     host: str = Field(
         default="localhost",
         description="Host to bind the server to",
     )
 
+    inference_backend: Literal["compile", "eager", "int8"] = Field(
+        default="eager",
+        description="How the model runs: as is, compiled with torch.compile, or quantized to int8 on the CPU",
+    )
+
+    inference_queue_size: int = Field(
+        default=8,
+        description="Maximum number of requests that can wait for a free inference worker",
+        ge=1,
+    )
+
+    inference_workers: int = Field(
+        default=8,
+        description="Number of requests that can be handed to the model at the same time",
+        ge=1,
+    )
+
+    job_queue_size: int = Field(
+        default=64,
+        description="Number of description jobs that can wait to run",
+        ge=1,
+    )
+
+    job_store_path: str = Field(
+        default="cache/jobs.sqlite3",
+        description="Path to the database file that shares description jobs between server workers",
+    )
+
+    job_ttl: float = Field(
+        default=60 * 60,
+        description="Number of seconds the result of a finished description job is kept",
+        gt=0,
+    )
+
+    job_workers: int = Field(
+        default=4,
+        description="Number of description jobs that can run at the same time",
+        ge=1,
+    )
+
     log_level: str = Field(
         default="DEBUG",
         description="Logging level for the application",
     )
 
+    model_name: str = Field(
+        default="Qwen/Qwen3-1.7B",
+        description="Name of the model on the Hugging Face Hub, or path to a local copy of the model",
+    )
+
+    model_random_weights: bool = Field(
+        default=False,
+        description="Whether to use a small model with random weights instead of the real weights, for testing",
+    )
+
     port: int = Field(
         default=8000,
         description="Port to bind the server to",
     )
 
+    pool_path: str | None = Field(
+        default=None,
+        description="Path to a file of descriptions generated ahead of time for common captions, which are served "
+        "without running the model",
+    )
+
+    prefix_caching: bool = Field(
+        default=True,
+        description="Whether the keys and values of the system prompts are computed once and reused for every prompt",
+    )
+
+    retry_after: int = Field(
+        default=30,
+        description="Number of seconds clients are asked to wait before retrying when the inference queue is full",
+    )
+
+    server_workers: int = Field(
+        default=1,
+        description="Number of server processes, which share a single copy of the model weights",
+        ge=1,
+    )
+
+    similarity_index: bool = Field(
+        default=False,
+        description="Whether captions that miss the cache can reuse the description of a near-identical caption",
+    )
+
+    similarity_threshold: float = Field(
+        default=0.75,
+        description="Minimum share of the words of the longer of two captions that the shorter caption must contain, "
+        "in the same order, for them to share a cached description",
+        ge=0,
+        le=1,
+    )
+
     static_files_path: str = Field(
         default="app",
         description="Path to the static files directory",
@@ -27,5 +212,18 @@ class Settings(BaseSettings):
 
     model_config = SettingsConfigDict(extra="ignore")
 
+    def get_generation_profile(self, name: str | None = None) -> GenerationProfile:
+        """Return the generation profile with the given name, or the default profile if no name is given."""
+        return self.generation_profiles[name or self.generation_profile]
+
+    @model_validator(mode="after")
+    def _check_generation_profile(self) -> Self:
+        """Make sure the default generation profile exists."""
+        if self.generation_profile not in self.generation_profiles:
+            reason = f"Unknown generation profile: {self.generation_profile}"
+            raise ValueError(reason)
+
+        return self
+
 
 settings = Settings()
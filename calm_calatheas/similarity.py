@@ -0,0 +1,123 @@
+import hashlib
+import random
+import re
+from collections import defaultdict
+from threading import Lock
+
+# Words that the captioning model adds or leaves out without changing what the picture shows
+STOP_WORDS = frozenset({"a", "an", "are", "is", "the", "there"})
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def canonicalize(caption: str) -> str:
+    """
+    Reduce a caption to a canonical form.
+
+    Captions that only differ in casing, punctuation or articles share the same canonical form. Word order is kept, as
+    "a dog chasing a cat" and "a cat chasing a dog" do not show the same picture.
+    """
+    return " ".join(word for word in _WORD_PATTERN.findall(caption.lower()) if word not in STOP_WORDS)
+
+
+def similarity(a: list[str], b: list[str]) -> float:
+    """
+    Return the similarity of two captions, given as lists of words.
+
+    The similarity is the share of the words of the longer caption that the shorter caption contains, in the same
+    order. If the words of the shorter caption do not all appear in the longer caption in that order, the captions are
+    not similar at all.
+    """
+    shorter, longer = sorted((a, b), key=len)
+
+    if not longer:
+        return 1.0
+
+    # Each word of the shorter caption must be found after the previous one in the longer caption
+    words = iter(longer)
+
+    if not all(word in words for word in shorter):
+        return 0.0
+
+    return len(shorter) / len(longer)
+
+
+class SimilarityIndex:
+    """
+    An index for finding the most similar canonical caption in a collection.
+
+    Each caption is reduced to a MinHash signature of its words, which is split into bands. Captions that share a band
+    are candidates for a match, and the candidate with the highest similarity above the threshold is returned. This
+    keeps lookups fast no matter how many captions are in the index.
+
+    Only captions that add words to each other, while keeping the order of the other words, can match. At the default
+    threshold of 0.75, "a cat on a couch" matches "a cat sitting on a couch". Captions in which a word was swapped for
+    another, such as "a brown cat on a bed" and "a brown dog on a bed", or in which words were moved around, such as
+    "a dog chasing a cat" and "a cat chasing a dog", never match, no matter how many words they share.
+    """
+
+    def __init__(self, threshold: float, num_bands: int = 16, band_size: int = 2) -> None:
+        self.threshold = threshold
+
+        self._band_size = band_size
+        self._buckets = defaultdict[tuple[int, int], set[str]](set)
+        self._lock = Lock()
+        self._num_bands = num_bands
+
+        # Use a fixed seed so that signatures are the same in every process
+        rng = random.Random(0)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(_MERSENNE_PRIME)) for _ in range(num_bands * band_size)
+        ]
+
+    def add(self, caption: str) -> None:
+        """Add the given canonical caption to the index."""
+        bands = self._bands(caption)
+
+        with self._lock:
+            for band in bands:
+                self._buckets[band].add(caption)
+
+    def discard(self, caption: str) -> None:
+        """Remove the given canonical caption from the index, if it is in there."""
+        bands = self._bands(caption)
+
+        with self._lock:
+            for band in bands:
+                if (bucket := self._buckets.get(band)) is not None:
+                    bucket.discard(caption)
+
+                    if not bucket:
+                        del self._buckets[band]
+
+    def find(self, caption: str) -> str | None:
+        """Return the indexed caption that is most similar to the given canonical caption, if it is similar enough."""
+        bands = self._bands(caption)
+
+        with self._lock:
+            candidates = set[str]().union(*(self._buckets.get(band, ()) for band in bands))
+
+        words = caption.split()
+
+        best, best_similarity = None, self.threshold
+
+        for candidate in candidates:
+            if (candidate_similarity := similarity(words, candidate.split())) >= best_similarity:
+                best, best_similarity = candidate, candidate_similarity
+
+        return best
+
+    def _bands(self, caption: str) -> list[tuple[int, int]]:
+        """Compute the MinHash signature of the given canonical caption and split it into bands."""
+        hashes = [int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest()) for word in caption.split()]
+
+        if not hashes:
+            hashes = [0]
+
+        signature = [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+
+        return [
+            (index, hash(tuple(signature[index * self._band_size : (index + 1) * self._band_size])))
+            for index in range(self._num_bands)
+        ]
@@ -0,0 +1,111 @@
+from collections.abc import Callable, Hashable
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, field
+from functools import partial
+from threading import Lock
+from typing import Any
+
+from .cancellation import CancellationToken, GenerationCancelledError
+from .logger import LOGGER
+from .metrics import COALESCED_CALLS
+
+
+@dataclass
+class _Flight[R]:
+    """A call that is in flight, and the callers waiting for it."""
+
+    cancellation: CancellationToken = field(default_factory=CancellationToken)
+    future: Future[R] = field(default_factory=Future)
+    waiting: int = 0
+
+
+class SingleFlight[K: Hashable, R]:
+    """
+    Make sure that a call with a given key is only in flight once at a time.
+
+    The first caller with a key runs the function. Anyone who calls with the same key while it is running waits for
+    that call instead, and gets the same result or error. Once the call has finished, or once every caller waiting for
+    it has given up, the next call with the key runs the function again.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[K, _Flight[R]] = {}
+        self._lock = Lock()
+
+    def run(self, key: K, fn: Callable[[CancellationToken], R], cancellation: CancellationToken | None = None) -> R:
+        """
+        Run the given function, or wait for the call with the same key that is already in flight.
+
+        The function is given a token that is cancelled once every caller waiting for the call has cancelled their own
+        token. Callers that do not pass a token never give up on the call.
+
+        Raises:
+            GenerationCancelledError: If the given token is cancelled while waiting for a call that is already in
+                flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if flight is None:
+                flight = self._flights[key] = _Flight[R]()
+
+            flight.waiting += 1
+
+        if cancellation:
+            cancellation.on_cancel(partial(self._give_up, key, flight))
+
+        if not leader:
+            LOGGER.debug("Waiting for a call with the same key that is already in flight")
+            COALESCED_CALLS.inc()
+            return self._wait(flight, cancellation)
+
+        try:
+            result = fn(flight.cancellation)
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            self._land(key, flight)
+
+    def _give_up(self, key: K, flight: _Flight[R]) -> None:
+        """
+        Stop waiting for the given call, and cancel it if nobody else is waiting for it.
+
+        A cancelled call is landed right away, so that the next call with the key does not wait for its result.
+        """
+        with self._lock:
+            flight.waiting -= 1
+            abandoned = flight.waiting == 0
+
+        if abandoned:
+            self._land(key, flight)
+            flight.cancellation.cancel()
+
+    def _land(self, key: K, flight: _Flight[R]) -> None:
+        """Stop new callers with the given key from waiting for the given call, if they still would."""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _wait(self, flight: _Flight[R], cancellation: CancellationToken | None) -> R:
+        """
+        Wait for the result of the given call, or until the given token is cancelled.
+
+        Raises:
+            GenerationCancelledError: If the token is cancelled before the result is available.
+        """
+        if cancellation:
+            cancelled = Future[None]()
+            cancellation.on_cancel(lambda: cancelled.set_result(None))
+
+            futures: list[Future[Any]] = [flight.future, cancelled]
+            wait(futures, return_when=FIRST_COMPLETED)
+
+            if not flight.future.done():
+                raise GenerationCancelledError
+
+        return flight.future.result()
@@ -0,0 +1,35 @@
+from threading import local
+from typing import TYPE_CHECKING
+
+import torch
+
+if TYPE_CHECKING:
+    from .backends import CausalLanguageModel
+
+
+class DraftModel:
+    """
+    A small model that proposes tokens for speculative decoding, which the model then verifies in a single step.
+
+    With greedy decoding, the model accepts the longest run of proposed tokens that matches what it would have
+    generated itself, so the output is the same as without the draft model. When sampling, as the generation config
+    of Qwen3 does, proposed tokens are accepted at random such that the output follows the same distribution as
+    without the draft model, but the sampled text differs. Either way the output is produced in fewer steps of the
+    larger model. The draft model proposes one token per forward pass, which is counted separately for each thread
+    that runs the model.
+    """
+
+    def __init__(self, model: "CausalLanguageModel") -> None:
+        self.model = model
+
+        self._counts = local()
+
+        model.register_forward_hook(self._count)
+
+    def proposed(self) -> int:
+        """Return the number of tokens the draft model has proposed on the current thread."""
+        return getattr(self._counts, "proposed", 0)
+
+    def _count(self, _module: torch.nn.Module, _args: tuple[object, ...], _output: object) -> None:
+        """Count a token proposed by the draft model."""
+        self._counts.proposed = self.proposed() + 1
@@ -0,0 +1,23 @@
+from typing import cast, override
+
+import torch
+from transformers import StoppingCriteria
+
+from .cancellation import CancellationToken
+
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """
+    Stop generating a sequence as soon as its cancellation token is cancelled.
+
+    Each sequence in the batch has its own token, or None if it cannot be cancelled. A cancelled sequence is finished
+    at the next decode step, and generation ends once every sequence in the batch has finished.
+    """
+
+    def __init__(self, cancellations: list[CancellationToken | None]) -> None:
+        self._cancellations = cancellations
+
+    @override
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs: object) -> torch.BoolTensor:
+        cancelled = [cancellation is not None and cancellation.cancelled for cancellation in self._cancellations]
+        return cast("torch.BoolTensor", torch.tensor(cancelled, dtype=torch.bool, device=input_ids.device))
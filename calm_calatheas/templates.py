@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+from typing import cast
+
+from transformers import PreTrainedTokenizerBase
+
+from .metrics import STAGE_DURATION
+
+# Stands in for the user's message when the template around it is rendered
+PLACEHOLDER = "\0"
+
+
+@dataclass(frozen=True)
+class _Template:
+    """The token ids of a prompt before and after the user's message, and whether the two can be joined as they are."""
+
+    head: list[int]
+    tail: list[int]
+    exact: bool
+
+
+class ChatTemplateCache:
+    """
+    The token ids of the fixed parts of chat prompts, so that only the user's message has to be tokenized.
+
+    The system prompts are hundreds of tokens long, while the user's message is a short caption, yet rendering and
+    tokenizing a prompt costs the same for every token. Each template is therefore rendered and tokenized once, with a
+    placeholder for the user's message, and split into the token ids that come before and after it. A prompt is then
+    put together from those token ids and the token ids of the user's message.
+
+    When a template is first seen, a sample prompt is tokenized both ways to check that the result is the same. A
+    template that fails the check is always rendered and tokenized in full, and so is a message that starts or ends
+    with whitespace, since the tokenizer may merge that with the template around it.
+    """
+
+    def __init__(self, tokenizer: PreTrainedTokenizerBase) -> None:
+        self._templates: dict[tuple[tuple[tuple[str, str], ...], bool], _Template] = {}
+        self._tokenizer = tokenizer
+
+    def encode(self, conversations: list[list[dict[str, str]]], thinking: list[bool]) -> list[list[int]]:
+        """
+        Return the token ids of the prompt for each of the given conversations, which end with the user's message.
+
+        The user's messages are tokenized in a single call. Each conversation is rendered with or without thinking, as
+        given for the conversation.
+        """
+        rows: list[list[int]] = [[] for _ in conversations]
+        split: list[tuple[int, _Template]] = []
+
+        for index, (messages, enable_thinking) in enumerate(zip(conversations, thinking, strict=True)):
+            template = self._template(messages[:-1], enable_thinking=enable_thinking)
+            content = messages[-1]["content"]
+
+            if template.exact and content == content.strip():
+                split.append((index, template))
+            else:
+                rows[index] = self._tokenizer(self._render(messages, enable_thinking=enable_thinking)).input_ids
+
+        if split:
+            contents = [conversations[index][-1]["content"] for index, _ in split]
+            content_ids = self._tokenizer(contents, add_special_tokens=False).input_ids
+
+            for (index, template), ids in zip(split, content_ids, strict=True):
+                rows[index] = template.head + ids + template.tail
+
+        return rows
+
+    def head(self, messages: list[dict[str, str]]) -> list[int]:
+        """Return the token ids of a prompt with the given messages, up to where the user's message begins."""
+        # Whether the model thinks only changes what follows the user's message
+        return self._template(messages, enable_thinking=True).head
+
+    def _render(self, messages: list[dict[str, str]], *, enable_thinking: bool) -> str:
+        """Render the given conversation as a prompt for the model."""
+        with STAGE_DURATION.time(stage="apply_chat_template"):
+            # Without tokenizing, the template is rendered as a single string
+            return cast(
+                "str",
+                self._tokenizer.apply_chat_template(
+                    messages,
+                    tokenize=False,
+                    add_generation_prompt=True,
+                    enable_thinking=enable_thinking,
+                ),
+            )
+
+    def _template(self, messages: list[dict[str, str]], *, enable_thinking: bool) -> _Template:
+        """Return the template for a conversation that starts with the given messages, followed by a user's message."""
+        key = (tuple((message["role"], message["content"]) for message in messages), enable_thinking)
+
+        if (template := self._templates.get(key)) is None:
+            messages_with_placeholder = [*messages, {"role": "user", "content": PLACEHOLDER}]
+            head, tail = self._render(messages_with_placeholder, enable_thinking=enable_thinking).split(PLACEHOLDER)
+
+            head_ids = self._tokenizer(head).input_ids
+            tail_ids = self._tokenizer(tail, add_special_tokens=False).input_ids
+
+            # Tokenizing a sample prompt in parts must give the same result as tokenizing it in full
+            sample = "a sample caption"
+            sample_ids = self._tokenizer(sample, add_special_tokens=False).input_ids
+            messages_with_sample = [*messages, {"role": "user", "content": sample}]
+            expected = self._tokenizer(self._render(messages_with_sample, enable_thinking=enable_thinking))
+
+            template = self._templates[key] = _Template(
+                head=head_ids,
+                tail=tail_ids,
+                exact=head_ids + sample_ids + tail_ids == expected.input_ids,
+            )
+
+        return template
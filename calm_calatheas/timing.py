@@ -0,0 +1,95 @@
+import time
+from dataclasses import dataclass, field, fields
+from threading import Lock
+from typing import override
+
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+
+@dataclass
+class GenerationStats:
+    """Running totals that describe the work done by the model since the application started."""
+
+    decode_seconds: float = 0.0
+    decode_tokens: int = 0
+    draft_accepted_tokens: int = 0
+    draft_proposed_tokens: int = 0
+    generations: int = 0
+    prefill_seconds: float = 0.0
+    prefill_tokens: int = 0
+    repairs: int = 0
+
+    _lock: Lock = field(default_factory=Lock, repr=False)
+
+    def add(self, **values: float) -> None:
+        """Add the given values to the totals with the same names."""
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict[str, float]:
+        """Return a copy of the current totals."""
+        with self._lock:
+            return {item.name: getattr(self, item.name) for item in fields(self) if not item.name.startswith("_")}
+
+
+class GenerationTimer(BaseStreamer):
+    """
+    Measure how long the prefill and decode phases of a call to generate take.
+
+    Generate passes the prompt to the streamer before it runs the model, and passes each new token as soon as it has
+    been generated. Prefill ends when the first new token arrives. If another streamer is given, everything is passed
+    on to it.
+
+    Each batch of new tokens is the result of a single decode step. That is one token per step, unless a draft model
+    proposes tokens, in which case the model accepts any number of them in a single step.
+    """
+
+    def __init__(self, streamer: BaseStreamer | None = None) -> None:
+        self._ended_at: float | None = None
+        self._first_token_at: float | None = None
+        self._started_at: float | None = None
+        self._steps = 0
+        self._streamer = streamer
+
+    @property
+    def decode_seconds(self) -> float:
+        """The number of seconds between the first and the last generated token."""
+        if self._first_token_at is None or self._ended_at is None:
+            return 0.0
+
+        return self._ended_at - self._first_token_at
+
+    @property
+    def prefill_seconds(self) -> float:
+        """The number of seconds it took to process the prompt and generate the first token."""
+        if self._started_at is None or self._first_token_at is None:
+            return 0.0
+
+        return self._first_token_at - self._started_at
+
+    @property
+    def steps(self) -> int:
+        """The number of decode steps, each of which generated one or more new tokens."""
+        return self._steps
+
+    @override
+    def end(self) -> None:
+        self._ended_at = time.perf_counter()
+
+        if self._streamer:
+            self._streamer.end()
+
+    @override
+    def put(self, value: torch.Tensor) -> None:
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+        else:
+            self._steps += 1
+
+            if self._first_token_at is None:
+                self._first_token_at = time.perf_counter()
+
+        if self._streamer:
+            self._streamer.put(value)
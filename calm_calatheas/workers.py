@@ -0,0 +1,88 @@
+import contextlib
+import gc
+import os
+import signal
+import socket
+from types import FrameType
+
+import torch
+import uvicorn
+
+from .app import app
+from .loader import loader
+from .logger import LOGGER
+from .settings import settings
+
+
+def serve(workers: int) -> None:
+    """
+    Serve the application from the given number of worker processes, which share a single copy of the model weights.
+
+    The model is loaded once, in this process, and the workers are forked from it once it is ready. The weights are
+    only ever read, so the memory that holds them stays shared between the workers instead of being copied into each
+    of them. Every worker runs its own event loop, and accepts connections on a listening socket that they all share.
+    A worker that exits is replaced, until this process is asked to stop.
+    """
+    listener = socket.create_server((settings.host, settings.port), backlog=2048)
+
+    # The thread pool torch uses for parallel work does not survive a fork, and can leave the workers deadlocked. Load
+    # the model without it, and let each worker start its own pool, sized to its share of the cores.
+    torch.set_num_threads(1)
+    threads = max((os.cpu_count() or 1) // workers, 1)
+
+    loader.load()
+
+    if loader.error:
+        raise loader.error
+
+    # Everything loaded so far lives as long as the process. Keep the garbage collector of each worker from touching
+    # these objects, since writing to them would copy the memory they live in.
+    gc.freeze()
+
+    children: dict[int, int] = {}
+    stopping = False
+
+    def stop(_signal: int, _frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(workers):
+        children[_fork(listener, index, threads)] = index
+
+    while children:
+        pid, status = os.wait()
+        index = children.pop(pid)
+
+        if not stopping:
+            LOGGER.warning(
+                "Server worker %d exited with code %d, replacing it",
+                index,
+                os.waitstatus_to_exitcode(status),
+            )
+            children[_fork(listener, index, threads)] = index
+
+
+def _fork(listener: socket.socket, index: int, threads: int) -> int:
+    """Fork a worker that serves the application on the given socket, and return its process id."""
+    if pid := os.fork():
+        return pid
+
+    # Let the server of the worker handle signals itself
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    torch.set_num_threads(threads)
+
+    LOGGER.info("Started server worker %d with %d thread(s)", index, threads)
+
+    uvicorn.Server(uvicorn.Config(app)).run(sockets=[listener])
+
+    # Never return to the loop of the parent process
+    os._exit(0)
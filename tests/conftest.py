@@ -4,11 +4,24 @@ from pathlib import Path
 import pytest
 from playwright.sync_api import Page, expect
 from testcontainers.compose import DockerCompose
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
 
 DESCRIPTION_GENERATED_TIMEOUT_MS = 600000
 CAPTION_MODEL_LOADED_TIMEOUT_MS = 30000
 PYSCRIPT_READY_TIMEOUT_MS = 30000
 
+# A chat template in the format of the model, which renders the conversation with or without thinking
+CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<|im_start|>{{ message.role }}\n{{ message.content }}<|im_end|>\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}"
+    "<|im_start|>assistant\n"
+    "{% if enable_thinking is defined and not enable_thinking %}<think>\n\n</think>\n\n{% endif %}"
+    "{% endif %}"
+)
+
 
 @pytest.fixture(scope="session")
 def compose() -> Generator[DockerCompose]:
@@ -47,3 +60,28 @@ def model_loaded(app: Page) -> Page:
     expect(notification).not_to_be_visible(timeout=CAPTION_MODEL_LOADED_TIMEOUT_MS)
 
     return app
+
+
+@pytest.fixture(scope="session")
+def tokenizer() -> PreTrainedTokenizerFast:
+    """
+    Return a small tokenizer with a token for each byte, and the special tokens and chat template of the model.
+
+    Tests that need a tokenizer use this one, so that they do not have to download the model.
+    """
+    vocab = {character: index for index, character in enumerate(sorted(pre_tokenizers.ByteLevel.alphabet()))}
+
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False, use_regex=False)  # type: ignore[setter is available]
+    backend.decoder = decoders.ByteLevel()  # type: ignore[setter is available]
+
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        additional_special_tokens=["<|im_start|>"],
+        eos_token="<|im_end|>",  # noqa: S106
+        pad_token="<|endoftext|>",  # noqa: S106
+    )
+    tokenizer.add_tokens(["<think>", "</think>"])
+    tokenizer.chat_template = CHAT_TEMPLATE
+
+    return tokenizer
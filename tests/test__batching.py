@@ -0,0 +1,110 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, cast
+
+import pytest
+import torch
+
+from calm_calatheas.batching import BatchScheduler
+from calm_calatheas.cancellation import CancellationToken, GenerationCancelledError
+from calm_calatheas.prefix import PrefixCache
+
+if TYPE_CHECKING:
+    from transformers import PreTrainedModel, PreTrainedTokenizerBase
+
+PAD_TOKEN_ID = 0
+TIMEOUT = 10
+
+
+def test__batches_are_split_at_the_maximum_size() -> None:
+    """
+    Test that requests submitted together are split into batches of at most the maximum size.
+
+    Asserts:
+        - No batch holds more requests than the maximum batch size.
+        - Every request is processed exactly once.
+        - Each caller gets the result for its own item.
+    """
+    batches: list[list[int]] = []
+
+    def process(batch: list[int]) -> list[int]:
+        batches.append(batch)
+        return [item * 2 for item in batch]
+
+    scheduler = BatchScheduler[int, int](process, 3, 0.2)
+
+    with ThreadPoolExecutor(max_workers=7) as executor:
+        results = list(executor.map(scheduler.submit, range(7)))
+
+    assert results == [item * 2 for item in range(7)]
+    assert all(len(batch) <= 3 for batch in batches)
+    assert sorted(item for batch in batches for item in batch) == list(range(7))
+
+
+def test__failed_batch_fails_every_request() -> None:
+    """
+    Test that an error raised while processing a batch is passed on to every caller in the batch.
+
+    Asserts:
+        - Each caller gets the error that was raised.
+    """
+
+    def fail(_: list[int]) -> list[int]:
+        raise ValueError
+
+    scheduler = BatchScheduler[int, int](fail, 3, 0.2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(scheduler.submit, item) for item in range(2)]
+
+        for future in futures:
+            with pytest.raises(ValueError):  # noqa: PT011
+                future.result(TIMEOUT)
+
+
+def test__cancelled_request_stops_waiting() -> None:
+    """
+    Test that a caller stops waiting for its result once its token is cancelled.
+
+    Asserts:
+        - The caller gets a `GenerationCancelledError` while the batch is still being processed.
+    """
+    started, release = Event(), Event()
+
+    def process(batch: list[int]) -> list[int]:
+        started.set()
+        release.wait(TIMEOUT)
+        return batch
+
+    scheduler = BatchScheduler[int, int](process, 1, 0.01)
+    cancellation = CancellationToken()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(scheduler.submit, 1, cancellation)
+        started.wait(TIMEOUT)
+
+        cancellation.cancel()
+
+        with pytest.raises(GenerationCancelledError):
+            future.result(TIMEOUT)
+
+        release.set()
+
+
+def test__prompts_in_a_batch_are_padded_on_the_left() -> None:
+    """
+    Test that prompts of different lengths are padded on the left, so that generation continues from their ends.
+
+    Asserts:
+        - Every prompt is padded to the length of the longest prompt.
+        - The padding comes before the prompt, and is left out of the attention mask.
+    """
+    model = cast("PreTrainedModel", SimpleNamespace(device=torch.device("cpu")))
+    tokenizer = cast("PreTrainedTokenizerBase", SimpleNamespace(pad_token_id=PAD_TOKEN_ID))
+
+    model_inputs = PrefixCache(model, tokenizer).prepare([[5, 6, 7], [8]])
+
+    assert model_inputs["input_ids"].tolist() == [[5, 6, 7], [PAD_TOKEN_ID, PAD_TOKEN_ID, 8]]
+    assert model_inputs["attention_mask"].tolist() == [[1, 1, 1], [0, 0, 1]]
+    assert "past_key_values" not in model_inputs
@@ -0,0 +1,107 @@
+import pytest
+import torch
+
+from calm_calatheas.budget import GenerationBudgetLogitsProcessor, max_new_tokens
+from calm_calatheas.settings import GenerationProfile
+
+EOS_TOKEN_ID = 9
+PROMPT = [1, 2]
+THINK_END_TOKEN_ID = 8
+VOCABULARY_SIZE = 10
+
+
+def forced(processor: GenerationBudgetLogitsProcessor, rows: list[list[int]]) -> list[int | None]:
+    """Run the processor on the given generated tokens, and return the token it forces for each row, if any."""
+    scores = processor(
+        torch.tensor([PROMPT + row for row in rows]),  # type: ignore[generate passes a tensor of token ids]
+        torch.zeros(len(rows), VOCABULARY_SIZE),  # type: ignore[generate passes a tensor of scores]
+    )
+
+    allowed = scores > float("-inf")
+
+    return [int(row.nonzero()[0]) if row.sum() == 1 else None for row in allowed]
+
+
+def start(*profiles: GenerationProfile) -> GenerationBudgetLogitsProcessor:
+    """Create a processor for the given profiles, and show it the prompt like the first step of a generation does."""
+    processor = GenerationBudgetLogitsProcessor(list(profiles), THINK_END_TOKEN_ID, [EOS_TOKEN_ID])
+    forced(processor, [[] for _ in profiles])
+
+    return processor
+
+
+def test__max_new_tokens_covers_thinking_and_content() -> None:
+    """
+    Test that the maximum number of new tokens covers both the thinking budget and the content.
+
+    Asserts:
+        - With thinking, the thinking budget, the end of the thinking content and the content all fit.
+        - Without thinking, only the content fits.
+    """
+    assert max_new_tokens(GenerationProfile(thinking_budget=10, max_content_tokens=5)) == 16
+    assert max_new_tokens(GenerationProfile(thinking=False, thinking_budget=10, max_content_tokens=5)) == 5
+
+
+def test__thinking_stops_at_the_budget() -> None:
+    """
+    Test that a sequence that runs out of thinking tokens is made to stop thinking.
+
+    Asserts:
+        - Nothing is forced while the sequence is within its thinking budget.
+        - The end of the thinking content is forced once the budget is spent.
+    """
+    processor = start(GenerationProfile(thinking_budget=3))
+
+    assert forced(processor, [[3, 3]]) == [None]
+    assert forced(processor, [[3, 3, 3]]) == [THINK_END_TOKEN_ID]
+
+
+def test__content_stops_at_the_budget() -> None:
+    """
+    Test that a sequence that runs out of content tokens is ended.
+
+    Asserts:
+        - Nothing is forced while the content is within its budget.
+        - The end of sequence token is forced once the content budget is spent, with or without thinking.
+    """
+    thinking = start(GenerationProfile(max_content_tokens=2))
+
+    assert forced(thinking, [[3, THINK_END_TOKEN_ID, 4]]) == [None]
+    assert forced(thinking, [[3, THINK_END_TOKEN_ID, 4, 4]]) == [EOS_TOKEN_ID]
+
+    not_thinking = start(GenerationProfile(thinking=False, max_content_tokens=2))
+
+    assert forced(not_thinking, [[4]]) == [None]
+    assert forced(not_thinking, [[4, 4]]) == [EOS_TOKEN_ID]
+
+
+def test__thinking_stops_at_the_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a sequence that is still thinking when the deadline passes is made to stop thinking.
+
+    Asserts:
+        - Nothing is forced before the deadline.
+        - The end of the thinking content is forced once the deadline has passed.
+    """
+    now = 1000.0
+    monkeypatch.setattr("calm_calatheas.budget.time.monotonic", lambda: now)
+
+    processor = start(GenerationProfile(deadline=10))
+
+    assert forced(processor, [[3]]) == [None]
+
+    now += 10
+
+    assert forced(processor, [[3, 3]]) == [THINK_END_TOKEN_ID]
+
+
+def test__each_sequence_keeps_to_its_own_profile() -> None:
+    """
+    Test that each sequence in a batch is kept within the budget of its own profile.
+
+    Asserts:
+        - Only the sequence whose budget is spent is forced.
+    """
+    processor = start(GenerationProfile(thinking_budget=2), GenerationProfile(thinking_budget=10))
+
+    assert forced(processor, [[3, 3], [3, 3]]) == [THINK_END_TOKEN_ID, None]
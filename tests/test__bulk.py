@@ -0,0 +1,95 @@
+import asyncio
+import time
+from threading import Lock
+from types import SimpleNamespace
+
+import pytest
+
+from calm_calatheas import bulk
+from calm_calatheas.bulk import describe_all
+from calm_calatheas.cancellation import CancellationToken
+from calm_calatheas.description import PokemonDescription, PokemonType
+from calm_calatheas.loader import loader
+from calm_calatheas.settings import GenerationProfile
+
+DESCRIPTION = PokemonDescription(
+    ability="Static",
+    category="Mouse",
+    flavor_text="It stores electricity in its cheeks.",
+    habitat="Forest",
+    height=0.4,
+    name="Sparkit",
+    types={PokemonType.ELECTRIC},
+    weight=6.0,
+)
+
+CONCURRENCY = 2
+PROMPTS = 6
+TIMEOUT = 10
+
+
+async def test__bulk_requests_share_a_concurrency_limit(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that bulk requests that run at the same time share a single limit on the number of captions being described.
+
+    Asserts:
+        - Every caption of both requests is described.
+        - No more captions than the limit are described at the same time, across both requests.
+    """
+    lock = Lock()
+    running, most_running = 0, 0
+
+    def generate_description(*_: object) -> PokemonDescription:
+        nonlocal running, most_running
+
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+
+        time.sleep(0.05)
+
+        with lock:
+            running -= 1
+
+        return DESCRIPTION
+
+    monkeypatch.setattr(
+        loader,
+        "_model",
+        SimpleNamespace(find_cached_description=lambda *_: None, generate_description=generate_description),
+    )
+    monkeypatch.setattr(bulk, "_SEMAPHORE", asyncio.Semaphore(CONCURRENCY))
+
+    async def describe(prefix: str) -> list[dict]:
+        prompts = [f"{prefix} {index}" for index in range(PROMPTS)]
+        return [result async for result in describe_all(prompts, GenerationProfile(), CancellationToken())]
+
+    results = await asyncio.gather(describe("a cat"), describe("a dog"))
+
+    assert all("description" in result for request in results for result in request)
+    assert most_running <= CONCURRENCY
+
+
+async def test__cached_descriptions_do_not_wait_for_a_turn(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that captions with a cached description are answered while every turn of the bulk requests is taken.
+
+    Asserts:
+        - The cached description is returned without waiting for a turn.
+        - The model is not used for the cached caption.
+    """
+
+    def generate_description(*_: object) -> PokemonDescription:
+        raise AssertionError
+
+    monkeypatch.setattr(
+        loader,
+        "_model",
+        SimpleNamespace(find_cached_description=lambda *_: DESCRIPTION, generate_description=generate_description),
+    )
+    monkeypatch.setattr(bulk, "_SEMAPHORE", asyncio.Semaphore(0))
+
+    results = describe_all(["a cat"], GenerationProfile(), CancellationToken())
+    result = await asyncio.wait_for(anext(results), TIMEOUT)
+
+    assert result == {"index": 0, "prompt": "a cat", "description": DESCRIPTION.model_dump(mode="json")}
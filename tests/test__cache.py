@@ -0,0 +1,120 @@
+from collections.abc import Callable
+from pathlib import Path
+
+import pytest
+
+from calm_calatheas.cache import DescriptionCache, MemoryCache, SqliteCache
+from calm_calatheas.settings import GenerationProfile
+
+NAMESPACE = "test"
+PROFILE = GenerationProfile()
+TTL = 60
+
+type CreateCache = Callable[[int], DescriptionCache]
+
+
+class Clock:
+    """A clock that only moves when it is told to."""
+
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        """Return the current time."""
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    """Replace the clock of the cache with one that only moves when it is told to."""
+    clock = Clock()
+    monkeypatch.setattr("calm_calatheas.cache.time.time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def create_cache(request: pytest.FixtureRequest, tmp_path: Path) -> CreateCache:
+    """Return a function that creates a cache with the given budget, for each of the cache backends."""
+
+    def create(max_bytes: int) -> DescriptionCache:
+        if request.param == "memory":
+            return MemoryCache(NAMESPACE, max_bytes, TTL)
+
+        return SqliteCache(NAMESPACE, str(tmp_path / "cache.sqlite3"), max_bytes, TTL)
+
+    return create
+
+
+def test__entries_expire_after_the_time_to_live(create_cache: CreateCache, clock: Clock) -> None:
+    """
+    Test that an entry is no longer returned once it is older than the time to live.
+
+    Asserts:
+        - The entry is returned while it is younger than the time to live.
+        - The entry is not returned once it is older than the time to live.
+    """
+    cache = create_cache(1024)
+    cache.set("a cat on a couch", PROFILE, "cat")
+
+    clock.now += TTL - 1
+
+    assert cache.get("a cat on a couch", PROFILE) == "cat"
+
+    clock.now += 2
+
+    assert cache.get("a cat on a couch", PROFILE) is None
+
+
+def test__least_recently_used_entries_are_evicted(create_cache: CreateCache, clock: Clock) -> None:
+    """
+    Test that the least recently used entries are evicted once the cache is over its budget.
+
+    Asserts:
+        - The entry that was used least recently is evicted.
+        - The entry that was read after it was stored, and the newest entry, are kept.
+    """
+    cache = create_cache(8)
+
+    cache.set("first", PROFILE, "1111")
+    clock.now += 1
+    cache.set("second", PROFILE, "2222")
+    clock.now += 1
+
+    assert cache.get("first", PROFILE) == "1111"
+
+    clock.now += 1
+    cache.set("third", PROFILE, "3333")
+
+    assert cache.get("second", PROFILE) is None
+    assert cache.get("first", PROFILE) == "1111"
+    assert cache.get("third", PROFILE) == "3333"
+
+
+def test__captions_share_entries_once_canonicalized(create_cache: CreateCache) -> None:
+    """
+    Test that captions that only differ in casing, punctuation or articles share an entry.
+
+    Asserts:
+        - The entry stored for one caption is returned for the other.
+        - A caption with the same words in another order does not share the entry.
+    """
+    cache = create_cache(1024)
+    cache.set("A dog chasing a cat.", PROFILE, "dog")
+
+    assert cache.get("the dog chasing the cat", PROFILE) == "dog"
+    assert cache.get("a cat chasing a dog", PROFILE) is None
+
+
+def test__profiles_do_not_share_entries(create_cache: CreateCache) -> None:
+    """
+    Test that an entry stored for one generation profile is not returned for another.
+
+    Asserts:
+        - The entry is returned for the profile that it was stored for.
+        - The entry is not returned for another profile.
+    """
+    cache = create_cache(1024)
+    cache.set("a cat on a couch", PROFILE, "cat")
+
+    assert cache.get("a cat on a couch", PROFILE) == "cat"
+    assert cache.get("a cat on a couch", GenerationProfile(thinking=False)) is None
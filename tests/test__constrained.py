@@ -0,0 +1,139 @@
+import json
+from typing import cast
+
+import pytest
+import torch
+from transformers import PreTrainedTokenizerFast
+
+from calm_calatheas.constrained import JsonSchemaGrammar, JsonSchemaLogitsProcessor
+from calm_calatheas.description import PokemonDescription
+
+DESCRIPTION = {
+    "ability": "Static",
+    "category": "Mouse",
+    "flavor_text": "It stores electricity in its cheeks.",
+    "habitat": "Forest",
+    "height": 0.4,
+    "name": "Sparkit",
+    "types": ["electric"],
+    "weight": 6.0,
+}
+
+
+class Generation:
+    """Pass generated tokens to a logits processor one at a time, like the model does while it generates."""
+
+    def __init__(
+        self,
+        grammar: JsonSchemaGrammar,
+        tokenizer: PreTrainedTokenizerFast,
+        start_token_id: int | None = None,
+    ) -> None:
+        self.input_ids = tokenizer("a caption").input_ids
+
+        self._processor = JsonSchemaLogitsProcessor(grammar, [cast("int", tokenizer.eos_token_id)], [start_token_id])
+        self._vocabulary_size = len(tokenizer)
+
+    def add(self, tokens: list[int]) -> None:
+        """Generate the given tokens, checking that each of them is allowed."""
+        for token in tokens:
+            assert self.allowed()[token]
+            self.input_ids.append(token)
+
+    def allowed(self) -> torch.Tensor:
+        """Return a mask of the tokens that the processor allows as the next token."""
+        scores = self._processor(
+            torch.tensor([self.input_ids]),  # type: ignore[generate passes a tensor of token ids]
+            torch.zeros(1, self._vocabulary_size),  # type: ignore[generate passes a tensor of scores]
+        )
+
+        return scores[0] > float("-inf")
+
+
+@pytest.fixture(scope="module")
+def grammar(tokenizer: PreTrainedTokenizerFast) -> JsonSchemaGrammar:
+    """Return the grammar of the description schema."""
+    return JsonSchemaGrammar(PokemonDescription.model_json_schema(), tokenizer)
+
+
+def test__valid_description_is_allowed(grammar: JsonSchemaGrammar, tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that every token of a description that matches the schema is allowed.
+
+    Asserts:
+        - Each token of the description is allowed when it is generated.
+        - Once the description is complete, only the end of sequence token is allowed.
+    """
+    generation = Generation(grammar, tokenizer)
+
+    generation.add(tokenizer(json.dumps(DESCRIPTION), add_special_tokens=False).input_ids)
+
+    assert generation.allowed().nonzero().flatten().tolist() == [tokenizer.eos_token_id]
+
+
+def test__output_starts_with_an_object(grammar: JsonSchemaGrammar, tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that the output has to start with the opening brace of an object.
+
+    Asserts:
+        - The only token allowed at the start is the opening brace.
+    """
+    generation = Generation(grammar, tokenizer)
+
+    assert generation.allowed().nonzero().flatten().tolist() == tokenizer("{", add_special_tokens=False).input_ids
+
+
+def test__numbers_only_allow_digits(grammar: JsonSchemaGrammar, tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that a number property only allows the characters of a number.
+
+    Asserts:
+        - Digits are allowed at the start of the number.
+        - Letters and quotes are not allowed.
+    """
+    generation = Generation(grammar, tokenizer)
+
+    prefix = json.dumps(DESCRIPTION).split('"height": ')[0] + '"height": '
+    generation.add(tokenizer(prefix, add_special_tokens=False).input_ids)
+
+    allowed = generation.allowed()
+
+    assert all(allowed[token] for token in tokenizer("0123456789", add_special_tokens=False).input_ids)
+    assert not any(allowed[token] for token in tokenizer('a"', add_special_tokens=False).input_ids)
+
+
+def test__strings_end_at_their_maximum_length(grammar: JsonSchemaGrammar, tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that a string property has to be closed once it reaches its maximum length.
+
+    Asserts:
+        - Once the habitat is as long as the schema allows, the closing quote is the only allowed token.
+    """
+    generation = Generation(grammar, tokenizer)
+
+    max_length = PokemonDescription.model_json_schema()["properties"]["habitat"]["maxLength"]
+    prefix = json.dumps(DESCRIPTION).split('"habitat": ')[0] + '"habitat": "' + "a" * max_length
+    generation.add(tokenizer(prefix, add_special_tokens=False).input_ids)
+
+    assert generation.allowed().nonzero().flatten().tolist() == tokenizer('"', add_special_tokens=False).input_ids
+
+
+def test__output_is_free_until_the_start_token(grammar: JsonSchemaGrammar, tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that the output is not constrained until the start token has been generated.
+
+    Asserts:
+        - Every token is allowed while the model is thinking.
+        - Once the start token has been generated, the output has to match the schema.
+    """
+    think_end_token_id = cast("int", tokenizer.convert_tokens_to_ids("</think>"))
+    generation = Generation(grammar, tokenizer, think_end_token_id)
+
+    generation.add(tokenizer("not json", add_special_tokens=False).input_ids)
+
+    assert generation.allowed().all()
+
+    generation.add([think_end_token_id])
+    generation.add(tokenizer(json.dumps(DESCRIPTION), add_special_tokens=False).input_ids)
+
+    assert generation.allowed().nonzero().flatten().tolist() == [tokenizer.eos_token_id]
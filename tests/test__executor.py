@@ -0,0 +1,66 @@
+import asyncio
+from threading import Event
+
+import pytest
+
+from calm_calatheas.executor import InferenceExecutor, QueueFullError
+
+TIMEOUT = 10
+
+
+async def test__full_queue_rejects_jobs() -> None:
+    """
+    Test that a job submitted while every worker is busy and the queue is full is rejected.
+
+    Asserts:
+        - Jobs are accepted until the workers and the queue are at capacity.
+        - The next job is rejected with a `QueueFullError`.
+        - Once the jobs have finished, their slots are freed and new jobs are accepted again.
+    """
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+    release = Event()
+
+    running = executor.submit(release.wait, TIMEOUT)
+    queued = executor.submit(release.wait, TIMEOUT)
+
+    assert executor.pending == 2
+
+    with pytest.raises(QueueFullError):
+        executor.submit(release.wait, TIMEOUT)
+
+    release.set()
+
+    await asyncio.wait_for(asyncio.gather(running, queued), TIMEOUT)
+
+    # The slots are freed on the event loop, once the jobs have stopped running
+    assert await asyncio.wait_for(await executor.submit_when_available(lambda: 42), TIMEOUT) == 42
+
+    executor.shutdown()
+
+
+async def test__waiting_caller_gets_a_freed_slot() -> None:
+    """
+    Test that a caller waiting for a slot submits its job once a slot is freed.
+
+    Asserts:
+        - The caller keeps waiting while the workers and the queue are at capacity.
+        - The job of the caller runs once a running job has finished.
+    """
+    executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+    release = Event()
+
+    running = executor.submit(release.wait, TIMEOUT)
+    queued = executor.submit(release.wait, TIMEOUT)
+    waiting = asyncio.create_task(executor.submit_when_available(lambda: 42))
+
+    await asyncio.sleep(0.1)
+
+    assert not waiting.done()
+
+    release.set()
+
+    await asyncio.wait_for(asyncio.gather(running, queued), TIMEOUT)
+
+    assert await asyncio.wait_for(await waiting, TIMEOUT) == 42
+
+    executor.shutdown()
@@ -0,0 +1,145 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from calm_calatheas.cancellation import CancellationToken
+from calm_calatheas.description import PokemonDescription, PokemonType
+from calm_calatheas.executor import QueueFullError
+from calm_calatheas.jobs import JobScheduler
+from calm_calatheas.loader import loader
+from calm_calatheas.progress import GenerationProgress
+from calm_calatheas.settings import GenerationProfile
+
+DESCRIPTION = PokemonDescription(
+    ability="Static",
+    category="Mouse",
+    flavor_text="It stores electricity in its cheeks.",
+    habitat="Forest",
+    height=0.4,
+    name="Sparkit",
+    types={PokemonType.ELECTRIC},
+    weight=6.0,
+)
+
+PROFILE = GenerationProfile()
+TIMEOUT = 10
+TTL = 60
+
+
+@pytest.fixture
+def scheduler() -> JobScheduler:
+    """Return a scheduler that does not run any jobs, with room for a single job in the queue."""
+    return JobScheduler(max_running=1, max_queue_size=1, ttl=TTL)
+
+
+async def test__full_queue_rejects_jobs(scheduler: JobScheduler) -> None:
+    """
+    Test that a job submitted while the queue is full is rejected.
+
+    Asserts:
+        - The job is rejected with a `QueueFullError`.
+    """
+    scheduler.submit("a cat on a couch", PROFILE)
+
+    with pytest.raises(QueueFullError):
+        scheduler.submit("a dog in a park", PROFILE)
+
+
+async def test__cancelled_job_frees_its_place_in_the_queue(scheduler: JobScheduler) -> None:
+    """
+    Test that a job that is cancelled while it waits no longer takes up a place in the queue.
+
+    Asserts:
+        - The cancelled job is reported as cancelled.
+        - Another job can be submitted in its place.
+    """
+    job, client = scheduler.submit("a cat on a couch", PROFILE)
+
+    state = await scheduler.cancel(job.id, client)
+
+    assert state is not None
+    assert state["status"] == "cancelled"
+
+    other, _ = scheduler.submit("a dog in a park", PROFILE)
+
+    assert other.status == "queued"
+
+
+async def test__identical_jobs_are_shared(scheduler: JobScheduler) -> None:
+    """
+    Test that a job submitted while an identical job is queued shares that job.
+
+    Asserts:
+        - Both submissions get the same job, with a token of their own.
+        - A job for the same prompt with another generation profile is not shared.
+    """
+    job, client = scheduler.submit("A cat on a couch.", PROFILE)
+    shared, shared_client = scheduler.submit("the cat on the couch", PROFILE)
+
+    assert shared is job
+    assert shared_client != client
+
+    with pytest.raises(QueueFullError):
+        scheduler.submit("a cat on a couch", GenerationProfile(thinking=False))
+
+
+async def test__shared_job_is_cancelled_by_its_last_client(scheduler: JobScheduler) -> None:
+    """
+    Test that a shared job is only cancelled once every client that submitted it has cancelled it.
+
+    Asserts:
+        - A token that does not belong to the job is ignored.
+        - The job keeps waiting while one of its clients has not cancelled it.
+        - The job is cancelled once the last client cancels it.
+    """
+    job, client = scheduler.submit("a cat on a couch", PROFILE)
+    _, other_client = scheduler.submit("a cat on a couch", PROFILE)
+
+    await scheduler.cancel(job.id, "unknown")
+    await scheduler.cancel(job.id, client)
+
+    assert job.status == "queued"
+
+    await scheduler.cancel(job.id, other_client)
+
+    assert job.status == "cancelled"
+
+
+async def test__job_generates_a_description(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a job runs once it is submitted, and reports the generated description when it has finished.
+
+    Asserts:
+        - The job succeeds, with the generated description.
+    """
+
+    def generate_description(
+        user_prompt: str,  # noqa: ARG001
+        profile: GenerationProfile,  # noqa: ARG001
+        cancellation: CancellationToken,  # noqa: ARG001
+        progress: GenerationProgress,  # noqa: ARG001
+    ) -> PokemonDescription:
+        return DESCRIPTION
+
+    model = SimpleNamespace(
+        find_cached_description=lambda *_: None,
+        generate_description=generate_description,
+        progress_text=lambda _: "",
+    )
+    monkeypatch.setattr(loader, "_model", model)
+
+    scheduler = JobScheduler(max_running=1, max_queue_size=1, ttl=TTL)
+    scheduler.start()
+
+    job, _ = scheduler.submit("a cat on a couch", PROFILE)
+
+    async with asyncio.timeout(TIMEOUT):
+        while (state := await scheduler.state(job.id)) and state["status"] in {"queued", "running"}:  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+
+    scheduler.shutdown()
+
+    assert state is not None
+    assert state["status"] == "succeeded"
+    assert state["description"] == DESCRIPTION.model_dump(mode="json")
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+
+def test__importing_the_app_does_not_import_torch() -> None:
+    """
+    Test that the application can be imported without importing torch, which is only needed once the model is loaded.
+
+    Asserts:
+        - Neither torch nor transformers are imported along with the application.
+    """
+    script = "import sys, calm_calatheas.app; print(sorted({'torch', 'transformers'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, check=True, text=True)  # noqa: S603
+
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,80 @@
+import gzip
+import json
+from typing import TYPE_CHECKING
+
+from calm_calatheas.pool import DescriptionPool
+from calm_calatheas.settings import GenerationProfile
+from calm_calatheas.similarity import canonicalize
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+DESCRIPTION = json.dumps({"name": "Pikachu"})
+NAMESPACE = "model@1"
+PROFILE = GenerationProfile()
+
+
+def test__saved_pool_is_loaded(tmp_path: "Path") -> None:
+    """
+    Test that a saved pool is loaded with its descriptions and its generation profile.
+
+    Asserts:
+        - The description is returned for any caption with the same canonical form.
+        - The generation profile of the pool is kept.
+    """
+    path = str(tmp_path / "pool.json.gz")
+
+    DescriptionPool({canonicalize("a cat"): DESCRIPTION}, PROFILE).save(path, NAMESPACE)
+    pool = DescriptionPool.load(path, NAMESPACE)
+
+    assert pool.get("A cat.", PROFILE) == DESCRIPTION
+    assert pool.profile == PROFILE
+
+
+def test__pool_of_another_namespace_is_skipped(tmp_path: "Path") -> None:
+    """
+    Test that a pool generated for another namespace is not loaded.
+
+    Asserts:
+        - The loaded pool is empty.
+    """
+    path = str(tmp_path / "pool.json.gz")
+
+    DescriptionPool({canonicalize("a cat"): DESCRIPTION}, PROFILE).save(path, "model@0")
+
+    assert len(DescriptionPool.load(path, NAMESPACE)) == 0
+
+
+def test__pool_only_serves_its_own_profile() -> None:
+    """
+    Test that a pool only serves requests for the generation profile that it was generated with.
+
+    Asserts:
+        - No description is returned for another profile.
+    """
+    pool = DescriptionPool({canonicalize("a cat"): DESCRIPTION}, PROFILE)
+
+    assert pool.get("a cat", GenerationProfile(thinking=False)) is None
+
+
+def test__unreadable_pool_is_empty(tmp_path: "Path") -> None:
+    """
+    Test that a pool that is missing or cannot be parsed is loaded as an empty pool.
+
+    Asserts:
+        - The pool is empty if the file does not exist.
+        - The pool is empty if the file does not hold a pool.
+        - The pool is empty if the file holds a pool without a generation profile.
+    """
+    missing = tmp_path / "missing.json.gz"
+    corrupt = tmp_path / "corrupt.json.gz"
+    legacy = tmp_path / "legacy.json.gz"
+
+    corrupt.write_bytes(b"not a pool")
+    legacy.write_bytes(
+        gzip.compress(json.dumps({"descriptions": {"a cat": {"name": "Pikachu"}}, "namespace": NAMESPACE}).encode()),
+    )
+
+    assert len(DescriptionPool.load(str(missing), NAMESPACE)) == 0
+    assert len(DescriptionPool.load(str(corrupt), NAMESPACE)) == 0
+    assert len(DescriptionPool.load(str(legacy), NAMESPACE)) == 0
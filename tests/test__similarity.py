@@ -0,0 +1,79 @@
+import pytest
+
+from calm_calatheas.settings import settings
+from calm_calatheas.similarity import SimilarityIndex, canonicalize
+
+
+@pytest.fixture
+def index() -> SimilarityIndex:
+    """Return an empty similarity index with the default threshold."""
+    return SimilarityIndex(settings.similarity_threshold)
+
+
+def test__canonical_form_ignores_casing_punctuation_and_articles() -> None:
+    """
+    Test that captions that only differ in casing, punctuation or articles share a canonical form.
+
+    Asserts:
+        - Both captions have the same canonical form.
+        - A caption with the same words in another order has a different canonical form.
+    """
+    assert canonicalize("A cat sitting on a couch.") == canonicalize("the cat is sitting on the couch")
+    assert canonicalize("a dog chasing a cat") != canonicalize("a cat chasing a dog")
+
+
+def test__caption_with_an_added_word_matches(index: SimilarityIndex) -> None:
+    """
+    Test that a caption matches an indexed caption that only adds a word to it, at the default threshold.
+
+    Asserts:
+        - "a cat on a couch" matches "a cat sitting on a couch", and the other way around.
+    """
+    index.add(canonicalize("a cat sitting on a couch"))
+
+    assert index.find(canonicalize("a cat on a couch")) == canonicalize("a cat sitting on a couch")
+
+    index = SimilarityIndex(settings.similarity_threshold)
+    index.add(canonicalize("a cat on a couch"))
+
+    assert index.find(canonicalize("a cat sitting on a couch")) == canonicalize("a cat on a couch")
+
+
+def test__caption_with_swapped_words_does_not_match(index: SimilarityIndex) -> None:
+    """
+    Test that a caption does not match an indexed caption with the same words in another order.
+
+    Asserts:
+        - "a dog chasing a cat" does not match "a cat chasing a dog".
+    """
+    index.add(canonicalize("a cat chasing a dog"))
+
+    assert index.find(canonicalize("a dog chasing a cat")) is None
+
+
+def test__caption_with_a_replaced_word_does_not_match(index: SimilarityIndex) -> None:
+    """
+    Test that a caption does not match an indexed caption in which a word was replaced by another.
+
+    Asserts:
+        - "a brown dog on a bed" does not match "a brown cat on a bed".
+    """
+    index.add(canonicalize("a brown cat on a bed"))
+
+    assert index.find(canonicalize("a brown dog on a bed")) is None
+
+
+def test__discarded_caption_no_longer_matches(index: SimilarityIndex) -> None:
+    """
+    Test that a caption that was removed from the index is no longer found.
+
+    Asserts:
+        - The caption is found before it is removed, and not after.
+    """
+    index.add(canonicalize("a cat sitting on a couch"))
+
+    assert index.find(canonicalize("a cat sitting on a couch")) is not None
+
+    index.discard(canonicalize("a cat sitting on a couch"))
+
+    assert index.find(canonicalize("a cat sitting on a couch")) is None
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+
+from calm_calatheas.cancellation import CancellationToken, GenerationCancelledError
+from calm_calatheas.singleflight import SingleFlight
+
+TIMEOUT = 10
+
+
+def test__concurrent_calls_share_a_single_call() -> None:
+    """
+    Test that a call with the same key as a call in flight waits for that call instead of running the function.
+
+    Asserts:
+        - The function only runs once.
+        - Both callers get the result of that call.
+    """
+    flights = SingleFlight[str, int]()
+    started, release = Event(), Event()
+    calls = []
+
+    def fn(_: CancellationToken) -> int:
+        calls.append(1)
+        started.set()
+        release.wait(TIMEOUT)
+        return 42
+
+    with ThreadPoolExecutor() as executor:
+        leader = executor.submit(flights.run, "key", fn)
+        started.wait(TIMEOUT)
+        follower = executor.submit(flights.run, "key", fn)
+        release.set()
+
+        assert leader.result(TIMEOUT) == 42
+        assert follower.result(TIMEOUT) == 42
+
+    assert len(calls) == 1
+
+
+def test__cancelled_follower_stops_waiting() -> None:
+    """
+    Test that a caller waiting for a call in flight stops waiting once its own token is cancelled.
+
+    Asserts:
+        - The caller that cancelled its token gets a `GenerationCancelledError` while the call is still running.
+        - The call is not cancelled, since the caller that started it is still waiting for it.
+        - The caller that started the call still gets the result.
+    """
+    flights = SingleFlight[str, int]()
+    started, release = Event(), Event()
+    tokens = []
+
+    def fn(cancellation: CancellationToken) -> int:
+        tokens.append(cancellation)
+        started.set()
+        release.wait(TIMEOUT)
+        return 42
+
+    cancellation = CancellationToken()
+
+    with ThreadPoolExecutor() as executor:
+        leader = executor.submit(flights.run, "key", fn, CancellationToken())
+        started.wait(TIMEOUT)
+        follower = executor.submit(flights.run, "key", fn, cancellation)
+
+        cancellation.cancel()
+
+        with pytest.raises(GenerationCancelledError):
+            follower.result(TIMEOUT)
+
+        assert not tokens[0].cancelled
+
+        release.set()
+
+        assert leader.result(TIMEOUT) == 42
+
+
+def test__call_is_cancelled_once_every_caller_gives_up() -> None:
+    """
+    Test that a call is cancelled once every caller waiting for it has cancelled their token.
+
+    Asserts:
+        - The token given to the function is cancelled.
+        - A new caller with the same key runs the function again, instead of waiting for the cancelled call.
+    """
+    flights = SingleFlight[str, int]()
+    started, release = Event(), Event()
+    tokens = []
+
+    def cancellable(cancellation: CancellationToken) -> int:
+        tokens.append(cancellation)
+        started.set()
+        release.wait(TIMEOUT)
+        cancellation.raise_if_cancelled()
+        return 42
+
+    cancellation = CancellationToken()
+
+    with ThreadPoolExecutor() as executor:
+        leader = executor.submit(flights.run, "key", cancellable, cancellation)
+        started.wait(TIMEOUT)
+
+        cancellation.cancel()
+
+        assert tokens[0].cancelled
+
+        # The cancelled call is still running, but nobody waits for it anymore
+        assert flights.run("key", lambda _: 7) == 7
+
+        release.set()
+
+        with pytest.raises(GenerationCancelledError):
+            leader.result(TIMEOUT)
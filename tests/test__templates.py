@@ -0,0 +1,90 @@
+from typing import Any, cast
+
+import pytest
+from transformers import PreTrainedTokenizerFast
+
+from calm_calatheas.templates import ChatTemplateCache
+
+SYSTEM_PROMPT = "You are a helpful Pokemon professor."
+
+
+def conversation(user_prompt: str) -> list[dict[str, str]]:
+    """Return a conversation with the system prompt and the given user's message."""
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_prompt}]
+
+
+def tokenize_in_full(
+    tokenizer: PreTrainedTokenizerFast,
+    messages: list[dict[str, str]],
+    *,
+    thinking: bool,
+) -> list[int]:
+    """Render and tokenize the given conversation in full, without the cache."""
+    prompt = tokenizer.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True,
+        enable_thinking=thinking,
+    )
+
+    return tokenizer(cast("str", prompt)).input_ids
+
+
+@pytest.mark.parametrize("thinking", [True, False])
+def test__prompts_match_the_full_tokenization(tokenizer: PreTrainedTokenizerFast, *, thinking: bool) -> None:
+    """
+    Test that prompts put together from the cached template are the same as prompts that are tokenized in full.
+
+    Asserts:
+        - Each prompt in a batch matches its full tokenization, with and without thinking.
+        - A message that starts or ends with whitespace matches its full tokenization as well.
+    """
+    cache = ChatTemplateCache(tokenizer)
+    user_prompts = ["a cat on a couch", "a dog chasing a ball in a park", " a bird on a branch\n"]
+    conversations = [conversation(user_prompt) for user_prompt in user_prompts]
+
+    rows = cache.encode(conversations, [thinking] * len(conversations))
+
+    assert rows == [tokenize_in_full(tokenizer, messages, thinking=thinking) for messages in conversations]
+
+
+def test__template_is_only_rendered_once(tokenizer: PreTrainedTokenizerFast, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that the template around the user's message is rendered once, and reused for every later prompt.
+
+    Asserts:
+        - Encoding a second prompt with the same system prompt does not render the template again.
+    """
+    cache = ChatTemplateCache(tokenizer)
+    apply_chat_template = tokenizer.apply_chat_template
+    renders = 0
+
+    def count_renders(*args: Any, **kwargs: Any) -> Any:  # noqa: ANN401
+        nonlocal renders
+        renders += 1
+        return apply_chat_template(*args, **kwargs)
+
+    monkeypatch.setattr(tokenizer, "apply_chat_template", count_renders)
+
+    cache.encode([conversation("a cat on a couch")], [True])
+    rendered = renders
+
+    cache.encode([conversation("a dog in a park")], [True])
+
+    assert renders == rendered
+
+
+def test__head_is_the_start_of_every_prompt(tokenizer: PreTrainedTokenizerFast) -> None:
+    """
+    Test that the head of a template is the start of every prompt with the same system prompt.
+
+    Asserts:
+        - Each prompt starts with the head, with and without thinking.
+    """
+    cache = ChatTemplateCache(tokenizer)
+    head = cache.head([{"role": "system", "content": SYSTEM_PROMPT}])
+
+    for thinking in (True, False):
+        (row,) = cache.encode([conversation("a cat on a couch")], [thinking])
+
+        assert row[: len(head)] == head
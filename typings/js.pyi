@@ -20,6 +20,7 @@ class JsDomElement(OldJSDomElement):
     def getAttribute(self, name: str) -> str: ...
     def setAttribute(self, name: str, value: str) -> None: ...
     def closest(self, selectors: str) -> JsDomElement: ...
+    def querySelector(self, selectors: str) -> JsDomElement: ...
     def hasAttribute(self, attrName: str) -> bool: ...
     def removeAttribute(self, attrName: str) -> None: ...
     def getBoundingClientRect(self) -> DOMRect: ...
@@ -65,7 +66,7 @@ class JsCanvasElement(JsDomElement):
     @overload
     def getContext(self, contextId: str) -> JsProxy: ...
     def getContext(self, contextId: str) -> JsProxy: ...
-    def toBlob(self, callback: Callable[[Blob], None], mimeType: str) -> None: ...
+    def toBlob(self, callback: Callable[[Blob | None], None], mimeType: str, quality: float = ...) -> None: ...
 
 class JsAnchorElement(JsDomElement):
     href: str
@@ -81,14 +82,32 @@ class DOMRect(JsProxy):
     width: float
     height: float
 
+class IntersectionObserverEntry(JsProxy):
+    isIntersecting: bool
+    target: JsDomElement
+
+class ImageBitmap(JsProxy):
+    width: int
+    height: int
+    def close(self) -> None: ...
+
 class CanvasRenderingContext2D(JsProxy):
     canvas: JsCanvasElement
+    imageSmoothingEnabled: bool
+    imageSmoothingQuality: Literal["low", "medium", "high"]
     @overload
-    def drawImage(self, image: JsImgElement | JsVideoElement, dx: int, dy: int) -> None: ...
+    def drawImage(self, image: JsImgElement | JsVideoElement | ImageBitmap, dx: int, dy: int) -> None: ...
     @overload
-    def drawImage(self, image: JsImgElement | JsVideoElement, dx: int, dy: int, dWidth: int, dHeight: int) -> None: ...
     def drawImage(
-        self, image: JsImgElement | JsVideoElement, dx: int, dy: int, dWidth: int = ..., dHeight: int = ...
+        self, image: JsImgElement | JsVideoElement | ImageBitmap, dx: int, dy: int, dWidth: int, dHeight: int
+    ) -> None: ...
+    def drawImage(
+        self,
+        image: JsImgElement | JsVideoElement | ImageBitmap,
+        dx: int,
+        dy: int,
+        dWidth: int = ...,
+        dHeight: int = ...,
     ) -> None: ...
     def translate(self, x: int | float, y: int | float) -> None: ...
     def rotate(self, angle: int | float) -> None: ...
@@ -143,6 +162,7 @@ class FileReader(JsProxy):
     def new(cls) -> Self: ...
     def readAsDataURL(self, file: File) -> None: ...
 
+def createImageBitmap(image: Blob | JsCanvasElement | JsImgElement | JsVideoElement) -> PyodideFuture[ImageBitmap]: ...
 def eval(code: str) -> Any: ...
 
 # in browser the cancellation token is an int, in node it's a special opaque
@@ -158,6 +178,7 @@ def fetch(
     options: JsProxy | None = None,
 ) -> PyodideFuture[JsFetchResponse]: ...
 
+IDBKeyRange: Any = ...
 indexedDB: Any = ...
 type IDBDatabase = Any
 localStorage: LocalStorage = ...
@@ -231,6 +252,11 @@ class Uint8Array(_TypedArray):
 class Float64Array(_TypedArray):
     BYTES_PER_ELEMENT = 8
 
+class TextDecoder(_JsObject):
+    @staticmethod
+    def new(label: str = "utf-8") -> TextDecoder: ...
+    def decode(self, input: JsProxy | None = None, options: JsProxy | None = None) -> str: ...
+
 class JSON(_JsObject):
     @staticmethod
     def stringify(a: JsProxy) -> str: ...
@@ -309,9 +335,14 @@ class URL(_JsObject):
     @staticmethod
     def revokeObjectURL(url: str) -> None: ...
 
-class DOMException(JsException): ...
+class Blob(_JsObject):
+    size: int
+    type: str
 
-type Blob = Any
+    @staticmethod
+    def new(blobParts: JsProxy | Iterable[Any], options: dict[str, str] | JsProxy | None = None) -> Blob: ...
+
+class DOMException(JsException): ...
 
 # Transformers.js
 